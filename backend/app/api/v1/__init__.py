@@ -1,5 +1,5 @@
 from fastapi import APIRouter
-from app.api.v1 import health, users, trips, files
+from app.api.v1 import health, users, trips, files, jobs
 from app.api.v1 import auth 
 # from app.api.v1.trips import router as trips_router
 
@@ -10,4 +10,6 @@ router.include_router(health.router)
 router.include_router(users.router)
 router.include_router(trips.router)
 router.include_router(files.router)
+router.include_router(files.async_router)
+router.include_router(jobs.router)
 router.include_router(auth.router)
@@ -7,7 +7,7 @@ import requests
 from app.core.config import settings
 from app.core.database import get_db
 from app.models.user_cloud_account import UserCloudAccount
-from app.services.google_drive_service import get_drive_client,ensure_app_folder
+from app.services.google_drive_service import get_drive_client,resolve_app_folder_id
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
@@ -84,9 +84,10 @@ def google_callback(
     db.commit()
     db.refresh(account)
 
-    #  create app folder in user's drive
+    #  create app folder in user's drive and remember its ID
     drive = get_drive_client(account)
-    folder_id = ensure_app_folder(drive)
+    folder_id = resolve_app_folder_id(account, drive)
+    db.commit()
 
     return {
         "message": "Google Drive connected successfully",
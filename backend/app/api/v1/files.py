@@ -1,19 +1,44 @@
-from fastapi import APIRouter, Depends, Query, HTTPException
-from sqlalchemy.orm import Session
-from fastapi import UploadFile, File
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Header
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import os
+import re
+from typing import List
 
-from app.core.database import get_db
-from app.schemas.file_upload import FileUploadRequest
+from app.core.config import settings
+
+from app.core.database import get_db, get_async_db
+from app.models.virtual_file import VirtualFile
+from app.schemas.file_upload import FileUploadRequest, UploadNegotiationRequest, BulkDeleteRequest
 from app.services.storage_service import (
     create_virtual_file_with_chunks,
     delete_virtual_file,
+    delete_virtual_files,
     InsufficientStorageError,
     FileNotFoundError,
+    FileNotReadyError,
 )
 
-from fastapi.responses import StreamingResponse
-from app.services.storage_service import iter_virtual_file_bytes,upload_chunks_to_google_drive, upload_real_file_to_google_drive, stream_virtual_file_from_drive
+from fastapi.responses import Response, StreamingResponse
+from app.services.storage_service import upload_chunks_to_google_drive, upload_real_file_to_google_drive, stream_virtual_file_from_drive, stream_file_to_google_drive
+from app.services.storage_service import create_virtual_files_batch, upload_files_batch_to_google_drive
+from app.services.ingest_service import IngestedUpload, UploadIngestError, ingest_multipart_files, StreamingBodyReader
+from app.services.block_store import MissingBlockError
+from app.services.transfer_queue import enqueue_transfer, open_staging_file, remove_staged_file
+from app.services import async_storage_service
+from app.services.chunking import chunking_parameters
+from app.services.upload_session_service import (
+    negotiate_upload,
+    get_open_upload_session,
+    complete_upload_session,
+    session_body_size,
+    store_session_body,
+    InvalidNegotiationError,
+    UploadSessionNotFoundError,
+    UploadSessionClosedError,
+)
 
 
 
@@ -31,6 +56,12 @@ def upload_file(
     user_id: str = Query(..., description="Uploader User ID"),
     db: Session = Depends(get_db),
 ):
+    """
+    Plans a file from its metadata only; /files/{virtual_file_id}/upload_to_drive
+    stores it later. With QUOTA_EXPIRE_METADATA_ONLY on, a file still not
+    stored after QUOTA_RESERVATION_TTL_SECONDS is deleted.
+    """
+
     try:
         virtual_file = create_virtual_file_with_chunks(
             db=db,
@@ -39,11 +70,13 @@ def upload_file(
             path=payload.path,
             file_size=payload.size_bytes,
             checksum=payload.checksum,
+            reserve=settings.QUOTA_EXPIRE_METADATA_ONLY,
         )
         return {
             "id": virtual_file.id,
             "path": virtual_file.path,
             "size_bytes": virtual_file.size_bytes,
+            "deduplicated": virtual_file.content.status == "READY",
         }
 
     except InsufficientStorageError as e:
@@ -51,52 +84,115 @@ def upload_file(
 
 
 # =========================
-# Delete API
+# Upload Negotiation API
 # =========================
 
-@router.delete("/{virtual_file_id}")
-def delete_file(
-    virtual_file_id: str,
+@router.post("/negotiate")
+def negotiate_file_upload(
+    payload: UploadNegotiationRequest,
+    trip_id: str = Query(..., description="Trip ID"),
+    user_id: str = Query(..., description="Uploader User ID"),
     db: Session = Depends(get_db),
 ):
-    virtual_file_id = virtual_file_id.strip()  # sanitize input
+    """
+    Called before sending any bytes. Content the trip already holds is
+    linked right away; otherwise an upload session is opened that lists
+    the blocks still to be sent to PUT /files/sessions/{session_id}.
+
+    Blocks may be fixed-size (block_size) or any split the client likes
+    (block_sizes); splitting with the returned chunking parameters gives
+    the best hit rate against blocks the server split itself.
+    """
 
     try:
-        delete_virtual_file(
+        virtual_file, session = negotiate_upload(
             db=db,
-            virtual_file_id=virtual_file_id,
+            trip_id=trip_id,
+            user_id=user_id,
+            path=payload.path,
+            size_bytes=payload.size_bytes,
+            checksum=payload.checksum,
+            block_size=payload.block_size,
+            block_hashes=payload.block_hashes,
+            block_sizes=payload.block_sizes,
         )
-        return {"message": "File deleted successfully"}
+    except InvalidNegotiationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except InsufficientStorageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except MissingBlockError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    chunking = chunking_parameters(
+        settings.DEDUP_BLOCK_MIN_BYTES,
+        settings.DEDUP_BLOCK_AVG_BYTES,
+        settings.DEDUP_BLOCK_MAX_BYTES,
+    )
+
+    if session is None:
+        return {
+            "status": "stored",
+            "virtual_file_id": virtual_file.id,
+            "session_id": None,
+            "present_blocks": list(range(len(payload.block_hashes))),
+            "missing_blocks": [],
+            "chunking": chunking,
+        }
+
+    missing = set(session.missing_blocks)
+    return {
+        "status": "upload_required",
+        "virtual_file_id": virtual_file.id,
+        "session_id": session.id,
+        "upload_url": f"/files/sessions/{session.id}",
+        "upload_size_bytes": session_body_size(session),
+        "expires_at": session.expires_at,
+        "present_blocks": [i for i in range(len(session.block_hashes)) if i not in missing],
+        "missing_blocks": session.missing_blocks,
+        "chunking": chunking,
+    }
 
-    except FileNotFoundError as e:
-        raise HTTPException(status_code=404, detail=str(e))
 
 # =========================
-# Download API
+# Delete API
 # =========================
 
-@router.get("/{virtual_file_id}/download")
-def download_file(
+@router.delete("/{virtual_file_id}")
+def delete_file(
     virtual_file_id: str,
     db: Session = Depends(get_db),
 ):
-    virtual_file_id = virtual_file_id.strip()
+    virtual_file_id = virtual_file_id.strip()  # sanitize input
 
     try:
-        byte_iterator = iter_virtual_file_bytes(
+        delete_virtual_file(
             db=db,
             virtual_file_id=virtual_file_id,
         )
-
-        return StreamingResponse(
-            byte_iterator,
-            media_type="application/octet-stream",
-        )
+        return {"message": "File deleted successfully"}
 
     except FileNotFoundError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
+@router.delete("")
+def delete_files(
+    request: BulkDeleteRequest,
+    trip_id: str = Query(...),
+    db: Session = Depends(get_db),
+):
+    ids = [virtual_file_id.strip() for virtual_file_id in request.ids if virtual_file_id.strip()]
+    if not ids and not request.path_prefix:
+        raise HTTPException(status_code=400, detail="Either ids or path_prefix is required")
+
+    deleted = delete_virtual_files(
+        db=db,
+        trip_id=trip_id,
+        virtual_file_ids=ids or None,
+        path_prefix=request.path_prefix,
+    )
+
+    return {"trip_id": trip_id, "deleted": deleted}
 
 # =========================
 # Google Drive Upload API
@@ -104,10 +200,22 @@ def download_file(
 @router.post("/{virtual_file_id}/upload_to_drive")
 def upload_file_to_drive(
     virtual_file_id:str,
+    response: Response,
+    priority: int = Query(0, description="Background job priority, higher runs first"),
     db:Session =Depends(get_db),
 
 ):
-    Virtual_file_id = virtual_file_id.strip()
+    virtual_file_id = virtual_file_id.strip()
+
+    if settings.TRANSFER_JOBS_ENABLED:
+        virtual_file = db.get(VirtualFile, virtual_file_id)
+        if not virtual_file:
+            raise HTTPException(status_code=404, detail="Virtual file not found")
+
+        # Runs in the transfer worker pool; poll /jobs/{job_id}
+        job = enqueue_transfer(db, virtual_file=virtual_file, priority=priority)
+        response.status_code = 202
+        return {"message": "Upload to Google Drive queued", "job_id": job.id}
 
     upload_chunks_to_google_drive(
         db=db,
@@ -119,32 +227,82 @@ def upload_file_to_drive(
 
 # Upload real file
 
+async def _receive_uploads(request: Request, open_file=None):
+    try:
+        uploads = await ingest_multipart_files(
+            request.stream(),
+            request.headers.get("content-type", ""),
+            open_file,
+        )
+    except UploadIngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+    return uploads
+
+
+async def get_uploaded_file(request: Request):
+    """
+    Receives the multipart file in a single pass: size and SHA-256
+    are computed while it is spooled, so it is read only once more
+    (for the Drive upload).
+    """
+
+    uploads = await _receive_uploads(request)
+    try:
+        yield uploads[0]
+    finally:
+        for upload in uploads:
+            upload.close()
+
+
+async def get_staged_upload(request: Request):
+    """
+    Like get_uploaded_file, but with transfer jobs enabled the file is
+    written straight to the staging directory while it is received, so
+    a transfer job can take it over without another copy. Staged files
+    no job took over are removed after the request.
+    """
+
+    if not settings.TRANSFER_JOBS_ENABLED:
+        async for upload in get_uploaded_file(request):
+            yield upload
+        return
+
+    staged_paths = []
+
+    def _open_staged():
+        staged_file = open_staging_file()
+        staged_paths.append(staged_file.name)
+        return staged_file
+
+    try:
+        uploads = await _receive_uploads(request, _open_staged)
+        try:
+            yield uploads[0]
+        finally:
+            for upload in uploads:
+                upload.close()
+    finally:
+        for staged_path in staged_paths:
+            remove_staged_file(staged_path)
+
+
 @router.post("/upload")
 def upload_file_real(
     trip_id: str = Query(...,description="Trip ID"),
     user_id: str =Query(...,description="Uploader User ID"),
-    file: UploadFile = File(...),
+    file: IngestedUpload = Depends(get_uploaded_file),
     db: Session = Depends(get_db),
 ):
     
     """
     Accepts a real file via multipart/form-data.
     Streaming-safe: does not load entire file into memory.
-    """
-
-    # Determine File size(streaming)
 
-    file_size =0
-    chunk_size = 1024 * 1024  # 1 MB
-    
-    while True:
-        chunk = file.file.read(chunk_size)
-        if not chunk:
-            break
-        file_size += len(chunk)
-
-    # Reset file pointter so we can read again
-    file.file.seek(0)
+    Only the metadata is kept, with the same expiry rule as POST /files.
+    """
 
     # Use existing alloocation logic (metadata only)
     virtual_file = create_virtual_file_with_chunks(
@@ -152,15 +310,17 @@ def upload_file_real(
         trip_id=trip_id,
         uploader_user_id= user_id,
         path = file.filename,
-        file_size =file_size,
-        checksum = None,
+        file_size =file.size_bytes,
+        checksum = file.checksum,
+        reserve=settings.QUOTA_EXPIRE_METADATA_ONLY,
     )
 
     return{
         "message": "File accepted successfully",
         "virtual_file_id": virtual_file.id,
         "filename": file.filename,
-        "size_bytes": file_size,
+        "size_bytes": file.size_bytes,
+        "checksum": file.checksum,
     }
 
 
@@ -169,66 +329,559 @@ def upload_file_real(
 # =======================
 @router.post("/upload-and-store")
 def upload_and_strore_file(
+    response: Response,
     trip_id: str = Query(...),
     user_id: str =Query(...),
-    file: UploadFile = File(...),
+    priority: int = Query(0, description="Background job priority, higher runs first"),
+    file: IngestedUpload = Depends(get_staged_upload),
     db:Session= Depends(get_db)
 ):
-    # Calculate file size
-    file_size =0
-    chunk_size = 1024 * 1024  # 1 MB
-
-    while True:
-        chunk =file.file.read(chunk_size)
-        if not chunk:
-            break
-        file_size += len(chunk)
-
-    file.file.seek(0)
-
     # creaate metadata + chunk plan
     virtual_file = create_virtual_file_with_chunks(
         db =db,
         trip_id =trip_id,
         uploader_user_id=user_id,
         path=file.filename,
-        file_size=file_size,
-        checksum=None,
+        file_size=file.size_bytes,
+        checksum=file.checksum,
     )
 
+    # Same bytes already stored in this trip: nothing to upload
+    deduplicated = virtual_file.content.status == "READY"
+
+    if not deduplicated and settings.TRANSFER_JOBS_ENABLED:
+        # The body was staged while it arrived: the job takes the file over
+        job = enqueue_transfer(
+            db,
+            virtual_file=virtual_file,
+            staged_file=file.file,
+            checksum=file.checksum,
+            priority=priority,
+        )
+        response.status_code = 202
+        return {
+            "message": "File accepted; upload to Google Drive queued",
+            "virtual_file_id": virtual_file.id,
+            "job_id": job.id,
+            "size_bytes": file.size_bytes,
+            "checksum": file.checksum,
+            "deduplicated": False,
+        }
+
     # uplodad to google drive
-    upload_real_file_to_google_drive(
-        db=db,
-        Virtual_file_id= virtual_file.id,
-        file_stream=file.file,
-    )
+    if not deduplicated:
+        upload_real_file_to_google_drive(
+            db=db,
+            Virtual_file_id= virtual_file.id,
+            file_stream=file.file,
+            checksum=file.checksum,
+        )
 
     return{
         "message": "File  uploaded and stored to Google Drive successfully",
         "virtual_file_id": virtual_file.id,
+        "size_bytes": file.size_bytes,
+        "checksum": file.checksum,
+        "deduplicated": deduplicated,
+    }
+
+# =========================
+# Batch Upload API
+# =========================
+
+async def get_uploaded_files(request: Request):
+    """
+    Like get_uploaded_file, for every file part of the body.
+    """
+
+    try:
+        uploads = await ingest_multipart_files(
+            request.stream(),
+            request.headers.get("content-type", ""),
+        )
+    except UploadIngestError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if not uploads:
+        raise HTTPException(status_code=400, detail="No file uploaded")
+
+    try:
+        yield uploads
+    finally:
+        for upload in uploads:
+            upload.close()
+
+
+@router.post("/batch")
+def upload_files_batch(
+    trip_id: str = Query(..., description="Trip ID"),
+    user_id: str = Query(..., description="Uploader User ID"),
+    path_prefix: str = Query("", description="Prepended to every filename"),
+    files: List[IngestedUpload] = Depends(get_uploaded_files),
+    db: Session = Depends(get_db),
+):
+    """
+    Uploads many files (e.g. an album) in one request: placement for
+    all of them is planned in one transaction, and their chunks go
+    through one shared upload pool. Reports a status per file.
+    """
+
+    planned = create_virtual_files_batch(
+        db=db,
+        trip_id=trip_id,
+        uploader_user_id=user_id,
+        files=[(path_prefix + f.filename, f.size_bytes, f.checksum) for f in files],
+    )
+
+    # Files placed by this batch, not linked to content stored earlier
+    to_upload = [
+        (virtual_file, upload.file, upload.checksum)
+        for upload, virtual_file in zip(files, planned)
+        if isinstance(virtual_file, VirtualFile) and virtual_file.content.status != "READY"
+    ]
+    upload_errors = upload_files_batch_to_google_drive(db=db, uploads=to_upload)
+
+    results = []
+    seen_contents = set()
+    for upload, virtual_file in zip(files, planned):
+        entry = {
+            "filename": upload.filename,
+            "size_bytes": upload.size_bytes,
+            "checksum": upload.checksum,
+        }
+
+        if not isinstance(virtual_file, VirtualFile):
+            entry.update(status="failed", error=str(virtual_file))
+        elif virtual_file.id not in upload_errors:
+            entry.update(status="deduplicated", virtual_file_id=virtual_file.id)
+        elif upload_errors[virtual_file.id] is not None:
+            entry.update(status="failed", error=str(upload_errors[virtual_file.id]))
+        elif virtual_file.content_id in seen_contents:
+            # Same bytes as an earlier file of this batch
+            entry.update(status="deduplicated", virtual_file_id=virtual_file.id)
+        else:
+            entry.update(status="stored", virtual_file_id=virtual_file.id)
+
+        if isinstance(virtual_file, VirtualFile):
+            seen_contents.add(virtual_file.content_id)
+
+        results.append(entry)
+
+    return {
+        "files": results,
+        "stored": sum(r["status"] == "stored" for r in results),
+        "deduplicated": sum(r["status"] == "deduplicated" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+    }
+
+
+# =========================
+# Streaming Upload API
+# =========================
+
+def _content_length(request: Request, required: bool = True) -> int | None:
+    """
+    The request's Content-Length: 411 when it is missing (e.g. a chunked
+    body) and required, 400 when it is not a byte count.
+    """
+
+    value = request.headers.get("content-length")
+    if value is None:
+        if required:
+            raise HTTPException(status_code=411, detail="Content-Length is required")
+        return None
+
+    if not value.strip().isdigit():
+        raise HTTPException(status_code=400, detail="Malformed Content-Length header")
+    return int(value)
+
+
+async def _pipe_body_to_drive(request: Request, store) -> StreamingBodyReader:
+    """
+    Runs store(body) in a worker thread while the raw request body is
+    still arriving, body being a StreamingBodyReader over it. Raises the
+    store error (or the receive error if the store side did not fail first).
+    """
+
+    body = StreamingBodyReader(settings.STREAM_UPLOAD_MAX_QUEUED_CHUNKS)
+    upload = asyncio.ensure_future(run_in_threadpool(store, body))
+    # Stop feeding as soon as the upload side gives up
+    upload.add_done_callback(lambda _: body.abort())
+
+    try:
+        async for data in request.stream():
+            await body.feed(data)
+        await body.finish()
+        await upload
+
+    except Exception as e:
+        body.abort()
+        result, = await asyncio.gather(upload, return_exceptions=True)
+        raise result if isinstance(result, Exception) else e
+
+    return body
+
+
+@router.post("/stream")
+async def upload_file_streaming(
+    request: Request,
+    trip_id: str = Query(...),
+    user_id: str = Query(...),
+    path: str = Query(..., description="Virtual path of the file"),
+    x_file_size: int | None = Header(None, description="File size in bytes"),
+    x_file_checksum: str | None = Header(None, description="Expected SHA-256"),
+    db: Session = Depends(get_db),
+):
+    """
+    Raw-body upload with the size declared up front (X-File-Size or
+    Content-Length). The chunk plan is reserved immediately and bytes
+    are forwarded to the owners' Drives while the body is still
+    arriving: no temporary file, bounded memory.
+    """
+
+    # X-File-Size lets chunked bodies declare their size
+    file_size = x_file_size
+    if file_size is None:
+        file_size = _content_length(request)
+    if file_size <= 0:
+        raise HTTPException(status_code=400, detail="File size must be positive")
+
+    try:
+        virtual_file = await run_in_threadpool(
+            create_virtual_file_with_chunks,
+            db=db,
+            trip_id=trip_id,
+            uploader_user_id=user_id,
+            path=path,
+            file_size=file_size,
+            checksum=x_file_checksum,
+        )
+    except InsufficientStorageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Declared checksum matches stored content: the body is not needed
+    if virtual_file.content.status == "READY":
+        return {
+            "message": "File already stored in this trip",
+            "virtual_file_id": virtual_file.id,
+            "size_bytes": file_size,
+            "checksum": x_file_checksum,
+            "deduplicated": True,
+        }
+
+    try:
+        body = await _pipe_body_to_drive(
+            request,
+            lambda stream: stream_file_to_google_drive(
+                db=db,
+                virtual_file_id=virtual_file.id,
+                stream=stream,
+                expected_checksum=x_file_checksum,
+            ),
+        )
+    except Exception as e:
+        # Release the reserved plan
+        await run_in_threadpool(
+            delete_virtual_file,
+            db=db,
+            virtual_file_id=virtual_file.id,
+        )
+        raise HTTPException(status_code=400, detail=f"Streaming upload failed: {e}")
+
+    return {
+        "message": "File streamed and stored to Google Drive successfully",
+        "virtual_file_id": virtual_file.id,
         "size_bytes": file_size,
+        "checksum": body.checksum,
+        "deduplicated": False,
+    }
+
+
+@router.put("/sessions/{session_id}")
+async def upload_session_body(
+    session_id: str,
+    request: Request,
+    db: Session = Depends(get_db),
+):
+    """
+    Receives the bytes of a negotiated upload as a raw body: the missing
+    blocks back to back, or the whole file if no blocks were negotiated.
+    Stored as deduplicated blocks. The session stays open on failure so
+    the client can retry until it expires.
+    """
+
+    try:
+        session = await run_in_threadpool(get_open_upload_session, db, session_id)
+    except UploadSessionNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadSessionClosedError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    # Chunked bodies are fine: sizes and hashes are checked while reading
+    content_length = _content_length(request, required=False)
+    if content_length is not None and content_length != session_body_size(session):
+        raise HTTPException(status_code=400, detail="Body size does not match the negotiated size")
+
+    try:
+        await _pipe_body_to_drive(
+            request,
+            lambda stream: store_session_body(db=db, session=session, stream=stream),
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Session upload failed: {e}")
+
+    await run_in_threadpool(complete_upload_session, db, session)
+
+    return {
+        "message": "File streamed and stored to Google Drive successfully",
+        "virtual_file_id": session.virtual_file_id,
+        "session_id": session.id,
+        "size_bytes": session.size_bytes,
+        "checksum": session.checksum,
     }
 
+
 # =========================
 # Download Endpoint
 # =========================
 
+def _etag_for(virtual_file: VirtualFile) -> str:
+    # Strong only over a checksum the server computed from the stored
+    # bytes; the client-declared VirtualFile.checksum is never verified
+    checksum = virtual_file.content.checksum
+    if checksum:
+        return f'"{checksum}"'
+    return f'W/"{virtual_file.id}-{virtual_file.size_bytes}"'
+
+
+def _etag_matches(header_value: str, etag: str) -> bool:
+    # Weak comparison, as required for If-None-Match
+    if header_value.strip() == "*":
+        return True
+    bare = etag.removeprefix("W/")
+    return any(
+        candidate.strip().removeprefix("W/") == bare
+        for candidate in header_value.split(",")
+    )
+
+
+def _if_range_matches(header_value: str, etag: str) -> bool:
+    # Strong comparison, as required for If-Range: a weak validator on
+    # either side never matches, and neither does a date (no Last-Modified)
+    value = header_value.strip()
+    return not etag.startswith("W/") and not value.startswith("W/") and value == etag
+
+
+_BYTE_RANGE_SPEC = re.compile(r"([0-9]*)-([0-9]*)")
+
+
+def _parse_range(header_value: str, size: int):
+    """
+    Parses a single "bytes=" range into inclusive (start, end).
+    Returns None when the header must be ignored (not bytes, several
+    ranges, or invalid syntax) and raises ValueError when it is valid
+    but unsatisfiable.
+    """
+
+    unit, _, spec = header_value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    match = _BYTE_RANGE_SPEC.fullmatch(spec.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Range not satisfiable")
+        return max(size - length, 0), size - 1
+
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("Range not satisfiable")
+
+    end = int(last) if last else size - 1
+    return start, min(end, size - 1)
+
+
+def _download_response(virtual_file: VirtualFile, request: Request):
+    """
+    Status and headers of a download from the request's Range and
+    conditional headers. Returns a finished Response (304, 416, empty
+    file), or (start, end, status_code, headers) for the body to stream.
+    """
+
+    size = virtual_file.size_bytes
+    etag = _etag_for(virtual_file)
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Content-Disposition": f'attachment; filename="{virtual_file.id}"',
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"Accept-Ranges": "bytes", "ETag": etag})
+
+    byte_range = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or _if_range_matches(if_range, etag)):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=416,
+                headers={"Accept-Ranges": "bytes", "Content-Range": f"bytes */{size}"},
+            )
+
+    if size == 0:
+        return Response(content=b"", headers=headers)
+
+    start, end = byte_range or (0, size - 1)
+    status_code = 206 if byte_range else 200
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    return start, end, status_code, headers
+
+
 @router.get("/{virtual_file_id}/download")
 def download_file(
     virtual_file_id: str,
+    request: Request,
     db: Session = Depends(get_db),
 ):
+    """
+    Streams a file from its owners' Drives. Supports single-range
+    requests (206) so players can seek and downloads can resume, and
+    conditional GETs against an ETag derived from the file checksum.
+    """
+
     virtual_file_id = virtual_file_id.strip()
 
-    stream = stream_virtual_file_from_drive(
-        db=db,
-        virtual_file_id=virtual_file_id,
+    virtual_file = db.get(VirtualFile, virtual_file_id)
+    if not virtual_file:
+        raise HTTPException(status_code=404, detail="Virtual file not found")
+
+    prepared = _download_response(virtual_file, request)
+    if isinstance(prepared, Response):
+        return prepared
+    start, end, status_code, headers = prepared
+
+    try:
+        stream = stream_virtual_file_from_drive(
+            db=db,
+            virtual_file_id=virtual_file_id,
+            start=start,
+            end=end,
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except FileNotReadyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return StreamingResponse(
+        stream,
+        status_code=status_code,
+        media_type="application/octet-stream",
+        headers=headers,
     )
 
+
+# =========================
+# Async Endpoints
+# =========================
+# Same contract as /files/stream and /files/{id}/download, served on
+# the event loop: AsyncSession for the database and the async Drive
+# client for transfers, so slow streams do not occupy worker threads.
+
+async_router = APIRouter(prefix="/async/files", tags=["files"])
+
+
+@async_router.post("/stream")
+async def upload_file_streaming_async(
+    request: Request,
+    trip_id: str = Query(...),
+    user_id: str = Query(...),
+    path: str = Query(..., description="Virtual path of the file"),
+    x_file_size: int | None = Header(None, description="File size in bytes"),
+    x_file_checksum: str | None = Header(None, description="Expected SHA-256"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # X-File-Size lets chunked bodies declare their size
+    file_size = x_file_size
+    if file_size is None:
+        file_size = _content_length(request)
+    if file_size <= 0:
+        raise HTTPException(status_code=400, detail="File size must be positive")
+
+    try:
+        stored = await async_storage_service.stream_file_to_drive(
+            db,
+            trip_id=trip_id,
+            uploader_user_id=user_id,
+            path=path,
+            file_size=file_size,
+            chunks=request.stream(),
+            expected_checksum=x_file_checksum,
+        )
+    except InsufficientStorageError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Streaming upload failed: {e}")
+
+    return {
+        "message": (
+            "File already stored in this trip" if stored["deduplicated"]
+            else "File streamed and stored to Google Drive successfully"
+        ),
+        "virtual_file_id": stored["virtual_file_id"],
+        "size_bytes": file_size,
+        "checksum": stored["checksum"],
+        "deduplicated": stored["deduplicated"],
+    }
+
+
+@async_router.get("/{virtual_file_id}/download")
+async def download_file_async(
+    virtual_file_id: str,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+):
+    virtual_file_id = virtual_file_id.strip()
+
+    # The ETag comes from the content: loaded up front, no lazy loads here
+    virtual_file = await db.get(VirtualFile, virtual_file_id, options=[selectinload(VirtualFile.content)])
+    if not virtual_file:
+        raise HTTPException(status_code=404, detail="Virtual file not found")
+
+    prepared = _download_response(virtual_file, request)
+    if isinstance(prepared, Response):
+        return prepared
+    start, end, status_code, headers = prepared
+
+    try:
+        stream = await async_storage_service.stream_virtual_file(
+            db,
+            virtual_file_id=virtual_file_id,
+            start=start,
+            end=end,
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except FileNotReadyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
     return StreamingResponse(
         stream,
+        status_code=status_code,
         media_type="application/octet-stream",
-        headers={
-            "Content-Disposition": f'attachment; filename="{virtual_file_id}"'
-        },
+        headers=headers,
     )
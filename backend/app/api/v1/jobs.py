@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+
+from app.core.database import get_db
+from app.services.transfer_queue import describe_transfer_job, TransferJobNotFoundError
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+@router.get("/{job_id}")
+def get_transfer_job(
+    job_id: str,
+    db: Session = Depends(get_db),
+):
+    """
+    Progress of a background Drive upload: job status, attempts and
+    the last error, plus which chunks are already on Drive.
+    """
+
+    try:
+        return describe_transfer_job(db, job_id.strip())
+    except TransferJobNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
@@ -7,6 +7,7 @@ from app.models.trip import Trip
 from app.models.trip_member import TripMember
 from app.schemas.trip import TripCreate, TripRead
 from app.schemas.trip_invite import TripInviteRequest
+from app.services.placement import placement_engine
 
 router = APIRouter(prefix="/trips", tags=["trips"])
 
@@ -21,6 +22,8 @@ def create_trip(
     trip = Trip(
         name=payload.name,
         created_by=user_id,
+        replicate_chunks=payload.replicate_chunks,
+        stripe_large_files=payload.stripe_large_files,
     )
     db.add(trip)
     db.flush()  # get trip.id without committing yet
@@ -114,4 +117,59 @@ def invite_member(
     db.add(member)
     db.commit()
 
+    # New member's space must show up in placement right away
+    placement_engine.invalidate(trip_id)
+
     return {"message": "User invited successfully"}
+
+
+def _trip_for_admin(db: Session, trip_id: str, user_id: str, action: str) -> Trip:
+    """Returns the trip, or answers 403 unless user_id is one of its ADMINs."""
+
+    admin = (
+        db.query(TripMember)
+        .filter(
+            TripMember.trip_id == trip_id,
+            TripMember.user_id == user_id,
+            TripMember.role == "ADMIN",
+        )
+        .first()
+    )
+
+    if not admin:
+        raise HTTPException(
+            status_code=403,
+            detail=f"Only ADMIN can {action}"
+        )
+
+    return db.get(Trip, trip_id)
+
+
+@router.patch("/{trip_id}/replication", response_model=TripRead)
+def set_trip_replication(
+    trip_id: str,
+    enabled: bool = Query(..., description="Replicate small and hot chunks"),
+    user_id: str = Query(..., description="Current user ID"),
+    db: Session = Depends(get_db),
+):
+    trip = _trip_for_admin(db, trip_id, user_id, "change replication")
+    trip.replicate_chunks = enabled
+    db.commit()
+    db.refresh(trip)
+
+    return trip
+
+
+@router.patch("/{trip_id}/striping", response_model=TripRead)
+def set_trip_striping(
+    trip_id: str,
+    enabled: bool = Query(..., description="Erasure code large files across members"),
+    user_id: str = Query(..., description="Current user ID"),
+    db: Session = Depends(get_db),
+):
+    trip = _trip_for_admin(db, trip_id, user_id, "change striping")
+    trip.stripe_large_files = enabled
+    db.commit()
+    db.refresh(trip)
+
+    return trip
@@ -23,6 +23,3 @@ def create_user(payload: UserCreate, db: Session = Depends(get_db)):
 @router.get("", response_model=list[UserRead])
 def list_users(db: Session = Depends(get_db)):
     return db.query(User).all()
-
-
-hhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhhbbbbbbbbbbbbbbbbbbhbhvgvgvgvgvgvg
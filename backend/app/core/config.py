@@ -7,6 +7,158 @@ class Settings(BaseSettings):
     GOOGLE_CLIENT_SECRET: str
     GOOGLE_REDIRECT_URI: str
 
+    # Database: any SQLAlchemy URL, e.g. postgresql+psycopg://user:pw@host/db.
+    # The async endpoints use DATABASE_ASYNC_URL, derived from DATABASE_URL
+    # when empty (postgresql needs asyncpg installed; without the driver
+    # only the async endpoints fail, with 503). Pool settings apply to
+    # server databases.
+    DATABASE_URL: str = "sqlite:///./tripvault.db"
+    DATABASE_ASYNC_URL: str = ""
+    DATABASE_POOL_SIZE: int = 20
+    DATABASE_MAX_OVERFLOW: int = 30
+    DATABASE_POOL_TIMEOUT_SECONDS: int = 30
+    DATABASE_POOL_RECYCLE_SECONDS: int = 30 * 60
+    DATABASE_POOL_PRE_PING: bool = True
+
+    # SQLite connections: WAL lets readers run alongside the writer, and
+    # writers wait up to BUSY_TIMEOUT_MS for the lock instead of failing
+    SQLITE_WAL: bool = True
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    SQLITE_MMAP_BYTES: int = 256 * 1024 * 1024
+
+    # Uploads are spooled to disk past this size
+    UPLOAD_SPOOL_MAX_MEMORY_BYTES: int = 1024 * 1024
+
+    # Chunk placement (see SRS FR-5): adaptive / best_fit / fairness /
+    # min_fragments / balanced_best_fit / least_used_first
+    PLACEMENT_STRATEGY: str = "adaptive"
+    PLACEMENT_SMALL_FILE_BYTES: int = 100 * 1024 * 1024
+    PLACEMENT_LARGE_FILE_BYTES: int = 1024 * 1024 * 1024
+    PLACEMENT_INDEX_TTL_SECONDS: int = 60
+    PLACEMENT_MAX_ATTEMPTS: int = 3
+
+    # Quota charged for unfinished uploads is given back after this long.
+    # Streamed uploads renew their reservation every RENEW_SECONDS while
+    # bytes keep arriving. Files planned without their bytes (POST /files,
+    # /files/upload) are kept until deleted, unless EXPIRE_METADATA_ONLY
+    # is on: then they are deleted too if upload_to_drive has not stored
+    # them in time.
+    QUOTA_RESERVATION_TTL_SECONDS: int = 2 * 60 * 60
+    QUOTA_RESERVATION_RENEW_SECONDS: int = 5 * 60
+    QUOTA_EXPIRE_METADATA_ONLY: bool = False
+    QUOTA_SWEEP_INTERVAL_SECONDS: int = 60
+
+    # Parallel chunk uploads
+    UPLOAD_MAX_WORKERS: int = 8
+    UPLOAD_MAX_WORKERS_PER_OWNER: int = 2
+
+    # Drive uploads: chunks larger than one part use resumable sessions
+    # (parts must be a multiple of 256 KiB)
+    DRIVE_UPLOAD_PART_BYTES: int = 8 * 1024 * 1024
+    DRIVE_UPLOAD_MAX_RESUME_ATTEMPTS: int = 5
+    STREAM_UPLOAD_MAX_QUEUED_CHUNKS: int = 16
+
+    # Negotiated upload sessions keep their reservation this long
+    UPLOAD_SESSION_TTL_SECONDS: int = 24 * 60 * 60
+
+    # Background transfer jobs: Drive uploads of /upload-and-store and
+    # /upload_to_drive run in a local worker pool. A running job holds a
+    # lease renewed every HEARTBEAT_SECONDS; once it lapses (worker died)
+    # another worker picks the job up again.
+    TRANSFER_JOBS_ENABLED: bool = True
+    TRANSFER_WORKERS: int = 2
+    TRANSFER_STAGING_DIR: str = "./transfer_staging"
+    TRANSFER_POLL_INTERVAL_SECONDS: float = 1.0
+    TRANSFER_LEASE_SECONDS: int = 60
+    TRANSFER_HEARTBEAT_SECONDS: int = 15
+    TRANSFER_MAX_ATTEMPTS: int = 5
+    TRANSFER_RETRY_BASE_SECONDS: float = 5.0
+    TRANSFER_RETRY_MAX_SECONDS: int = 15 * 60
+
+    # Block-level dedup: content-defined block sizes and upload fan-out
+    DEDUP_BLOCK_MIN_BYTES: int = 512 * 1024
+    DEDUP_BLOCK_AVG_BYTES: int = 2 * 1024 * 1024
+    DEDUP_BLOCK_MAX_BYTES: int = 8 * 1024 * 1024
+    DEDUP_BLOCK_UPLOAD_CONCURRENCY: int = 4
+
+    # Per-account Drive rate limit (AIMD: grows by INCREASE per second
+    # of traffic, multiplied by DECREASE_FACTOR on 429) and retries
+    DRIVE_RATE_INITIAL_PER_SECOND: float = 10.0
+    DRIVE_RATE_MIN_PER_SECOND: float = 0.5
+    DRIVE_RATE_MAX_PER_SECOND: float = 100.0
+    DRIVE_RATE_BURST: int = 20
+    DRIVE_RATE_INCREASE_PER_SECOND: float = 1.0
+    DRIVE_RATE_DECREASE_FACTOR: float = 0.5
+    DRIVE_RETRY_MAX_ATTEMPTS: int = 5
+    DRIVE_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    DRIVE_RETRY_MAX_DELAY_SECONDS: float = 32.0
+
+    # Drive metadata calls are sent as batch requests of up to 100
+    # calls per account, held back at most this long
+    DRIVE_BATCH_MAX_REQUESTS: int = 100
+    DRIVE_BATCH_WINDOW_MS: int = 20
+
+    # Drive garbage collection of deleted chunks / blocks. Drive batch
+    # requests hold at most 100 calls.
+    DRIVE_GC_ENABLED: bool = True
+    DRIVE_GC_INTERVAL_SECONDS: int = 30
+    DRIVE_GC_BATCH_SIZE: int = 100
+    DRIVE_GC_DELETES_PER_SECOND: float = 5.0
+    DRIVE_GC_MAX_BACKOFF_SECONDS: int = 60 * 60
+
+    # Chunk replication for trips with replicate_chunks: chunks up to
+    # SMALL_CHUNK_BYTES, and chunks read HOT_READS times, get a second
+    # copy on another member's Drive
+    REPLICATION_SMALL_CHUNK_BYTES: int = 4 * 1024 * 1024
+    REPLICATION_HOT_READS: int = 20
+    REPLICATION_MAX_WORKERS: int = 2
+
+    # Hedged reads: a replica is tried once the first copy is slower
+    # than this percentile of recent first-byte latencies
+    HEDGE_LATENCY_PERCENTILE: float = 95.0
+    HEDGE_MIN_DELAY_MS: int = 50
+    HEDGE_DEFAULT_DELAY_MS: int = 500
+
+    # Erasure-coded striping of large files, for trips with
+    # stripe_large_files: DATA_SHARDS + PARITY_SHARDS shards on as many
+    # members; any DATA_SHARDS of them rebuild the file. A shard slower
+    # than SLOW_SHARD_MS is swapped for a parity one.
+    STRIPE_ENABLED: bool = True
+    STRIPE_MIN_FILE_BYTES: int = 1024 * 1024 * 1024
+    STRIPE_DATA_SHARDS: int = 4
+    STRIPE_PARITY_SHARDS: int = 2
+    STRIPE_CELL_BYTES: int = 1024 * 1024
+    STRIPE_SLOW_SHARD_MS: int = 2000
+    STRIPE_QUEUED_CELLS: int = 4
+
+    # Local read-through cache of downloaded chunks / blocks / shards,
+    # least recently used evicted first (MAX_BYTES 0 disables it)
+    CHUNK_CACHE_DIR: str = "./chunk_cache"
+    CHUNK_CACHE_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    CHUNK_CACHE_MAX_ENTRY_BYTES: int = 64 * 1024 * 1024
+    CHUNK_CACHE_READ_BYTES: int = 1024 * 1024
+
+    # Drive downloads: each ranged request is sized to take about
+    # PIECE_TARGET_MS at the measured throughput
+    DRIVE_DOWNLOAD_MIN_PIECE_BYTES: int = 1024 * 1024
+    DRIVE_DOWNLOAD_MAX_PIECE_BYTES: int = 16 * 1024 * 1024
+    DRIVE_DOWNLOAD_PIECE_TARGET_MS: int = 1000
+
+    # Download read-ahead
+    DOWNLOAD_PREFETCH_CHUNKS: int = 2
+    DOWNLOAD_PREFETCH_MAX_BUFFER_BYTES: int = 64 * 1024 * 1024
+
+    # Async storage path (/async/files): Drive REST calls share one
+    # connection pool, so concurrency is bounded by sockets, not threads
+    ASYNC_DRIVE_MAX_CONNECTIONS: int = 1000
+    ASYNC_DRIVE_MAX_KEEPALIVE: int = 200
+    ASYNC_DRIVE_TIMEOUT_SECONDS: float = 60.0
+
+    # Drive client pool
+    DRIVE_CLIENT_POOL_SIZE: int = 256
+    DRIVE_CLIENT_IDLE_TTL_SECONDS: int = 900
+
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8"
@@ -1,19 +1,116 @@
-from sqlalchemy import create_engine
+import threading
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import NoSuchModuleError
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from app.core.config import settings
 
 
-Database_url = "sqlite:///./tripvault.db"
+class AsyncDatabaseUnavailableError(Exception):
+    pass
+
+
+# Async drivers used when DATABASE_ASYNC_URL is not set
+_ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+
+
+def _async_url(database_url: str) -> str:
+    if settings.DATABASE_ASYNC_URL:
+        return settings.DATABASE_ASYNC_URL
+
+    url = make_url(database_url)
+    if url.drivername == "postgresql+psycopg":
+        return database_url  # psycopg 3 serves both engines
+
+    backend = url.get_backend_name()
+    if backend not in _ASYNC_DRIVERS:
+        raise AsyncDatabaseUnavailableError(f"Set DATABASE_ASYNC_URL: no default async driver for {backend}")
+    return url.set(drivername=f"{backend}+{_ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def _engine_options(database_url: str) -> dict:
+    if make_url(database_url).get_backend_name() == "sqlite":
+        # SQLite keeps its own pool; sessions cross threads in the
+        # upload / download workers
+        return {"connect_args": {"check_same_thread": False}}
+
+    return {
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+    }
+
+
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Per-connection settings; journal_mode=WAL is also stored in the file
+    cursor = dbapi_connection.cursor()
+    if settings.SQLITE_WAL:
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_BYTES)}")
+    cursor.close()
+
 
+Database_url = settings.DATABASE_URL
 
-engine = create_engine(Database_url,connect_args={"check_same_thread": False})
+
+engine = create_engine(Database_url, **_engine_options(Database_url))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+if engine.dialect.name == "sqlite":
+    event.listen(engine, "connect", _set_sqlite_pragmas)
+
+
+# Same database for the async endpoints, set up the first time one of
+# them runs: a missing async driver only fails those endpoints, not the
+# whole app. Objects are not expired on commit: an AsyncSession cannot
+# lazy-load them afterwards.
+async_engine = None
+AsyncSessionLocal = None
+_async_setup_lock = threading.Lock()
+
+
+def get_async_sessionmaker():
+    global async_engine, AsyncSessionLocal
+
+    with _async_setup_lock:
+        if AsyncSessionLocal is None:
+            async_url = _async_url(Database_url)
+            try:
+                new_engine = create_async_engine(async_url, **_engine_options(async_url))
+            except (ImportError, NoSuchModuleError) as e:
+                raise AsyncDatabaseUnavailableError(
+                    f"The async endpoints need the {make_url(async_url).drivername} driver: "
+                    f"install it or set DATABASE_ASYNC_URL ({e})"
+                )
+
+            if new_engine.dialect.name == "sqlite":
+                event.listen(new_engine.sync_engine, "connect", _set_sqlite_pragmas)
+            async_engine = new_engine
+            AsyncSessionLocal = async_sessionmaker(new_engine, autoflush=False, expire_on_commit=False)
+
+    return AsyncSessionLocal
+
+
+async def dispose_async_engine():
+    if async_engine is not None:
+        await async_engine.dispose()
+
 
 # This ensures: One session per request ,No leaks ,Thread-safe behavior
 def get_db():
     db = SessionLocal()
     try:
-        yield db              
+        yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -1,4 +1,5 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from app.core.config import settings
 from app.core.logging import setup_logging
 from app.api.v1 import router as v1_router
@@ -6,6 +7,9 @@ from app.api.v1 import router as v1_router
 from app.core import database
 from app import models
 from app.models.base import Base
+from app.services.drive_gc import drive_garbage_collector
+from app.services.async_drive_service import async_drive_pool
+from app.services.transfer_queue import transfer_worker_pool
 import logging
 
 setup_logging()
@@ -19,6 +23,24 @@ app = FastAPI(title=settings.APP_NAME)
 @app.on_event("startup")
 def on_startup():
     logger.info("TripVault application started")
+    if settings.DRIVE_GC_ENABLED:
+        drive_garbage_collector.start()
+    if settings.TRANSFER_JOBS_ENABLED and settings.TRANSFER_WORKERS > 0:
+        transfer_worker_pool.start()
+
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    drive_garbage_collector.stop(timeout=5)
+    transfer_worker_pool.stop(timeout=5)
+    await async_drive_pool.aclose()
+    await database.dispose_async_engine()
+
+
+@app.exception_handler(database.AsyncDatabaseUnavailableError)
+async def on_async_database_unavailable(request: Request, exc: database.AsyncDatabaseUnavailableError):
+    # Only the async endpoints use the async driver
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
 
 
 app.include_router(v1_router, prefix="/api/v1")
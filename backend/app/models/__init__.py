@@ -2,5 +2,14 @@ from app.models.user import User
 from app.models.trip import Trip
 from app.models.trip_member import TripMember
 from app.models.virtual_file import VirtualFile
+from app.models.file_content import FileContent
 from app.models.file_chunk import FileChunk
+from app.models.chunk_replica import ChunkReplica
+from app.models.content_block import ContentBlock
+from app.models.file_block import FileBlock
+from app.models.file_shard import FileShard
 from app.models.user_cloud_account import UserCloudAccount
+from app.models.upload_session import UploadSession
+from app.models.quota_reservation import QuotaReservation
+from app.models.drive_tombstone import DriveTombstone
+from app.models.transfer_job import TransferJob
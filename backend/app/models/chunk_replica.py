@@ -0,0 +1,56 @@
+import uuid
+from sqlalchemy import Column, String, BigInteger, ForeignKey, DateTime
+from datetime import datetime
+
+from app.models.base import Base
+
+
+class ChunkReplica(Base):
+    """
+    An extra copy of a stored chunk on another member's Drive. The
+    FileChunk row stays the primary copy; downloads may read any of
+    them. The replica's owner is charged for it like for a chunk.
+    """
+
+    __tablename__ = "chunk_replicas"
+
+    id = Column(
+        String,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4())
+    )
+
+    chunk_id = Column(
+        String,
+        ForeignKey("file_chunks.id"),
+        nullable=False,
+        index=True
+    )
+
+    owner_user_id = Column(
+        String,
+        ForeignKey("users.id"),
+        nullable=False,
+        index=True
+    )
+
+    provider = Column(
+        String,
+        nullable=False
+    )
+
+    provider_file_id = Column(
+        String,
+        nullable=False
+    )
+
+    size_bytes = Column(
+        BigInteger,
+        nullable=False
+    )
+
+    created_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        nullable=False
+    )
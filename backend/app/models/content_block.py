@@ -0,0 +1,76 @@
+import uuid
+from sqlalchemy import Column, String, BigInteger, Integer, ForeignKey, DateTime, Index
+from datetime import datetime
+
+from app.models.base import Base
+
+
+class ContentBlock(Base):
+    """
+    A content-defined block stored once per trip, keyed by its SHA-256.
+    ref_count counts FileBlock references; the owner's quota is charged
+    once, however many files use the block.
+    """
+
+    __tablename__ = "content_blocks"
+
+    id = Column(
+        String,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4())
+    )
+
+    trip_id = Column(
+        String,
+        ForeignKey("trips.id"),
+        nullable=False
+    )
+
+    hash = Column(
+        String,
+        nullable=False
+    )
+
+    size_bytes = Column(
+        BigInteger,
+        nullable=False
+    )
+
+    owner_user_id = Column(
+        String,
+        ForeignKey("users.id"),
+        nullable=False,
+        index=True
+    )
+
+    provider = Column(
+        String,
+        nullable=False
+    )
+
+    provider_file_id = Column(
+        String,
+        nullable=False
+    )
+
+    ref_count = Column(
+        Integer,
+        nullable=False,
+        default=0
+    )
+
+    status = Column(
+        String,
+        nullable=False,  # PENDING / READY
+        default="PENDING"
+    )
+
+    created_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        nullable=False
+    )
+
+    __table_args__ = (
+        Index("ix_content_blocks_trip_hash", "trip_id", "hash"),
+    )
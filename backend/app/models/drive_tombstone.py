@@ -0,0 +1,62 @@
+from sqlalchemy import Column, String, Integer, DateTime
+from datetime import datetime
+
+from app.models.base import Base
+
+
+class DriveTombstone(Base):
+    """
+    A Drive object whose database row is gone and which still has to be
+    deleted from its owner's Drive. Rows are written in the same
+    transaction that drops the chunk or block, and removed by the
+    garbage collector once Drive has confirmed the delete.
+    """
+
+    __tablename__ = "drive_tombstones"
+
+    # ID of the chunk / block row the object belonged to, so tombstones
+    # can be written with a single INSERT ... SELECT
+    id = Column(
+        String,
+        primary_key=True
+    )
+
+    # Plain column: the owner's account is looked up when collecting
+    owner_user_id = Column(
+        String,
+        nullable=False
+    )
+
+    provider = Column(
+        String,
+        nullable=False
+    )
+
+    provider_file_id = Column(
+        String,
+        nullable=False
+    )
+
+    attempts = Column(
+        Integer,
+        nullable=False,
+        default=0
+    )
+
+    next_attempt_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        nullable=False,
+        index=True
+    )
+
+    last_error = Column(
+        String,
+        nullable=True
+    )
+
+    created_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        nullable=False
+    )
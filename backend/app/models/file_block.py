@@ -0,0 +1,55 @@
+import uuid
+from sqlalchemy import Column, String, BigInteger, Integer, ForeignKey
+from sqlalchemy.orm import relationship
+
+from app.models.base import Base
+
+
+class FileBlock(Base):
+    """
+    Position of a ContentBlock inside a FileContent stored as blocks.
+    """
+
+    __tablename__ = "file_blocks"
+
+    id = Column(
+        String,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4())
+    )
+
+    content_id = Column(
+        String,
+        ForeignKey("file_contents.id"),
+        nullable=False,
+        index=True
+    )
+
+    position = Column(
+        Integer,
+        nullable=False
+    )
+
+    block_id = Column(
+        String,
+        ForeignKey("content_blocks.id"),
+        nullable=False,
+        index=True
+    )
+
+    offset_bytes = Column(
+        BigInteger,
+        nullable=False
+    )
+
+    size_bytes = Column(
+        BigInteger,
+        nullable=False
+    )
+
+    # relationships
+    content = relationship(
+        "FileContent",
+        back_populates="blocks"
+    )
+    block = relationship("ContentBlock")
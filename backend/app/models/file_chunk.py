@@ -14,9 +14,9 @@ class FileChunk(Base):
         default=lambda: str(uuid.uuid4())
     )
 
-    virtual_file_id = Column(
+    content_id = Column(
         String,
-        ForeignKey("virtual_files.id"),
+        ForeignKey("file_contents.id"),
         nullable=False,
         index=True
     )
@@ -49,7 +49,7 @@ class FileChunk(Base):
     )
 
     # relationships
-    virtual_file = relationship(
-        "VirtualFile",
+    content = relationship(
+        "FileContent",
         back_populates="chunks"
     )
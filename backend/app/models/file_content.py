@@ -0,0 +1,104 @@
+import uuid
+from sqlalchemy import Column, String, BigInteger, Integer, ForeignKey, DateTime, Index
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+from app.models.base import Base
+
+
+class FileContent(Base):
+    """
+    Stored bytes of a file, shared by every VirtualFile in the trip
+    with the same SHA-256. The bytes are contiguous chunks, an ordered
+    list of deduplicated blocks, or Reed-Solomon striped shards
+    (storage_mode), and ref_count tracks how many VirtualFiles point at it.
+    """
+
+    __tablename__ = "file_contents"
+
+    id = Column(
+        String,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4())
+    )
+
+    trip_id = Column(
+        String,
+        ForeignKey("trips.id"),
+        nullable=False
+    )
+
+    checksum = Column(
+        String,
+        nullable=True
+    )
+
+    size_bytes = Column(
+        BigInteger,
+        nullable=False
+    )
+
+    ref_count = Column(
+        Integer,
+        nullable=False,
+        default=1
+    )
+
+    status = Column(
+        String,
+        nullable=False,  # PENDING / READY
+        default="PENDING"
+    )
+
+    storage_mode = Column(
+        String,
+        nullable=False,  # chunks / blocks / stripes
+        default="chunks"
+    )
+
+    # Stripe layout, set for storage_mode "stripes": every stripe is
+    # cut into data_shards cells of stripe_cell_bytes plus parity cells
+    stripe_data_shards = Column(
+        Integer,
+        nullable=True
+    )
+
+    stripe_parity_shards = Column(
+        Integer,
+        nullable=True
+    )
+
+    stripe_cell_bytes = Column(
+        Integer,
+        nullable=True
+    )
+
+    created_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        nullable=False
+    )
+
+    # relationships
+    chunks = relationship(
+        "FileChunk",
+        back_populates="content",
+        cascade="all, delete-orphan",
+        order_by="FileChunk.offset_bytes",
+    )
+    blocks = relationship(
+        "FileBlock",
+        back_populates="content",
+        cascade="all, delete-orphan",
+        order_by="FileBlock.position",
+    )
+    shards = relationship(
+        "FileShard",
+        back_populates="content",
+        cascade="all, delete-orphan",
+        order_by="FileShard.shard_index",
+    )
+
+    __table_args__ = (
+        Index("ix_file_contents_trip_checksum", "trip_id", "checksum"),
+    )
@@ -0,0 +1,61 @@
+import uuid
+from sqlalchemy import Column, String, BigInteger, Integer, ForeignKey
+from sqlalchemy.orm import relationship
+
+from app.models.base import Base
+
+
+class FileShard(Base):
+    """
+    One shard of a striped FileContent: shard_index < data shards hold
+    data cells, the rest hold Reed-Solomon parity. Each shard is one
+    Drive object on a different member.
+    """
+
+    __tablename__ = "file_shards"
+
+    id = Column(
+        String,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4())
+    )
+
+    content_id = Column(
+        String,
+        ForeignKey("file_contents.id"),
+        nullable=False,
+        index=True
+    )
+
+    shard_index = Column(
+        Integer,
+        nullable=False
+    )
+
+    owner_user_id = Column(
+        String,
+        ForeignKey("users.id"),
+        nullable=False,
+        index=True
+    )
+
+    provider = Column(
+        String,
+        nullable=False
+    )
+
+    provider_file_id = Column(
+        String,
+        nullable=False
+    )
+
+    size_bytes = Column(
+        BigInteger,
+        nullable=False
+    )
+
+    # relationships
+    content = relationship(
+        "FileContent",
+        back_populates="shards"
+    )
@@ -0,0 +1,63 @@
+import uuid
+from sqlalchemy import Column, String, BigInteger, ForeignKey, DateTime
+from datetime import datetime
+
+from app.models.base import Base
+
+
+class QuotaReservation(Base):
+    """
+    Bytes charged to a member for content that is not finalized yet.
+    Rows are deleted when the content becomes READY; expired rows mean
+    the upload was abandoned and its storage is given back.
+    """
+
+    __tablename__ = "quota_reservations"
+
+    id = Column(
+        String,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4())
+    )
+
+    trip_id = Column(
+        String,
+        ForeignKey("trips.id"),
+        nullable=False
+    )
+
+    user_id = Column(
+        String,
+        ForeignKey("users.id"),
+        nullable=False
+    )
+
+    # Plain columns: the row may be swept after its content is gone
+    content_id = Column(
+        String,
+        nullable=False,
+        index=True
+    )
+
+    # Set for a dedup block charged while the content is being stored
+    block_id = Column(
+        String,
+        nullable=True
+    )
+
+    size_bytes = Column(
+        BigInteger,
+        nullable=False
+    )
+
+    expires_at = Column(
+        DateTime,
+        nullable=False,
+        index=True
+    )
+
+    created_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        nullable=False
+    )
@@ -0,0 +1,121 @@
+import uuid
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime
+from datetime import datetime
+
+from app.models.base import Base
+
+
+class TransferJob(Base):
+    """
+    A Drive upload run by the background worker pool instead of inside
+    the request. A worker claims a job by taking its lease and keeps it
+    with heartbeats; a job whose lease lapsed is claimed again, and a
+    failed attempt is retried after a backoff.
+    """
+
+    __tablename__ = "transfer_jobs"
+
+    id = Column(
+        String,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4())
+    )
+
+    kind = Column(
+        String,
+        nullable=False  # store_file / store_placeholder
+    )
+
+    trip_id = Column(
+        String,
+        ForeignKey("trips.id"),
+        nullable=False,
+        index=True
+    )
+
+    user_id = Column(
+        String,
+        ForeignKey("users.id"),
+        nullable=False
+    )
+
+    virtual_file_id = Column(
+        String,
+        ForeignKey("virtual_files.id", ondelete="SET NULL"),
+        nullable=True
+    )
+
+    # File bytes kept on local disk until the job is finished
+    staged_path = Column(
+        String,
+        nullable=True
+    )
+
+    # SHA-256 of the staged bytes, computed while they were received
+    checksum = Column(
+        String,
+        nullable=True
+    )
+
+    # Higher runs first
+    priority = Column(
+        Integer,
+        nullable=False,
+        default=0
+    )
+
+    status = Column(
+        String,
+        nullable=False,  # QUEUED / RUNNING / SUCCEEDED / FAILED
+        default="QUEUED",
+        index=True
+    )
+
+    attempts = Column(
+        Integer,
+        nullable=False,
+        default=0
+    )
+
+    max_attempts = Column(
+        Integer,
+        nullable=False
+    )
+
+    next_attempt_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        nullable=False,
+        index=True
+    )
+
+    lease_owner = Column(
+        String,
+        nullable=True
+    )
+
+    lease_expires_at = Column(
+        DateTime,
+        nullable=True
+    )
+
+    last_error = Column(
+        String,
+        nullable=True
+    )
+
+    created_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        nullable=False
+    )
+
+    started_at = Column(
+        DateTime,
+        nullable=True
+    )
+
+    finished_at = Column(
+        DateTime,
+        nullable=True
+    )
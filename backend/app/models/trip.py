@@ -1,5 +1,5 @@
 import uuid
-from sqlalchemy import Column, String, ForeignKey
+from sqlalchemy import Column, String, ForeignKey, Boolean
 from sqlalchemy.orm import relationship
 
 from app.models.base import Base
@@ -22,6 +22,21 @@ class Trip(Base):
         nullable=False
     )
 
+    # Small and frequently read chunks get a copy on a second member
+    replicate_chunks = Column(
+        Boolean,
+        nullable=False,
+        default=False
+    )
+
+    # Files of STRIPE_MIN_FILE_BYTES or more are erasure coded across
+    # members; parity shards take extra quota
+    stripe_large_files = Column(
+        Boolean,
+        nullable=False,
+        default=False
+    )
+
     # relationships
     creator = relationship("User")
     members = relationship("TripMember", back_populates="trip")
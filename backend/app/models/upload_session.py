@@ -0,0 +1,75 @@
+import uuid
+from sqlalchemy import Column, String, BigInteger, ForeignKey, DateTime, JSON
+from sqlalchemy.orm import relationship
+from datetime import datetime
+
+from app.models.base import Base
+
+
+class UploadSession(Base):
+    """
+    Result of a pre-upload negotiation: the reserved VirtualFile plus
+    which of the client's blocks still have to be sent.
+    """
+
+    __tablename__ = "upload_sessions"
+
+    id = Column(
+        String,
+        primary_key=True,
+        default=lambda: str(uuid.uuid4())
+    )
+
+    trip_id = Column(
+        String,
+        ForeignKey("trips.id"),
+        nullable=False,
+        index=True
+    )
+
+    user_id = Column(
+        String,
+        ForeignKey("users.id"),
+        nullable=False
+    )
+
+    virtual_file_id = Column(
+        String,
+        ForeignKey("virtual_files.id", ondelete="SET NULL"),
+        nullable=True
+    )
+
+    size_bytes = Column(
+        BigInteger,
+        nullable=False
+    )
+
+    checksum = Column(
+        String,
+        nullable=False
+    )
+
+    # Client block hashes and sizes, in file order, and the indexes still missing
+    block_hashes = Column(JSON, nullable=False, default=list)
+    block_sizes = Column(JSON, nullable=False, default=list)
+    missing_blocks = Column(JSON, nullable=False, default=list)
+
+    status = Column(
+        String,
+        nullable=False,  # OPEN / COMPLETE / EXPIRED
+        default="OPEN"
+    )
+
+    expires_at = Column(
+        DateTime,
+        nullable=False
+    )
+
+    created_at = Column(
+        DateTime,
+        default=datetime.utcnow,
+        nullable=False
+    )
+
+    # relationships
+    virtual_file = relationship("VirtualFile")
@@ -14,3 +14,6 @@ class UserCloudAccount(Base):
     access_token = Column(String, nullable=False)
     refresh_token = Column(String, nullable=False)
     token_expiry = Column(String, nullable=True)
+
+    # TripVault folder inside the account's AppData, resolved once
+    app_folder_id = Column(String, nullable=True)
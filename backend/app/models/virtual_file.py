@@ -37,6 +37,13 @@ class VirtualFile(Base):
         nullable=True
     )
 
+    content_id = Column(
+        String,
+        ForeignKey("file_contents.id"),
+        nullable=False,
+        index=True
+    )
+
     uploaded_by = Column(
         String,
         ForeignKey("users.id"),
@@ -50,8 +57,4 @@ class VirtualFile(Base):
     )
 
     # relationships
-    chunks = relationship(
-        "FileChunk",
-        back_populates="virtual_file",
-        cascade="all, delete-orphan"
-    )
+    content = relationship("FileContent")
@@ -5,3 +5,17 @@ class FileUploadRequest(BaseModel):
     path: str
     size_bytes: int
     checksum: str | None = None
+
+
+class UploadNegotiationRequest(BaseModel):
+    path: str
+    size_bytes: int
+    checksum: str
+    block_size: int | None = None
+    block_sizes: list[int] = []
+    block_hashes: list[str] = []
+
+
+class BulkDeleteRequest(BaseModel):
+    ids: list[str] = []
+    path_prefix: str | None = None
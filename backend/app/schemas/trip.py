@@ -6,6 +6,8 @@ from app.schemas.trip_member import TripMemberRead
 
 class TripCreate(BaseModel):
     name: str
+    replicate_chunks: bool = False
+    stripe_large_files: bool = False
     
 
 
@@ -13,6 +15,8 @@ class TripRead(BaseModel):
     id: str
     name: str
     created_by: str
+    replicate_chunks: bool = False
+    stripe_large_files: bool = False
     members:List[TripMemberRead] = []
 
 
@@ -0,0 +1,321 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Awaitable, Callable, Dict
+
+import google_auth_httplib2
+import httplib2
+import httpx
+
+from app.core.config import settings
+from app.models.user_cloud_account import UserCloudAccount
+from app.services.drive_client_pool import build_credentials
+from app.services.drive_rate_limit import AdaptiveRateLimiter, retry_delay, rate_limiter_for
+
+
+DRIVE_API = "https://www.googleapis.com/drive/v3"
+DRIVE_UPLOAD_API = "https://www.googleapis.com/upload/drive/v3"
+
+_RETRYABLE_STATUSES = {408, 500, 502, 503, 504}
+
+
+class DriveRequestError(Exception):
+    def __init__(self, status: int, detail: str):
+        super().__init__(f"Drive returned {status}: {detail[:300]}")
+        self.status = status
+
+
+def is_async_not_found(error: Exception) -> bool:
+    return isinstance(error, DriveRequestError) and error.status == 404
+
+
+def _is_throttled(status: int, content: bytes) -> bool:
+    # Same signals as drive_rate_limit: 429, or 403 rateLimitExceeded /
+    # userRateLimitExceeded
+    return status == 429 or (status == 403 and b"ateLimitExceeded" in content)
+
+
+async def _read_exact(read: Callable[[int], Awaitable[bytes]], size: int) -> bytes:
+    parts = []
+    while size > 0:
+        data = await read(size)
+        if not data:
+            raise Exception("Stream ended before the declared size")
+        parts.append(data)
+        size -= len(data)
+    return b"".join(parts)
+
+
+# =========================
+# Async Drive Client
+# =========================
+
+class AsyncDriveClient:
+    """
+    Drive REST calls of one account over the shared httpx client: no
+    thread is held while a request waits on the network. Requests take
+    tokens from the same per-account limiter as the sync clients and
+    are retried the same way (see RateLimitedHttp).
+    """
+
+    def __init__(self, http: httpx.AsyncClient, account: UserCloudAccount):
+        self.account_id = account.id
+        self.fingerprint = (account.access_token, account.refresh_token)
+        self.last_used = time.monotonic()
+        self._http = http
+        self._credentials = build_credentials(account)
+        self._limiter: AdaptiveRateLimiter = rate_limiter_for(account.id)
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        if not self._credentials.valid and self._credentials.refresh_token:
+            # Token refresh is rare; the blocking google-auth call runs aside
+            await asyncio.to_thread(
+                self._credentials.refresh,
+                google_auth_httplib2.Request(httplib2.Http()),
+            )
+        return {"Authorization": f"Bearer {self._credentials.token}"}
+
+    async def _request(self, method: str, url: str, *, idempotent: bool, **kwargs) -> httpx.Response:
+        # Whole-body request with the limiter and retry policy applied
+        headers = {**(await self._auth_headers()), **kwargs.pop("headers", {})}
+
+        attempt = 0
+        while True:
+            await self._limiter.acquire_async()
+            try:
+                response = await self._http.request(method, url, headers=headers, **kwargs)
+            except httpx.TransportError:
+                if not idempotent or attempt >= settings.DRIVE_RETRY_MAX_ATTEMPTS:
+                    raise
+                await asyncio.sleep(retry_delay(attempt))
+                attempt += 1
+                continue
+
+            if _is_throttled(response.status_code, response.content):
+                self._limiter.on_throttled()
+                retry = True
+            elif response.status_code in _RETRYABLE_STATUSES:
+                retry = idempotent
+            else:
+                self._limiter.on_success()
+                return response
+
+            if not retry or attempt >= settings.DRIVE_RETRY_MAX_ATTEMPTS:
+                return response
+
+            await asyncio.sleep(retry_delay(attempt, response.headers))
+            attempt += 1
+
+    # ---- downloads ----
+
+    async def download(self, file_id: str, start: int | None = None, end: int | None = None) -> AsyncIterator[bytes]:
+        """
+        Streams a Drive file, or bytes start..end (inclusive) of it, as
+        the socket delivers them. Failures are retried until the first
+        byte has been yielded.
+        """
+
+        headers = await self._auth_headers()
+        if start is not None:
+            headers["Range"] = f"bytes={start}-{end}"
+
+        attempt = 0
+        while True:
+            await self._limiter.acquire_async()
+            received = 0
+            try:
+                async with self._http.stream(
+                    "GET",
+                    f"{DRIVE_API}/files/{file_id}",
+                    params={"alt": "media"},
+                    headers=headers,
+                ) as response:
+                    if response.status_code in (200, 206):
+                        self._limiter.on_success()
+                        async for piece in response.aiter_bytes():
+                            received += len(piece)
+                            yield piece
+                        return
+
+                    content = await response.aread()
+                    status, retry_headers = response.status_code, response.headers
+
+            except httpx.TransportError:
+                if received or attempt >= settings.DRIVE_RETRY_MAX_ATTEMPTS:
+                    raise
+                await asyncio.sleep(retry_delay(attempt))
+                attempt += 1
+                continue
+
+            throttled = _is_throttled(status, content)
+            if throttled:
+                self._limiter.on_throttled()
+            if not (throttled or status in _RETRYABLE_STATUSES) or attempt >= settings.DRIVE_RETRY_MAX_ATTEMPTS:
+                raise DriveRequestError(status, content.decode(errors="replace"))
+
+            await asyncio.sleep(retry_delay(attempt, retry_headers))
+            attempt += 1
+
+    # ---- uploads ----
+
+    async def _start_upload(self, folder_id: str, name: str, size: int) -> str:
+        response = await self._request(
+            "POST",
+            f"{DRIVE_UPLOAD_API}/files",
+            # Nothing is created until the first part arrives
+            idempotent=True,
+            params={"uploadType": "resumable", "fields": "id"},
+            headers={
+                "Content-Type": "application/json; charset=UTF-8",
+                "X-Upload-Content-Type": "application/octet-stream",
+                "X-Upload-Content-Length": str(size),
+            },
+            content=json.dumps({"name": name, "parents": [folder_id]}),
+        )
+        if response.status_code != 200 or "location" not in response.headers:
+            raise DriveRequestError(response.status_code, response.text)
+        return response.headers["location"]
+
+    async def _upload_status(self, session_url: str, size: int) -> httpx.Response:
+        # Asks a resumable session how much it has acknowledged
+        return await self._request(
+            "PUT",
+            session_url,
+            idempotent=True,
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+
+    async def upload(
+        self,
+        *,
+        folder_id: str,
+        name: str,
+        size: int,
+        read: Callable[[int], Awaitable[bytes]],
+        part_size: int,
+    ) -> str:
+        """
+        Uploads the next size bytes of await read(n) through a resumable
+        session, one part at a time, and returns the new file ID. After
+        a failed part the session is asked for the last acknowledged
+        byte and the upload resumes from there.
+        """
+
+        session_url = await self._start_upload(folder_id, name, size)
+
+        position = 0
+        part = b""
+        failures = 0
+        while True:
+            if not part:
+                part = await _read_exact(read, min(part_size, size - position))
+
+            try:
+                response = await self._request(
+                    "PUT",
+                    session_url,
+                    idempotent=False,
+                    headers={"Content-Range": f"bytes {position}-{position + len(part) - 1}/{size}"},
+                    content=part,
+                )
+                if response.status_code in _RETRYABLE_STATUSES:
+                    raise DriveRequestError(response.status_code, response.text)
+            except (httpx.TransportError, DriveRequestError):
+                failures += 1
+                if failures > settings.DRIVE_UPLOAD_MAX_RESUME_ATTEMPTS:
+                    raise
+                await asyncio.sleep(retry_delay(failures))
+                response = await self._upload_status(session_url, size)
+            else:
+                failures = 0
+
+            if response.status_code in (200, 201):
+                return response.json()["id"]
+            if response.status_code != 308:
+                raise DriveRequestError(response.status_code, response.text)
+
+            # "Range: bytes=0-N" is what Drive holds; no header means nothing
+            acknowledged = 0
+            if "range" in response.headers:
+                acknowledged = int(response.headers["range"].rpartition("-")[2]) + 1
+            part = part[acknowledged - position:]
+            position = acknowledged
+
+
+# =========================
+# Async Client Pool
+# =========================
+
+class AsyncDriveClientPool:
+    """
+    One AsyncDriveClient per account on a single httpx connection pool,
+    created on first use inside the event loop. Concurrency is bounded
+    by max_connections sockets rather than by worker threads.
+
+    Clients are bounded like DriveClientPool: idle ones are dropped
+    after idle_ttl_seconds and the least recently used one is evicted
+    once max_size is reached.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_connections: int,
+        max_keepalive: int,
+        timeout_seconds: float,
+        max_size: int,
+        idle_ttl_seconds: float,
+    ):
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self._timeout = httpx.Timeout(timeout_seconds)
+        self._max_size = max(1, max_size)
+        self._idle_ttl_seconds = idle_ttl_seconds
+        self._http: httpx.AsyncClient | None = None
+        self._clients: "OrderedDict[str, AsyncDriveClient]" = OrderedDict()
+
+    def get(self, account: UserCloudAccount) -> AsyncDriveClient:
+        # Runs on the event loop thread only, so no lock is needed
+        if self._http is None:
+            self._http = httpx.AsyncClient(limits=self._limits, timeout=self._timeout)
+
+        now = time.monotonic()
+        self._evict_idle(now)
+
+        client = self._clients.get(account.id)
+        if client is None or client.fingerprint != (account.access_token, account.refresh_token):
+            client = AsyncDriveClient(self._http, account)
+            self._clients[account.id] = client
+
+        client.last_used = now
+        self._clients.move_to_end(account.id)
+
+        while len(self._clients) > self._max_size:
+            self._clients.popitem(last=False)
+
+        return client
+
+    def invalidate(self, account_id: str):
+        self._clients.pop(account_id, None)
+
+    def _evict_idle(self, now: float):
+        while self._clients:
+            account_id, client = next(iter(self._clients.items()))
+            if now - client.last_used < self._idle_ttl_seconds:
+                break
+            del self._clients[account_id]
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+        self._clients.clear()
+
+
+async_drive_pool = AsyncDriveClientPool(
+    max_connections=settings.ASYNC_DRIVE_MAX_CONNECTIONS,
+    max_keepalive=settings.ASYNC_DRIVE_MAX_KEEPALIVE,
+    timeout_seconds=settings.ASYNC_DRIVE_TIMEOUT_SECONDS,
+    max_size=settings.DRIVE_CLIENT_POOL_SIZE,
+    idle_ttl_seconds=settings.DRIVE_CLIENT_IDLE_TTL_SECONDS,
+)
@@ -0,0 +1,298 @@
+import asyncio
+import hashlib
+from typing import AsyncIterator, Awaitable, Callable, Iterator, List
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.virtual_file import VirtualFile
+from app.models.user_cloud_account import UserCloudAccount
+from app.services.async_drive_service import async_drive_pool, is_async_not_found
+from app.services.chunk_cache import chunk_cache
+from app.services.download_engine import prefetch_ordered_async
+from app.services.google_drive_service import get_drive_client, refresh_app_folder_id, resolve_app_folder_id
+from app.services.quota_service import ReservationRenewal, extend_reservations
+from app.services.storage_service import (
+    FileNotFoundError,
+    FileNotReadyError,
+    begin_stream_upload,
+    create_virtual_file_with_chunks,
+    delete_virtual_file,
+    finish_stream_upload,
+    plan_chunk_reads,
+    record_streamed_chunk,
+    stream_virtual_file_from_drive,
+)
+
+
+# =========================
+# Async Storage Service
+# =========================
+# Database work reuses the sync service through AsyncSession.run_sync
+# (it only runs queries, never Drive calls); every Drive transfer goes
+# through the async client, so a stream holds a socket, not a thread.
+
+_END = object()
+
+
+async def _iterate_in_thread(iterator: Iterator[bytes]) -> AsyncIterator[bytes]:
+    # For the thread-based striped reader
+    while True:
+        piece = await asyncio.to_thread(next, iterator, _END)
+        if piece is _END:
+            return
+        yield piece
+
+
+def _chunk_source(account: UserCloudAccount, provider_file_id: str, start: int, end: int, chunk_size: int):
+    async def _source():
+        cached = chunk_cache.read(provider_file_id, start, end)
+        if cached is not None:
+            for piece in cached:
+                yield piece
+            return
+
+        client = async_drive_pool.get(account)
+        if start == 0 and end == chunk_size - 1:
+            # Whole objects are kept for the next reader
+            pieces = chunk_cache.fill_async(provider_file_id, chunk_size, client.download(provider_file_id))
+        else:
+            pieces = client.download(provider_file_id, start, end)
+
+        async for piece in pieces:
+            yield piece
+
+    return _source
+
+
+def _failover_source(copies: List[Callable[[], AsyncIterator[bytes]]]):
+    # Replicas are tried in order until one delivers its first byte
+    if len(copies) == 1:
+        return copies[0]
+
+    async def _source():
+        for index, copy in enumerate(copies):
+            started = False
+            try:
+                async for piece in copy():
+                    started = True
+                    yield piece
+                return
+            except Exception:
+                if started or index == len(copies) - 1:
+                    raise
+
+    return _source
+
+
+def _plan_download(db: Session, virtual_file_id: str, start: int, end: int):
+    virtual_file = db.get(VirtualFile, virtual_file_id)
+    if not virtual_file:
+        raise FileNotFoundError("Virtual file not found")
+    if virtual_file.content.status != "READY":
+        raise FileNotReadyError("File is still being uploaded")
+
+    if virtual_file.content.storage_mode == "stripes":
+        # Striped reads decode on their own reader threads
+        return stream_virtual_file_from_drive(db=db, virtual_file_id=virtual_file_id, start=start, end=end)
+
+    return plan_chunk_reads(db, virtual_file, start, end)
+
+
+async def stream_virtual_file(
+    db: AsyncSession,
+    *,
+    virtual_file_id: str,
+    start: int,
+    end: int,
+) -> AsyncIterator[bytes]:
+    """
+    Async stream_virtual_file_from_drive: bytes start..end (inclusive)
+    of a file. Lookup errors are raised here, before any byte is
+    streamed; the next chunks are prefetched by tasks, not threads.
+    """
+
+    plan = await db.run_sync(_plan_download, virtual_file_id, start, end)
+    if not isinstance(plan, list):
+        return _iterate_in_thread(plan)
+
+    sources = [
+        _failover_source([
+            _chunk_source(account, provider_file_id, chunk_start, chunk_end, chunk_size)
+            for account, provider_file_id in copies
+        ])
+        for copies, chunk_start, chunk_end, chunk_size in plan
+    ]
+
+    return prefetch_ordered_async(
+        sources,
+        window=settings.DOWNLOAD_PREFETCH_CHUNKS,
+        max_buffer_bytes=settings.DOWNLOAD_PREFETCH_MAX_BUFFER_BYTES,
+    )
+
+
+# =========================
+# Async Streaming Upload
+# =========================
+
+class AsyncBodyReader:
+    """
+    read(n) over an async iterator of body chunks, hashing what it
+    reads. checksum is set once the end of the body has been read.
+    """
+
+    def __init__(self, chunks: AsyncIterator[bytes]):
+        self._chunks = chunks.__aiter__()
+        self._leftover = b""
+        self._eof = False
+        self._hasher = hashlib.sha256()
+
+        self.size_bytes = 0
+        self.checksum: str | None = None
+
+    async def read(self, size: int) -> bytes:
+        while not self._leftover and not self._eof:
+            try:
+                data = await self._chunks.__anext__()
+            except StopAsyncIteration:
+                self._eof = True
+                self.checksum = self._hasher.hexdigest()
+                break
+
+            self._hasher.update(data)
+            self.size_bytes += len(data)
+            self._leftover = data
+
+        data, self._leftover = self._leftover[:size], self._leftover[size:]
+        return data
+
+
+async def _app_folder_id(account: UserCloudAccount) -> str:
+    # Cached or stored on the account; only a new account asks Drive,
+    # on a worker thread
+    return await asyncio.to_thread(resolve_app_folder_id, account, get_drive_client(account))
+
+
+async def _upload_chunk(
+    account: UserCloudAccount,
+    folder_id: str,
+    name: str,
+    size: int,
+    read: Callable[[int], Awaitable[bytes]],
+) -> str:
+    client = async_drive_pool.get(account)
+
+    def upload(folder: str):
+        return client.upload(
+            folder_id=folder,
+            name=name,
+            size=size,
+            read=read,
+            part_size=settings.DRIVE_UPLOAD_PART_BYTES,
+        )
+
+    try:
+        return await upload(folder_id)
+    except Exception as e:
+        # The session is refused before any byte is read, so retrying
+        # in the re-resolved folder is safe
+        if not is_async_not_found(e):
+            raise
+
+    folder_id = await asyncio.to_thread(refresh_app_folder_id, account.id, get_drive_client(account), folder_id)
+    return await upload(folder_id)
+
+
+async def stream_file_to_drive(
+    db: AsyncSession,
+    *,
+    trip_id: str,
+    uploader_user_id: str,
+    path: str,
+    file_size: int,
+    chunks: AsyncIterator[bytes],
+    expected_checksum: str | None = None,
+) -> dict:
+    """
+    Async /files/stream: reserves a chunk plan, forwards the body to the
+    owners' Drives as it arrives and records the chunks. On failure the
+    file is deleted again, releasing its plan.
+
+    Files are always chunked here; striped uploads need the
+    thread-based encoder of the sync path.
+    """
+
+    def _create(session: Session):
+        virtual_file = create_virtual_file_with_chunks(
+            db=session,
+            trip_id=trip_id,
+            uploader_user_id=uploader_user_id,
+            path=path,
+            file_size=file_size,
+            checksum=expected_checksum,
+            allow_striping=False,
+        )
+        return virtual_file, virtual_file.content.status
+
+    virtual_file, status = await db.run_sync(_create)
+
+    # Declared checksum matches stored content: the body is not needed
+    if status == "READY":
+        return {"virtual_file_id": virtual_file.id, "checksum": expected_checksum, "deduplicated": True}
+
+    body = AsyncBodyReader(chunks)
+    renewal = ReservationRenewal()
+
+    def _renew(session: Session):
+        extend_reservations(session, virtual_file.content_id)
+        session.commit()
+
+    async def _read(size: int) -> bytes:
+        # Keeps the reservation alive while the body arrives
+        if renewal.due():
+            await db.run_sync(_renew)
+        return await body.read(size)
+
+    try:
+        file_chunks, accounts = await db.run_sync(begin_stream_upload, virtual_file)
+
+        folder_ids = {}
+        for user_id, account in accounts.items():
+            folder_ids[user_id] = await _app_folder_id(account)
+
+        provider_file_ids = {}
+        for chunk in file_chunks:
+            provider_file_ids[chunk.id] = await _upload_chunk(
+                accounts[chunk.owner_user_id],
+                folder_ids[chunk.owner_user_id],
+                f"chunk_{virtual_file.content_id}_{chunk.offset_bytes}.bin",
+                chunk.size_bytes,
+                _read,
+            )
+            await db.run_sync(record_streamed_chunk, chunk, provider_file_ids[chunk.id])
+
+        if await body.read(1):
+            raise Exception("Request body is larger than the declared file size")
+
+        if expected_checksum and body.checksum != expected_checksum:
+            raise Exception("Checksum mismatch")
+
+        await db.run_sync(
+            lambda session: finish_stream_upload(
+                session,
+                virtual_file,
+                file_chunks,
+                accounts,
+                provider_file_ids,
+                body.checksum,
+            )
+        )
+
+    except Exception:
+        await db.rollback()
+        # Release the reserved plan
+        await db.run_sync(lambda session: delete_virtual_file(db=session, virtual_file_id=virtual_file.id))
+        raise
+
+    return {"virtual_file_id": virtual_file.id, "checksum": body.checksum, "deduplicated": False}
@@ -0,0 +1,385 @@
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import select, update, delete, case, func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.content_block import ContentBlock
+from app.models.file_block import FileBlock
+from app.models.file_content import FileContent
+from app.models.user_cloud_account import UserCloudAccount
+from app.services.placement import PlacementError, placement_engine
+from app.services.quota_service import (
+    charge_member,
+    refund_member,
+    reserve_block,
+    finalize_reservations,
+)
+from app.services.google_drive_service import (
+    get_drive_client,
+    resolve_app_folder_id,
+)
+from app.services.upload_engine import ChunkUploadTask, upload_chunk_bytes
+from app.services.drive_gc import tombstone_blocks, tombstone_objects
+
+
+logger = logging.getLogger(__name__)
+
+
+class MissingBlockError(Exception):
+    pass
+
+
+# =========================
+# Block Lookup
+# =========================
+
+def find_ready_blocks(db: Session, trip_id: str, hashes: Iterable[str]) -> Dict[str, ContentBlock]:
+    """
+    Stored blocks of the trip among the given hashes, keyed by hash.
+    """
+
+    wanted = list(set(hashes))
+    found: Dict[str, ContentBlock] = {}
+
+    # Keep IN lists well below SQLite's bound-parameter limit
+    for i in range(0, len(wanted), 500):
+        for block in db.execute(
+            select(ContentBlock)
+            .where(
+                ContentBlock.trip_id == trip_id,
+                ContentBlock.hash.in_(wanted[i:i + 500]),
+                ContentBlock.status == "READY",
+            )
+        ).scalars():
+            found.setdefault(block.hash, block)
+
+    return found
+
+
+def load_block_pieces(db: Session, content_id: str, start: int, end: int):
+    """
+    Blocks of a content overlapping bytes start..end, in file order,
+    with the same offset/size/owner/provider fields as a FileChunk.
+    """
+
+    return db.execute(
+        select(
+            FileBlock.offset_bytes,
+            FileBlock.size_bytes,
+            ContentBlock.owner_user_id,
+            ContentBlock.provider_file_id,
+        )
+        .join(ContentBlock, ContentBlock.id == FileBlock.block_id)
+        .where(
+            FileBlock.content_id == content_id,
+            FileBlock.offset_bytes <= end,
+            FileBlock.offset_bytes + FileBlock.size_bytes > start,
+        )
+        .order_by(FileBlock.position)
+    ).all()
+
+
+# =========================
+# Block Quota
+# =========================
+
+def _charge_block_owner(db: Session, trip_id: str, size: int) -> str:
+    # The placement index picks the owner; the conditional update keeps
+    # concurrent writers from overcommitting that member.
+    for _ in range(max(1, settings.PLACEMENT_MAX_ATTEMPTS)):
+        try:
+            placement, = placement_engine.plan(db, trip_id, size, allow_split=False)
+        except PlacementError:
+            placement_engine.refresh(db, trip_id)
+            try:
+                placement, = placement_engine.plan(db, trip_id, size, allow_split=False)
+            except PlacementError:
+                raise Exception("No free storage available for a new block")
+
+        if charge_member(db, placement.member_id, size):
+            return placement.user_id
+
+        placement_engine.refresh(db, trip_id)
+
+    raise Exception("No free storage available for a new block")
+
+
+# =========================
+# Block Writer
+# =========================
+
+class _BlockWriter:
+    """
+    Uploads new blocks of one file a few at a time. Only the calling
+    thread touches the DB session; workers just talk to Drive.
+    """
+
+    def __init__(self, db: Session, content: FileContent):
+        self.db = db
+        self.trip_id = content.trip_id
+        self.content_id = content.id
+        self.created: Dict[str, ContentBlock] = {}
+
+        self._concurrency = max(1, settings.DEDUP_BLOCK_UPLOAD_CONCURRENCY)
+        self._pool = ThreadPoolExecutor(
+            max_workers=self._concurrency,
+            thread_name_prefix="block-upload",
+        )
+        self._inflight = {}
+        self._targets: Dict[str, Tuple[UserCloudAccount, object, str]] = {}
+
+    def _target(self, owner_user_id: str):
+        if owner_user_id not in self._targets:
+            account = (
+                self.db.query(UserCloudAccount)
+                .filter(
+                    UserCloudAccount.user_id == owner_user_id,
+                    UserCloudAccount.provider == "google_drive",
+                )
+                .first()
+            )
+            if not account:
+                raise Exception(f"User {owner_user_id} has no Google Drive linked")
+
+            drive = get_drive_client(account)
+            self._targets[owner_user_id] = (account, drive, resolve_app_folder_id(account, drive))
+
+        return self._targets[owner_user_id]
+
+    def add(self, block_hash: str, data: bytes) -> ContentBlock:
+        owner_user_id = _charge_block_owner(self.db, self.trip_id, len(data))
+
+        block = ContentBlock(
+            trip_id=self.trip_id,
+            hash=block_hash,
+            size_bytes=len(data),
+            owner_user_id=owner_user_id,
+            provider="PENDING",
+            provider_file_id="PENDING",
+            ref_count=0,
+            status="PENDING",
+        )
+        self.db.add(block)
+        self.db.flush()
+        reserve_block(self.db, self.trip_id, owner_user_id, self.content_id, block.id, len(data))
+        self.db.commit()
+        self.created[block_hash] = block
+
+        account, drive, folder_id = self._target(owner_user_id)
+        task = ChunkUploadTask(
+            chunk_id=block.id,
+            owner_user_id=owner_user_id,
+            account_id=account.id,
+            drive=drive,
+            folder_id=folder_id,
+            chunk_name=f"block_{block_hash}.bin",
+            offset_bytes=0,
+            size_bytes=len(data),
+        )
+        future = self._pool.submit(
+            upload_chunk_bytes,
+            task,
+            data,
+            part_size=settings.DRIVE_UPLOAD_PART_BYTES,
+        )
+        self._inflight[future] = block
+
+        # Bound the bytes held by queued uploads
+        while len(self._inflight) >= self._concurrency:
+            self._collect(FIRST_COMPLETED)
+
+        return block
+
+    def _collect(self, return_when):
+        done, _ = wait(self._inflight, return_when=return_when)
+        for future in done:
+            block = self._inflight.pop(future)
+            block.provider_file_id = future.result()
+            block.provider = "google_drive"
+            block.status = "READY"
+        self.db.commit()
+
+    def flush(self):
+        if self._inflight:
+            self._collect(ALL_COMPLETED)
+
+    def discard(self):
+        """
+        Cancels pending uploads and drops blocks created here that
+        nothing references, refunding their owners. Blocks that reached
+        Drive are queued for garbage collection.
+        """
+
+        for future in self._inflight:
+            future.cancel()
+        wait(self._inflight)
+        uploaded = {
+            block.id: future.result()
+            for future, block in self._inflight.items()
+            if not future.cancelled() and future.exception() is None
+        }
+        self._inflight.clear()
+
+        self.db.rollback()
+        finalize_reservations(self.db, self.content_id)
+        freed = Counter()
+        orphans = []
+        for block in self.created.values():
+            block_id, owner_user_id, size = block.id, block.owner_user_id, block.size_bytes
+            provider_file_id = uploaded.get(block_id)
+            if provider_file_id is None and block.provider_file_id != "PENDING":
+                provider_file_id = block.provider_file_id
+
+            dropped = self.db.execute(
+                delete(ContentBlock)
+                .where(ContentBlock.id == block_id, ContentBlock.ref_count == 0)
+            )
+            if dropped.rowcount == 1:
+                refund_member(self.db, self.trip_id, owner_user_id, size)
+                freed[owner_user_id] -= size
+                if provider_file_id:
+                    orphans.append({"id": block_id, "owner_user_id": owner_user_id, "provider_file_id": provider_file_id})
+        tombstone_objects(self.db, orphans)
+        self.db.commit()
+        placement_engine.record_usage(self.trip_id, freed)
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+
+
+# =========================
+# Store / Release
+# =========================
+
+def _link_blocks(db: Session, content: FileContent, refs: List[ContentBlock]):
+    # Take every reference at once; a block deleted in the meantime
+    # fails the whole file rather than leaving a hole in it
+    for block_id, count in Counter(block.id for block in refs).items():
+        linked = db.execute(
+            update(ContentBlock)
+            .where(ContentBlock.id == block_id, ContentBlock.status == "READY")
+            .values(ref_count=ContentBlock.ref_count + count)
+        )
+        if linked.rowcount != 1:
+            db.rollback()
+            raise MissingBlockError("A referenced block is no longer stored; negotiate the upload again")
+
+    offset = 0
+    for position, block in enumerate(refs):
+        db.add(
+            FileBlock(
+                content_id=content.id,
+                position=position,
+                block_id=block.id,
+                offset_bytes=offset,
+                size_bytes=block.size_bytes,
+            )
+        )
+        offset += block.size_bytes
+
+    if offset != content.size_bytes:
+        db.rollback()
+        raise Exception("Blocks do not add up to the file size")
+
+    content.status = "READY"
+    finalize_reservations(db, content.id)
+    db.commit()
+
+
+def store_file_blocks(
+    *,
+    db: Session,
+    content: FileContent,
+    blocks: Iterable[Tuple[str, bytes | None]],
+):
+    """
+    Stores a file as an ordered list of blocks.
+
+    blocks yields (sha256, data) in file order. Blocks the trip already
+    holds are referenced instead of uploaded; data may be None for a
+    block the client was told is already stored.
+    """
+
+    writer = _BlockWriter(db, content)
+    known: Dict[str, ContentBlock] = {}
+    refs: List[ContentBlock] = []
+
+    try:
+        for block_hash, data in blocks:
+            block = writer.created.get(block_hash) or known.get(block_hash)
+            if block is None:
+                block = find_ready_blocks(db, content.trip_id, [block_hash]).get(block_hash)
+                if block is not None:
+                    known[block_hash] = block
+
+            if block is None:
+                if data is None:
+                    raise MissingBlockError(f"Block {block_hash} is not stored in this trip")
+                block = writer.add(block_hash, data)
+
+            refs.append(block)
+
+        writer.flush()
+        _link_blocks(db, content, refs)
+
+    except Exception:
+        writer.discard()
+        raise
+
+    finally:
+        writer.close()
+
+    logger.info("Blocks stored for content %s: %d blocks, %d new", content.id, len(refs), len(writer.created))
+
+
+def release_blocks(db: Session, content_ids: List[str]) -> Dict[str, int]:
+    """
+    Drops every block reference of the given contents with a few
+    set-based statements. Blocks nobody references any more are
+    deleted. The caller refunds the returned bytes per owner and commits.
+    """
+
+    counts = dict(
+        db.execute(
+            select(FileBlock.block_id, func.count())
+            .where(FileBlock.content_id.in_(content_ids))
+            .group_by(FileBlock.block_id)
+        ).all()
+    )
+
+    db.execute(
+        delete(FileBlock)
+        .where(FileBlock.content_id.in_(content_ids))
+        .execution_options(synchronize_session=False)
+    )
+    if not counts:
+        return {}
+
+    block_ids = list(counts)
+    db.execute(
+        update(ContentBlock)
+        .where(ContentBlock.id.in_(block_ids))
+        .values(ref_count=ContentBlock.ref_count - case(counts, value=ContentBlock.id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+    unreferenced = (ContentBlock.id.in_(block_ids), ContentBlock.ref_count <= 0)
+    tombstone_blocks(db, *unreferenced)
+    freed = dict(
+        db.execute(
+            select(ContentBlock.owner_user_id, func.sum(ContentBlock.size_bytes))
+            .where(*unreferenced)
+            .group_by(ContentBlock.owner_user_id)
+        ).all()
+    )
+    db.execute(
+        delete(ContentBlock)
+        .where(*unreferenced)
+        .execution_options(synchronize_session=False)
+    )
+
+    return freed
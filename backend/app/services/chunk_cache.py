@@ -0,0 +1,216 @@
+import hashlib
+import mmap
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+from app.core.config import settings
+
+
+# =========================
+# Local Chunk Cache
+# =========================
+
+class ChunkCache:
+    """
+    Read-through cache of whole Drive objects (chunks, replicas, blocks,
+    shards) in a local directory, keyed by provider_file_id and evicted
+    least recently used once it holds more than max_bytes.
+
+    An object is written to a temporary file and renamed into place
+    only after its last byte arrived, so a partial fetch is never
+    served. Readers mmap the file they opened: evicting or discarding
+    an entry does not cut off a download that is streaming it.
+    """
+
+    _PARTIAL_SUFFIX = ".part"
+
+    def __init__(self, directory: str, *, max_bytes: int, max_entry_bytes: int, read_bytes: int):
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._max_entry_bytes = min(max_entry_bytes, max_bytes)
+        self._read_bytes = max(1, read_bytes)
+
+        # file name -> size, least recently used first
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self._max_bytes > 0
+
+    def _name(self, provider_file_id: str) -> str:
+        return hashlib.sha256(provider_file_id.encode()).hexdigest()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self._directory, name)
+
+    def _load(self):
+        # Entries left by an earlier run, oldest access first; partial
+        # files of interrupted fetches are removed. Called with the lock.
+        if self._loaded:
+            return
+        self._loaded = True
+
+        os.makedirs(self._directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self._directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith(self._PARTIAL_SUFFIX):
+                _unlink(entry.path)
+                continue
+            stat = entry.stat()
+            found.append((stat.st_atime, entry.name, stat.st_size))
+
+        for _, name, size in sorted(found):
+            self._entries[name] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self._max_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            _unlink(self._path(name))
+
+    def contains(self, provider_file_id: str) -> bool:
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._load()
+            return self._name(provider_file_id) in self._entries
+
+    def read(self, provider_file_id: str, start: int, end: int) -> Iterator[bytes] | None:
+        """
+        Bytes start..end (inclusive) of a cached object, or None if it
+        is not cached.
+        """
+
+        if not self.enabled:
+            return None
+
+        name = self._name(provider_file_id)
+        with self._lock:
+            self._load()
+            if name not in self._entries:
+                return None
+            try:
+                f = open(self._path(name), "rb")
+            except FileNotFoundError:
+                self._total_bytes -= self._entries.pop(name)
+                return None
+            self._entries.move_to_end(name)
+
+        return self._read_range(f, start, end)
+
+    def _read_range(self, f, start: int, end: int) -> Iterator[bytes]:
+        with f:
+            if end < start:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                for offset in range(start, end + 1, self._read_bytes):
+                    yield view[offset:min(offset + self._read_bytes, end + 1)]
+
+    def fill(self, provider_file_id: str, size: int, pieces: Iterable[bytes]) -> Iterable[bytes]:
+        """
+        Passes a whole object through, keeping a copy once all of it
+        has been read. Objects larger than max_entry_bytes pass
+        through uncached.
+        """
+
+        if not self.enabled or size > self._max_entry_bytes:
+            return pieces
+        return self._fill(provider_file_id, size, pieces)
+
+    def _open_partial(self):
+        with self._lock:
+            self._load()
+        fd, temp_path = tempfile.mkstemp(dir=self._directory, suffix=self._PARTIAL_SUFFIX)
+        return temp_path, os.fdopen(fd, "wb")
+
+    def _fill(self, provider_file_id: str, size: int, pieces: Iterable[bytes]) -> Iterator[bytes]:
+        temp_path, f = self._open_partial()
+
+        stored = False
+        try:
+            written = 0
+            with f:
+                for piece in pieces:
+                    f.write(piece)
+                    written += len(piece)
+                    yield piece
+
+            if written == size:
+                self._store(provider_file_id, temp_path, size)
+                stored = True
+        finally:
+            # Abandoned or failed reads leave nothing behind
+            if not stored:
+                _unlink(temp_path)
+
+    def fill_async(self, provider_file_id: str, size: int, pieces: AsyncIterable[bytes]) -> AsyncIterable[bytes]:
+        """fill() for the async download path."""
+
+        if not self.enabled or size > self._max_entry_bytes:
+            return pieces
+        return self._fill_async(provider_file_id, size, pieces)
+
+    async def _fill_async(self, provider_file_id: str, size: int, pieces: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+        temp_path, f = self._open_partial()
+
+        stored = False
+        try:
+            written = 0
+            with f:
+                async for piece in pieces:
+                    f.write(piece)
+                    written += len(piece)
+                    yield piece
+
+            if written == size:
+                self._store(provider_file_id, temp_path, size)
+                stored = True
+        finally:
+            if not stored:
+                _unlink(temp_path)
+
+    def _store(self, provider_file_id: str, temp_path: str, size: int):
+        name = self._name(provider_file_id)
+        with self._lock:
+            os.replace(temp_path, self._path(name))
+            self._total_bytes += size - self._entries.pop(name, 0)
+            self._entries[name] = size
+            self._evict()
+
+    def discard(self, provider_file_ids: Iterable[str]):
+        """Drops the entries of deleted Drive objects."""
+
+        if not self.enabled:
+            return
+        with self._lock:
+            self._load()
+            for provider_file_id in provider_file_ids:
+                name = self._name(provider_file_id)
+                if name in self._entries:
+                    self._total_bytes -= self._entries.pop(name)
+                    _unlink(self._path(name))
+
+
+def _unlink(path: str):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+chunk_cache = ChunkCache(
+    settings.CHUNK_CACHE_DIR,
+    max_bytes=settings.CHUNK_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.CHUNK_CACHE_MAX_ENTRY_BYTES,
+    read_bytes=settings.CHUNK_CACHE_READ_BYTES,
+)
@@ -0,0 +1,97 @@
+import zlib
+from typing import Callable, Iterator
+
+
+# =========================
+# Content-Defined Boundaries
+# =========================
+
+# A boundary may follow any ANCHOR_BYTE; it is taken when the CRC-32 of
+# the WINDOW_BYTES ending there passes the mask test. Searching for the
+# anchor runs at C speed (bytes.find), so only ~1/256 of the positions
+# are hashed - a per-byte rolling hash in Python would be CPU bound.
+CHUNKING_ALGORITHM = "anchor-crc32"
+ANCHOR_BYTE = 0x8F
+WINDOW_BYTES = 48
+
+
+def _cut_masks(avg_size: int):
+    # Normalized chunking: a stricter test below the average size and a
+    # looser one above it keeps block sizes close to the average.
+    bits = max(1, (avg_size // 256).bit_length() - 1)
+    strict = (1 << (bits + 1)) - 1
+    loose = (1 << max(0, bits - 1)) - 1
+    return strict, loose
+
+
+def find_cut_point(data, min_size: int, avg_size: int, max_size: int) -> int:
+    """
+    Length of the first content-defined block of data (at most max_size).
+    Returns len(data) if no boundary is found in what is available.
+    """
+
+    length = len(data)
+    if length <= min_size:
+        return length
+
+    end = min(length, max_size)
+    normal = min(avg_size, end)
+    strict, loose = _cut_masks(avg_size)
+
+    position = max(min_size, WINDOW_BYTES) - 1
+    while True:
+        index = data.find(ANCHOR_BYTE, position, end)
+        if index < 0:
+            return end
+
+        cut = index + 1
+        mask = strict if cut < normal else loose
+        if not zlib.crc32(data[cut - WINDOW_BYTES:cut]) & mask:
+            return cut
+
+        position = cut
+
+
+def iter_content_defined_blocks(
+    read: Callable[[int], bytes],
+    *,
+    min_size: int,
+    avg_size: int,
+    max_size: int,
+) -> Iterator[bytes]:
+    """
+    Splits a sequential stream into content-defined blocks. Inserting or
+    removing bytes only changes the blocks around the edit, so two
+    versions of a file still share most of their blocks.
+    """
+
+    buffer = bytearray()
+    eof = False
+
+    while True:
+        while not eof and len(buffer) < max_size:
+            data = read(max_size - len(buffer))
+            if not data:
+                eof = True
+            buffer += data
+
+        if not buffer:
+            return
+
+        cut = find_cut_point(buffer, min_size, avg_size, max_size)
+        block = bytes(buffer[:cut])
+        del buffer[:cut]
+        yield block
+
+
+def chunking_parameters(min_size: int, avg_size: int, max_size: int) -> dict:
+    return {
+        "algorithm": CHUNKING_ALGORITHM,
+        "anchor_byte": ANCHOR_BYTE,
+        "window_bytes": WINDOW_BYTES,
+        "strict_mask": _cut_masks(avg_size)[0],
+        "loose_mask": _cut_masks(avg_size)[1],
+        "min_bytes": min_size,
+        "avg_bytes": avg_size,
+        "max_bytes": max_size,
+    }
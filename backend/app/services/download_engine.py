@@ -0,0 +1,308 @@
+import asyncio
+import queue
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Iterable, Iterator, List
+
+from app.core.config import settings
+
+
+_END = object()
+
+
+# =========================
+# Prefetch Pipeline
+# =========================
+
+class _PrefetchPipeline:
+    """
+    Runs one producer thread per source, at most window + 1 at a time,
+    and caps the bytes buffered ahead of the consumer.
+
+    The source currently being consumed (the head) waits for the cap
+    only on its own buffered bytes, which the consumer is draining;
+    waiting on later sources would block the very data the consumer
+    needs. The buffer therefore never exceeds the cap by more than one
+    piece of the head.
+    """
+
+    def __init__(
+        self,
+        sources: List[Callable[[], Iterable[bytes]]],
+        *,
+        window: int,
+        max_buffer_bytes: int,
+    ):
+        self._sources = sources
+        self._window = max(0, window)
+        self._max_buffer_bytes = max(1, max_buffer_bytes)
+
+        self._slots = [queue.Queue() for _ in sources]
+        self._slot_bytes = [0] * len(sources)
+        self._started = 0
+        self._head = 0
+        self._buffered = 0
+        self._stopped = False
+        self._cond = threading.Condition()
+
+    # ---- producer side ----
+
+    def _must_wait(self, index: int, size: int) -> bool:
+        if self._buffered + size <= self._max_buffer_bytes:
+            return False
+        if index == self._head:
+            return self._slot_bytes[index] > 0
+        return self._buffered > 0
+
+    def _reserve(self, index: int, size: int) -> bool:
+        with self._cond:
+            while not self._stopped and self._must_wait(index, size):
+                self._cond.wait()
+
+            if self._stopped:
+                return False
+
+            self._buffered += size
+            self._slot_bytes[index] += size
+            return True
+
+    def _produce(self, index: int):
+        slot = self._slots[index]
+        try:
+            for data in self._sources[index]():
+                if not self._reserve(index, len(data)):
+                    return
+                slot.put(data)
+            slot.put(_END)
+        except Exception as e:
+            slot.put(e)
+
+    def _start_producers(self):
+        last = min(len(self._sources), self._head + self._window + 1)
+        while self._started < last:
+            threading.Thread(
+                target=self._produce,
+                args=(self._started,),
+                name=f"chunk-prefetch-{self._started}",
+                daemon=True,
+            ).start()
+            self._started += 1
+
+    # ---- consumer side ----
+
+    def iter_bytes(self) -> Iterator[bytes]:
+        try:
+            for index in range(len(self._sources)):
+                with self._cond:
+                    self._head = index
+                    self._cond.notify_all()
+                self._start_producers()
+
+                slot = self._slots[index]
+                while True:
+                    item = slot.get()
+                    if item is _END:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+
+                    with self._cond:
+                        self._buffered -= len(item)
+                        self._slot_bytes[index] -= len(item)
+                        self._cond.notify_all()
+
+                    yield item
+        finally:
+            self.stop()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+def prefetch_ordered(
+    sources: List[Callable[[], Iterable[bytes]]],
+    *,
+    window: int,
+    max_buffer_bytes: int,
+) -> Iterator[bytes]:
+    """
+    Yields the bytes of every source strictly in list order, while the
+    next `window` sources are already being fetched in the background.
+
+    Each source is a zero-argument callable returning an iterable of
+    bytes; it is only called from its producer thread.
+    """
+
+    return _PrefetchPipeline(
+        sources,
+        window=window,
+        max_buffer_bytes=max_buffer_bytes,
+    ).iter_bytes()
+
+
+async def prefetch_ordered_async(
+    sources: List[Callable[[], AsyncIterator[bytes]]],
+    *,
+    window: int,
+    max_buffer_bytes: int,
+) -> AsyncIterator[bytes]:
+    """
+    Event-loop counterpart of prefetch_ordered for async sources: the
+    producers are tasks instead of threads, with the same window and
+    buffer cap (the head source waits only on its own buffered bytes).
+    """
+
+    slots = [asyncio.Queue() for _ in sources]
+    slot_bytes = [0] * len(sources)
+    space = asyncio.Condition()
+    buffered = 0
+    head = 0
+    producers = []
+
+    def _has_space(index: int, size: int) -> bool:
+        if buffered + size <= max_buffer_bytes:
+            return True
+        if index == head:
+            return slot_bytes[index] == 0
+        return buffered == 0
+
+    async def _produce(index: int):
+        nonlocal buffered
+        slot = slots[index]
+        try:
+            async for data in sources[index]():
+                async with space:
+                    await space.wait_for(lambda: _has_space(index, len(data)))
+                    buffered += len(data)
+                    slot_bytes[index] += len(data)
+                slot.put_nowait(data)
+            slot.put_nowait(_END)
+        except Exception as e:
+            slot.put_nowait(e)
+
+    try:
+        for index in range(len(sources)):
+            async with space:
+                head = index
+                space.notify_all()
+            while len(producers) < min(len(sources), index + max(0, window) + 1):
+                producers.append(asyncio.create_task(_produce(len(producers))))
+
+            while True:
+                item = await slots[index].get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+
+                async with space:
+                    buffered -= len(item)
+                    slot_bytes[index] -= len(item)
+                    space.notify_all()
+
+                yield item
+    finally:
+        for producer in producers:
+            producer.cancel()
+
+
+# =========================
+# Hedged Reads
+# =========================
+
+class LatencyTracker:
+    """
+    Recent first-byte latencies of chunk reads. The hedge delay is the
+    configured percentile of them, so only the slow tail of reads ever
+    starts a second request.
+    """
+
+    def __init__(self, *, percentile: float, min_delay: float, default_delay: float, window: int = 512):
+        self._percentile = min(max(percentile, 0.0), 100.0)
+        self._min_delay = min_delay
+        self._default_delay = default_delay
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def hedge_delay(self) -> float:
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < 20:
+            return self._default_delay
+        position = min(len(samples) - 1, int(len(samples) * self._percentile / 100))
+        return max(self._min_delay, samples[position])
+
+
+read_latency = LatencyTracker(
+    percentile=settings.HEDGE_LATENCY_PERCENTILE,
+    min_delay=settings.HEDGE_MIN_DELAY_MS / 1000,
+    default_delay=settings.HEDGE_DEFAULT_DELAY_MS / 1000,
+)
+
+
+def hedged_source(
+    replicas: List[Callable[[], Iterable[bytes]]],
+    *,
+    tracker: LatencyTracker = read_latency,
+) -> Callable[[], Iterator[bytes]]:
+    """
+    Combines sources holding the same bytes into one source. The first
+    replica is asked; if it has not produced its first piece within the
+    tracker's hedge delay (or fails), the next one is started as well,
+    and the bytes of whichever answers first are streamed. The other
+    request is abandoned after its first piece.
+    """
+
+    if len(replicas) == 1:
+        return replicas[0]
+
+    def _source():
+        answers = queue.Queue()
+        delay = tracker.hedge_delay()
+
+        def _start(index: int):
+            begun = time.monotonic()
+
+            def _first_piece():
+                try:
+                    iterator = iter(replicas[index]())
+                    first = next(iterator, b"")
+                    answers.put((first, iterator, None, time.monotonic() - begun))
+                except Exception as e:
+                    answers.put((None, None, e, None))
+
+            threading.Thread(target=_first_piece, name=f"hedged-read-{index}", daemon=True).start()
+
+        _start(0)
+        started, running = 1, 1
+        while True:
+            try:
+                timeout = delay if started < len(replicas) else None
+                first, iterator, error, elapsed = answers.get(timeout=timeout)
+            except queue.Empty:
+                _start(started)
+                started, running = started + 1, running + 1
+                continue
+
+            running -= 1
+            if error is None:
+                tracker.record(elapsed)
+                if first:
+                    yield first
+                yield from iterator
+                return
+
+            if started < len(replicas):
+                _start(started)
+                started, running = started + 1, running + 1
+            elif running == 0:
+                raise error
+
+    return _source
@@ -0,0 +1,147 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.core.config import settings
+
+
+# =========================
+# Drive Batch Requests
+# =========================
+
+RequestBuilder = Callable[[Any], Any]
+
+
+class _PendingBatch:
+    def __init__(self, drive):
+        self.drive = drive
+        self.opened_at = time.monotonic()
+        self.calls: List[Tuple[RequestBuilder, Future]] = []
+
+
+class DriveBatcher:
+    """
+    Collects Drive metadata calls per cloud account and sends them
+    through the Drive batch endpoint: a batch goes out once it holds
+    max_requests calls or its oldest call has waited window_seconds.
+    Batches are keyed by account ID rather than by client, because the
+    pool rebuilds an account's client when its tokens change.
+
+    Callers pass a builder, build(drive) -> HttpRequest, rather than a
+    request: requests are built on the thread that sends the batch, so
+    each one gets that thread's connection from the client pool.
+    Media uploads and downloads cannot be batched by Drive.
+    """
+
+    def __init__(self, *, max_requests: int, window_seconds: float, max_workers: int = 4):
+        self._max_requests = max(1, min(max_requests, 100))
+        self._window_seconds = max(0.0, window_seconds)
+
+        self._pending: Dict[str, _PendingBatch] = {}
+        self._cond = threading.Condition()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="drive-batch")
+        self._timer: threading.Thread | None = None
+
+    def submit(self, account_id: str, drive, build: RequestBuilder) -> Future:
+        """
+        Queues one call for the account. The future resolves to the
+        call's response or raises its HttpError.
+        """
+
+        future: Future = Future()
+        with self._cond:
+            batch = self._pending.get(account_id)
+            if batch is None:
+                batch = _PendingBatch(drive)
+                self._pending[account_id] = batch
+            else:
+                # Send with the account's newest client
+                batch.drive = drive
+            batch.calls.append((build, future))
+
+            if len(batch.calls) >= self._max_requests:
+                del self._pending[account_id]
+                self._pool.submit(self._send, batch)
+            else:
+                self._ensure_timer()
+                self._cond.notify_all()
+
+        return future
+
+    def execute(self, account_id: str, drive, build: RequestBuilder):
+        """Batched equivalent of build(drive).execute()."""
+
+        return self.submit(account_id, drive, build).result()
+
+    # ---- flushing ----
+
+    def _ensure_timer(self):
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._flush_due, name="drive-batch-timer", daemon=True)
+            self._timer.start()
+
+    def _flush_due(self):
+        with self._cond:
+            while self._pending:
+                now = time.monotonic()
+                oldest = min(batch.opened_at for batch in self._pending.values())
+                wait = oldest + self._window_seconds - now
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+
+                for key, batch in list(self._pending.items()):
+                    if batch.opened_at + self._window_seconds <= now:
+                        del self._pending[key]
+                        self._pool.submit(self._send, batch)
+
+            self._timer = None
+
+    def flush(self):
+        """Sends every pending batch now."""
+
+        with self._cond:
+            batches = list(self._pending.values())
+            self._pending.clear()
+        for batch in batches:
+            self._pool.submit(self._send, batch)
+
+    def _send(self, batch: _PendingBatch):
+        calls = [(str(index), build, future) for index, (build, future) in enumerate(batch.calls)]
+        futures = {request_id: future for request_id, _, future in calls}
+
+        def _on_response(request_id, response, exception):
+            future = futures.pop(request_id)
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(response)
+
+        try:
+            if len(calls) == 1:
+                # A batch of one only adds overhead
+                _, build, future = calls[0]
+                future.set_result(build(batch.drive).execute())
+                futures.clear()
+                return
+
+            http_batch = batch.drive.new_batch_http_request(callback=_on_response)
+            for request_id, build, _ in calls:
+                http_batch.add(build(batch.drive), request_id=request_id)
+            http_batch.execute()
+        except Exception as e:
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(Exception("Drive batch returned no response for this call"))
+
+
+drive_batcher = DriveBatcher(
+    max_requests=settings.DRIVE_BATCH_MAX_REQUESTS,
+    window_seconds=settings.DRIVE_BATCH_WINDOW_MS / 1000,
+)
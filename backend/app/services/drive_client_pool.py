@@ -0,0 +1,140 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import google_auth_httplib2
+import httplib2
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.http import HttpRequest
+
+from app.core.config import settings
+from app.models.user_cloud_account import UserCloudAccount
+from app.services.drive_rate_limit import RateLimitedHttp, rate_limiter_for
+
+
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive.appdata"]
+
+_discovery_doc = None
+_discovery_lock = threading.Lock()
+
+
+def _drive_discovery_doc() -> dict:
+    """
+    Drive v3 discovery document bundled with google-api-python-client,
+    parsed once per process (never fetched over the network).
+    """
+
+    global _discovery_doc
+    with _discovery_lock:
+        if _discovery_doc is None:
+            _discovery_doc = json.loads(get_static_doc("drive", "v3"))
+        return _discovery_doc
+
+
+def build_credentials(account: UserCloudAccount) -> Credentials:
+    return Credentials(
+        token=account.access_token,
+        refresh_token=account.refresh_token,
+        token_uri="https://oauth2.googleapis.com/token",
+        client_id=None,       # handled internally
+        client_secret=None,
+        scopes=DRIVE_SCOPES,
+    )
+
+
+class _PooledClient:
+    """
+    One Drive service object per account. httplib2 connections are not
+    thread-safe, so every thread gets its own authorized Http (reused
+    across that thread's requests) through the request builder. All of
+    them share the account's rate limiter.
+    """
+
+    def __init__(self, account: UserCloudAccount):
+        self.limiter = rate_limiter_for(account.id)
+        self.fingerprint = (account.access_token, account.refresh_token)
+        self.credentials = build_credentials(account)
+        self.last_used = time.monotonic()
+        self._local = threading.local()
+
+        self.service = build_from_document(
+            _drive_discovery_doc(),
+            http=self._thread_http(),
+            requestBuilder=self._build_request,
+        )
+
+    def _thread_http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = RateLimitedHttp(
+                google_auth_httplib2.AuthorizedHttp(
+                    self.credentials,
+                    http=httplib2.Http(),
+                ),
+                self.limiter,
+            )
+            self._local.http = http
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        return HttpRequest(self._thread_http(), *args, **kwargs)
+
+
+# =========================
+# Client Pool
+# =========================
+
+class DriveClientPool:
+    """
+    Process-wide Drive clients keyed by UserCloudAccount.id.
+
+    Clients idle for longer than idle_ttl_seconds are dropped, the
+    least recently used one is evicted once max_size is reached, and a
+    client is rebuilt when the account's tokens change.
+    """
+
+    def __init__(self, *, max_size: int, idle_ttl_seconds: float):
+        self._max_size = max(1, max_size)
+        self._idle_ttl_seconds = idle_ttl_seconds
+        self._clients: "OrderedDict[str, _PooledClient]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, account: UserCloudAccount):
+        now = time.monotonic()
+        fingerprint = (account.access_token, account.refresh_token)
+
+        with self._lock:
+            self._evict_idle(now)
+
+            client = self._clients.get(account.id)
+            if client is None or client.fingerprint != fingerprint:
+                client = _PooledClient(account)
+                self._clients[account.id] = client
+
+            client.last_used = now
+            self._clients.move_to_end(account.id)
+
+            while len(self._clients) > self._max_size:
+                self._clients.popitem(last=False)
+
+            return client.service
+
+    def invalidate(self, account_id: str):
+        with self._lock:
+            self._clients.pop(account_id, None)
+
+    def _evict_idle(self, now: float):
+        while self._clients:
+            account_id, client = next(iter(self._clients.items()))
+            if now - client.last_used < self._idle_ttl_seconds:
+                break
+            del self._clients[account_id]
+
+
+drive_client_pool = DriveClientPool(
+    max_size=settings.DRIVE_CLIENT_POOL_SIZE,
+    idle_ttl_seconds=settings.DRIVE_CLIENT_IDLE_TTL_SECONDS,
+)
@@ -0,0 +1,279 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+
+from sqlalchemy import select, insert, update, delete
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.chunk_replica import ChunkReplica
+from app.models.content_block import ContentBlock
+from app.models.drive_tombstone import DriveTombstone
+from app.models.file_chunk import FileChunk
+from app.models.file_shard import FileShard
+from app.models.user_cloud_account import UserCloudAccount
+from app.services.chunk_cache import chunk_cache
+from app.services.google_drive_service import get_drive_client, is_not_found
+from app.services.drive_batch import drive_batcher
+
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Tombstones
+# =========================
+# Written in the caller's transaction, right before the rows that own
+# the Drive objects are deleted, so a committed delete always leaves
+# something for the collector to reclaim.
+
+_TOMBSTONE_COLUMNS = ["id", "owner_user_id", "provider", "provider_file_id"]
+
+
+def _tombstone(db: Session, query):
+    db.execute(insert(DriveTombstone).from_select(_TOMBSTONE_COLUMNS, query))
+    # Deleted objects must not be served from the local cache any more
+    if chunk_cache.enabled:
+        chunk_cache.discard(row.provider_file_id for row in db.execute(query))
+
+
+def tombstone_chunks(db: Session, content_ids: List[str]):
+    """Queues the uploaded chunks of the given contents for deletion."""
+
+    _tombstone(
+        db,
+        select(FileChunk.id, FileChunk.owner_user_id, FileChunk.provider, FileChunk.provider_file_id)
+        .where(FileChunk.content_id.in_(content_ids), FileChunk.provider_file_id != "PENDING"),
+    )
+
+
+def tombstone_shards(db: Session, content_ids: List[str]):
+    """Queues the uploaded stripe shards of the given contents for deletion."""
+
+    _tombstone(
+        db,
+        select(FileShard.id, FileShard.owner_user_id, FileShard.provider, FileShard.provider_file_id)
+        .where(FileShard.content_id.in_(content_ids), FileShard.provider_file_id != "PENDING"),
+    )
+
+
+def tombstone_blocks(db: Session, *criteria):
+    """Queues the uploaded blocks matching criteria for deletion."""
+
+    _tombstone(
+        db,
+        select(ContentBlock.id, ContentBlock.owner_user_id, ContentBlock.provider, ContentBlock.provider_file_id)
+        .where(*criteria, ContentBlock.provider_file_id != "PENDING"),
+    )
+
+
+def tombstone_replicas(db: Session, *criteria):
+    """Queues the chunk replicas matching criteria for deletion."""
+
+    _tombstone(
+        db,
+        select(ChunkReplica.id, ChunkReplica.owner_user_id, ChunkReplica.provider, ChunkReplica.provider_file_id)
+        .where(*criteria),
+    )
+
+
+def tombstone_objects(db: Session, objects: Iterable[dict]):
+    """Queues objects that never made it into a committed row."""
+
+    rows = [dict(provider="google_drive", **obj) for obj in objects]
+    if rows:
+        db.execute(insert(DriveTombstone), rows)
+
+
+# =========================
+# Garbage Collector
+# =========================
+
+class _OwnerTokenBuckets:
+    """
+    Per-owner token buckets for Drive deletes. take() never blocks: it
+    grants what the bucket holds now and the rest waits for a later
+    round. Owners with an empty bucket are skipped when picking due
+    tombstones, so one busy Drive cannot stall the others.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self._rate = max(rate, 0.001)
+        self._capacity = max(1, capacity)
+        self._buckets: Dict[str, tuple] = {}
+
+    def _tokens(self, key: str, now: float) -> float:
+        tokens, last = self._buckets.get(key, (self._capacity, now))
+        return min(self._capacity, tokens + (now - last) * self._rate)
+
+    def take(self, key: str, wanted: int) -> int:
+        now = time.monotonic()
+        tokens = self._tokens(key, now)
+
+        granted = min(wanted, int(tokens))
+        self._buckets[key] = (tokens - granted, now)
+        return granted
+
+    def exhausted(self) -> List[str]:
+        now = time.monotonic()
+        return [key for key in self._buckets if self._tokens(key, now) < 1]
+
+
+class DriveGarbageCollector:
+    """
+    Background thread draining drive_tombstones. Due tombstones are
+    grouped by owner and deleted through the Drive batcher; failures
+    are retried with exponential backoff.
+
+    Objects already missing on Drive count as deleted, so several
+    processes collecting the same rows is harmless.
+    """
+
+    def __init__(
+        self,
+        *,
+        interval_seconds: float,
+        batch_size: int,
+        deletes_per_second: float,
+        max_backoff_seconds: int,
+    ):
+        self._interval_seconds = interval_seconds
+        self._batch_size = max(1, min(batch_size, 100))
+        self._max_backoff_seconds = max_backoff_seconds
+        self._buckets = _OwnerTokenBuckets(deletes_per_second, self._batch_size)
+
+        self._stopped = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="drive-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float | None = None):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                collected = self.collect_once()
+            except Exception as e:
+                logger.exception("Drive garbage collection failed")
+                collected = 0
+
+            # Keep draining while full batches are coming back
+            if collected < self._batch_size:
+                self._stopped.wait(self._interval_seconds)
+
+    def collect_once(self) -> int:
+        """
+        Deletes one batch of due tombstones. Returns how many Drive
+        objects were reclaimed.
+        """
+
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            due = db.execute(
+                select(DriveTombstone)
+                .where(
+                    DriveTombstone.next_attempt_at <= now,
+                    DriveTombstone.owner_user_id.notin_(self._buckets.exhausted()),
+                )
+                .order_by(DriveTombstone.next_attempt_at)
+                .limit(self._batch_size)
+            ).scalars().all()
+            if not due:
+                return 0
+
+            by_owner: Dict[str, List[DriveTombstone]] = defaultdict(list)
+            for tombstone in due:
+                by_owner[tombstone.owner_user_id].append(tombstone)
+
+            accounts = {
+                account.user_id: account
+                for account in db.query(UserCloudAccount).filter(
+                    UserCloudAccount.user_id.in_(list(by_owner)),
+                    UserCloudAccount.provider == "google_drive",
+                )
+            }
+
+            done: List[str] = []
+            failed: Dict[str, Exception] = {}
+            for owner_user_id, tombstones in by_owner.items():
+                account = accounts.get(owner_user_id)
+                if not account:
+                    # Drive unlinked: nothing left that we can delete
+                    done.extend(tombstone.id for tombstone in tombstones)
+                    continue
+
+                granted = self._buckets.take(owner_user_id, len(tombstones))
+                if granted:
+                    outcome = self._delete_batch(account, tombstones[:granted])
+                    done.extend(tombstone_id for tombstone_id, error in outcome.items() if error is None)
+                    failed.update((tombstone_id, error) for tombstone_id, error in outcome.items() if error is not None)
+
+            if done:
+                db.execute(
+                    delete(DriveTombstone)
+                    .where(DriveTombstone.id.in_(done))
+                    .execution_options(synchronize_session=False)
+                )
+            for tombstone in due:
+                if tombstone.id in failed:
+                    self._schedule_retry(db, tombstone, failed[tombstone.id], now)
+            db.commit()
+
+            if done or failed:
+                logger.info("Drive GC deleted %d objects, %d failed", len(done), len(failed))
+            return len(done)
+        finally:
+            db.close()
+
+    def _delete_batch(self, account: UserCloudAccount, tombstones: List[DriveTombstone]) -> Dict[str, Exception | None]:
+        """Deletes tombstoned objects of one account through the Drive batcher."""
+
+        drive = get_drive_client(account)
+        futures = {
+            tombstone.id: drive_batcher.submit(
+                account.id,
+                drive,
+                lambda d, file_id=tombstone.provider_file_id: d.files().delete(fileId=file_id),
+            )
+            for tombstone in tombstones
+        }
+
+        outcome: Dict[str, Exception | None] = {}
+        for tombstone_id, future in futures.items():
+            error = future.exception()
+            outcome[tombstone_id] = None if error is None or is_not_found(error) else error
+
+        return outcome
+
+    def _schedule_retry(self, db: Session, tombstone: DriveTombstone, error: Exception, now: datetime):
+        backoff = min(self._interval_seconds * 2 ** tombstone.attempts, self._max_backoff_seconds)
+        db.execute(
+            update(DriveTombstone)
+            .where(DriveTombstone.id == tombstone.id)
+            .values(
+                attempts=DriveTombstone.attempts + 1,
+                next_attempt_at=now + timedelta(seconds=backoff),
+                last_error=str(error)[:500],
+            )
+        )
+
+
+drive_garbage_collector = DriveGarbageCollector(
+    interval_seconds=settings.DRIVE_GC_INTERVAL_SECONDS,
+    batch_size=settings.DRIVE_GC_BATCH_SIZE,
+    deletes_per_second=settings.DRIVE_GC_DELETES_PER_SECOND,
+    max_backoff_seconds=settings.DRIVE_GC_MAX_BACKOFF_SECONDS,
+)
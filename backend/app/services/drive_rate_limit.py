@@ -0,0 +1,213 @@
+import asyncio
+import random
+import socket
+import threading
+import time
+from typing import Dict
+
+import httplib2
+
+from app.core.config import settings
+
+
+# =========================
+# Adaptive Rate Limiter
+# =========================
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose refill rate follows AIMD: every successful call
+    adds roughly increase_per_second to the rate over a second of
+    traffic, and a throttled call (429 / rate-limit 403) multiplies it
+    by decrease_factor, at most once per second so a burst of 429s from
+    the same moment counts as one signal.
+
+    The rate settles just below what Google accepts for the account.
+    """
+
+    def __init__(
+        self,
+        *,
+        initial_rate: float,
+        min_rate: float,
+        max_rate: float,
+        burst: int,
+        increase_per_second: float,
+        decrease_factor: float,
+    ):
+        self._min_rate = max(min_rate, 0.01)
+        self._max_rate = max(max_rate, self._min_rate)
+        self._rate = min(max(initial_rate, self._min_rate), self._max_rate)
+        self._burst = max(1, burst)
+        self._increase = increase_per_second
+        self._decrease_factor = decrease_factor
+
+        self._tokens = float(self._burst)
+        self._refilled_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def _refill(self, now: float):
+        self._tokens = min(self._burst, self._tokens + (now - self._refilled_at) * self._rate)
+        self._refilled_at = now
+
+    def _take(self, cost: int) -> float:
+        # Takes the tokens and returns 0, or returns how long to wait.
+        # A batch may cost more than the burst; it waits for a full
+        # bucket and leaves it in debt
+        needed = min(cost, self._burst)
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if self._tokens >= needed:
+                self._tokens -= cost
+                return 0.0
+            return (needed - self._tokens) / self._rate
+
+    def acquire(self, cost: int = 1):
+        while True:
+            delay = self._take(cost)
+            if not delay:
+                return
+            time.sleep(delay)
+
+    async def acquire_async(self, cost: int = 1):
+        while True:
+            delay = self._take(cost)
+            if not delay:
+                return
+            await asyncio.sleep(delay)
+
+    def on_success(self, cost: int = 1):
+        with self._lock:
+            self._rate = min(self._max_rate, self._rate + self._increase * cost / self._rate)
+
+    def on_throttled(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._decreased_at < 1.0:
+                return
+            self._decreased_at = now
+            self._refill(now)
+            self._rate = max(self._min_rate, self._rate * self._decrease_factor)
+            self._tokens = min(self._tokens, 0.0)
+
+
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def rate_limiter_for(account_id: str) -> AdaptiveRateLimiter:
+    """
+    One limiter per cloud account, shared by every thread and kept
+    when the account's Drive client is rebuilt.
+    """
+
+    with _limiters_lock:
+        limiter = _limiters.get(account_id)
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(
+                initial_rate=settings.DRIVE_RATE_INITIAL_PER_SECOND,
+                min_rate=settings.DRIVE_RATE_MIN_PER_SECOND,
+                max_rate=settings.DRIVE_RATE_MAX_PER_SECOND,
+                burst=settings.DRIVE_RATE_BURST,
+                increase_per_second=settings.DRIVE_RATE_INCREASE_PER_SECOND,
+                decrease_factor=settings.DRIVE_RATE_DECREASE_FACTOR,
+            )
+            _limiters[account_id] = limiter
+        return limiter
+
+
+# =========================
+# Rate-Limited Http
+# =========================
+
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "DELETE"}
+_RETRYABLE_STATUSES = {408, 500, 502, 503, 504}
+_CONNECTION_ERRORS = (httplib2.HttpLib2Error, ConnectionError, TimeoutError, socket.timeout)
+
+
+def _is_throttled(resp, content) -> bool:
+    if resp.status == 429:
+        return True
+    # Drive reports per-user limits as 403 rateLimitExceeded /
+    # userRateLimitExceeded
+    if resp.status == 403 and content:
+        text = content if isinstance(content, bytes) else str(content).encode()
+        return b"ateLimitExceeded" in text
+    return False
+
+
+def _request_cost(uri: str, body) -> int:
+    # Every call inside a batch request counts against the quota
+    if "/batch/" in uri and isinstance(body, (bytes, str)):
+        marker = b"Content-ID:" if isinstance(body, bytes) else "Content-ID:"
+        return max(1, body.count(marker))
+    return 1
+
+
+def retry_delay(attempt: int, resp=None) -> float:
+    # Full jitter: uniform in [0, base * 2^attempt], honouring Retry-After
+    delay = random.uniform(0, min(settings.DRIVE_RETRY_MAX_DELAY_SECONDS, settings.DRIVE_RETRY_BASE_DELAY_SECONDS * 2 ** attempt))
+    retry_after = resp.get("retry-after") if resp is not None else None
+    if retry_after and retry_after.isdigit():
+        delay = max(delay, min(int(retry_after), settings.DRIVE_RETRY_MAX_DELAY_SECONDS))
+    return delay
+
+
+class RateLimitedHttp:
+    """
+    Wraps an authorized Http so every Drive request of the account -
+    API calls, batch requests, resumable upload parts and media
+    downloads - takes a token from the account's limiter first.
+
+    Throttled requests were not executed by Drive and are retried for
+    any method; 5xx and connection errors are only retried for
+    idempotent methods. Bodies that are streams are never resent.
+    """
+
+    def __init__(self, http, limiter: AdaptiveRateLimiter):
+        self._http = http
+        self._limiter = limiter
+
+    def __getattr__(self, name):
+        # credentials, timeout, redirect_codes, ... of the wrapped Http
+        if name == "_http":
+            raise AttributeError(name)
+        return getattr(self._http, name)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        cost = _request_cost(uri, body)
+        replayable = body is None or isinstance(body, (bytes, str))
+        idempotent = method.upper() in _IDEMPOTENT_METHODS
+
+        attempt = 0
+        while True:
+            self._limiter.acquire(cost)
+            try:
+                resp, content = self._http.request(uri, method, body=body, headers=headers, **kwargs)
+            except _CONNECTION_ERRORS:
+                if not (idempotent and replayable) or attempt >= settings.DRIVE_RETRY_MAX_ATTEMPTS:
+                    raise
+                time.sleep(retry_delay(attempt))
+                attempt += 1
+                continue
+
+            if _is_throttled(resp, content):
+                self._limiter.on_throttled()
+                retry = replayable
+            elif resp.status in _RETRYABLE_STATUSES:
+                retry = idempotent and replayable
+            else:
+                self._limiter.on_success(cost)
+                return resp, content
+
+            if not retry or attempt >= settings.DRIVE_RETRY_MAX_ATTEMPTS:
+                return resp, content
+
+            time.sleep(retry_delay(attempt, resp))
+            attempt += 1
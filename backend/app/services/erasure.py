@@ -0,0 +1,147 @@
+import threading
+from typing import Dict, List, Tuple
+
+
+# =========================
+# GF(256) Arithmetic
+# =========================
+# Field with the primitive polynomial x^8 + x^4 + x^3 + x^2 + 1 (0x11d).
+# Multiplying a whole cell by a constant is a bytes.translate() with a
+# precomputed table and adding cells is an XOR of big integers, so the
+# per-byte work stays in C.
+
+_EXP = [0] * 512
+_LOG = [0] * 256
+
+_value = 1
+for _power in range(255):
+    _EXP[_power] = _value
+    _LOG[_value] = _power
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+for _power in range(255, 512):
+    _EXP[_power] = _EXP[_power - 255]
+
+
+def gf_mul(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def gf_inv(a: int) -> int:
+    if a == 0:
+        raise ZeroDivisionError("0 has no inverse in GF(256)")
+    return _EXP[255 - _LOG[a]]
+
+
+_MUL_TABLES = [bytes(gf_mul(c, x) for x in range(256)) for c in range(256)]
+
+
+def _combine(coefficients: List[int], cells: List[bytes], size: int) -> bytes:
+    # sum(c_i * cell_i) over GF(256)
+    accumulator = 0
+    for coefficient, cell in zip(coefficients, cells):
+        if coefficient == 0:
+            continue
+        scaled = cell if coefficient == 1 else cell.translate(_MUL_TABLES[coefficient])
+        accumulator ^= int.from_bytes(scaled, "little")
+    return accumulator.to_bytes(size, "little")
+
+
+def _invert(matrix: List[List[int]]) -> List[List[int]]:
+    # Gauss-Jordan elimination over GF(256)
+    n = len(matrix)
+    rows = [list(row) + [1 if i == j else 0 for j in range(n)] for i, row in enumerate(matrix)]
+
+    for column in range(n):
+        pivot = next((r for r in range(column, n) if rows[r][column]), None)
+        if pivot is None:
+            raise ValueError("Matrix is singular")
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+
+        scale = gf_inv(rows[column][column])
+        rows[column] = [gf_mul(scale, value) for value in rows[column]]
+
+        for r in range(n):
+            factor = rows[r][column]
+            if r != column and factor:
+                rows[r] = [value ^ gf_mul(factor, pivot_value) for value, pivot_value in zip(rows[r], rows[column])]
+
+    return [row[n:] for row in rows]
+
+
+# =========================
+# Reed-Solomon Codec
+# =========================
+
+class ReedSolomon:
+    """
+    Systematic Reed-Solomon code over GF(256) with k data and m parity
+    shards. Parity rows form a Cauchy matrix, so any k of the k + m
+    shards are enough to rebuild the data.
+
+    Works on one stripe at a time: k equally sized data cells in,
+    m parity cells out.
+    """
+
+    def __init__(self, data_shards: int, parity_shards: int):
+        if data_shards < 1 or parity_shards < 0 or data_shards + parity_shards > 256:
+            raise ValueError("Invalid shard counts")
+
+        self.data_shards = data_shards
+        self.parity_shards = parity_shards
+
+        identity = [[1 if i == j else 0 for j in range(data_shards)] for i in range(data_shards)]
+        cauchy = [
+            [gf_inv((data_shards + j) ^ i) for i in range(data_shards)]
+            for j in range(parity_shards)
+        ]
+        self._matrix = identity + cauchy
+
+        self._inverses: Dict[Tuple[int, ...], List[List[int]]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def total_shards(self) -> int:
+        return self.data_shards + self.parity_shards
+
+    def encode(self, data_cells: List[bytes]) -> List[bytes]:
+        """Returns the m parity cells of one stripe."""
+
+        size = len(data_cells[0])
+        return [
+            _combine(self._matrix[self.data_shards + j], data_cells, size)
+            for j in range(self.parity_shards)
+        ]
+
+    def _decode_matrix(self, indexes: Tuple[int, ...]) -> List[List[int]]:
+        with self._lock:
+            inverse = self._inverses.get(indexes)
+            if inverse is None:
+                inverse = _invert([self._matrix[index] for index in indexes])
+                self._inverses[indexes] = inverse
+            return inverse
+
+    def decode(self, cells: Dict[int, bytes]) -> List[bytes]:
+        """
+        Rebuilds the k data cells of a stripe from any k cells, given
+        as {shard_index: cell}.
+        """
+
+        if all(index in cells for index in range(self.data_shards)):
+            return [cells[index] for index in range(self.data_shards)]
+
+        indexes = tuple(sorted(cells)[:self.data_shards])
+        if len(indexes) < self.data_shards:
+            raise ValueError("Not enough shards to rebuild the stripe")
+
+        inverse = self._decode_matrix(indexes)
+        available = [cells[index] for index in indexes]
+        size = len(available[0])
+
+        return [
+            cells[i] if i in cells else _combine(inverse[i], available, size)
+            for i in range(self.data_shards)
+        ]
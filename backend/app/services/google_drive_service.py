@@ -1,71 +1,187 @@
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaInMemoryUpload, MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload
 
+from app.core.config import settings
 from app.models.user_cloud_account import UserCloudAccount
+from app.services.drive_client_pool import drive_client_pool
+from app.services.drive_batch import drive_batcher
 
+import httplib2
 import io
+import threading
+import time
 
 def get_drive_client(account: UserCloudAccount):
-    creds = Credentials(
-        token=account.access_token,
-        refresh_token=account.refresh_token,
-        token_uri="https://oauth2.googleapis.com/token",
-        client_id=None,       # handled internally
-        client_secret=None,
-        scopes=["https://www.googleapis.com/auth/drive.appdata"],
-    )
-
-    return build("drive", "v3", credentials=creds)
+    """
+    Returns the pooled Drive client for this account.
+    Safe to share between threads.
+    """
+    return drive_client_pool.get(account)
 
 
 # To create app folder in Google Drive AppData
-def ensure_app_folder(drive):
-      
-      """
+def ensure_app_folder(drive, account_id: str):
+    """
     Creates (or retrieves) the TripVault app folder
     inside Google Drive AppData.
     """
-    #   Search for existing folder
-      response = drive.files().list(
-         spaces="appDataFolder",
-         q ="name='TripVault' and mimeType='application/vnd.google-apps.folder'",
-         fields="files(id,name)",
-    ).execute()
-      
-      files =response.get("files", [])
-      if files:
-            return files[0]["id"]
-      
-    #   create folder if not exists
-
-      file_metadata={
-         "name": "TripVault",
-            "mimeType": "application/vnd.google-apps.folder",
-            "parents": ["appDataFolder"],
 
+    # Search for existing folder
+    response = drive_batcher.execute(
+        account_id,
+        drive,
+        lambda d: d.files().list(
+            spaces="appDataFolder",
+            q="name='TripVault' and mimeType='application/vnd.google-apps.folder'",
+            fields="files(id,name)",
+        ),
+    )
+
+    files = response.get("files", [])
+    if files:
+        return files[0]["id"]
+
+    # create folder if not exists
+    file_metadata = {
+        "name": "TripVault",
+        "mimeType": "application/vnd.google-apps.folder",
+        "parents": ["appDataFolder"],
     }
-      
-      folder= drive.files().create(
-           body=file_metadata,
-           fields="id",
-      ).execute()
 
-      return folder["id"]
+    folder = drive_batcher.execute(
+        account_id,
+        drive,
+        lambda d: d.files().create(
+            body=file_metadata,
+            fields="id",
+        ),
+    )
+
+    return folder["id"]
+
+# =========================
+# App folder ID cache
+# =========================
+# The folder ID is persisted on UserCloudAccount.app_folder_id; this
+# in-memory map sits in front of it so upload paths never list Drive.
+
+_app_folder_ids = {}
+_app_folder_locks = {}
+_app_folder_locks_lock = threading.Lock()
+
+
+def _app_folder_lock(account_id: str) -> threading.Lock:
+    """
+    One lock per account, so a Drive lookup for one account never
+    holds up another account's refresh.
+    """
+
+    with _app_folder_locks_lock:
+        lock = _app_folder_locks.get(account_id)
+        if lock is None:
+            lock = _app_folder_locks[account_id] = threading.Lock()
+        return lock
+
+
+def resolve_app_folder_id(account: UserCloudAccount, drive) -> str:
+    """
+    Returns the account's app folder ID from the cache or the account
+    row, and only asks Drive when neither knows it. A newly resolved ID
+    is set on the account; the caller's commit persists it.
+    """
+
+    folder_id = _app_folder_ids.get(account.id) or account.app_folder_id
+    if not folder_id:
+        folder_id = ensure_app_folder(drive, account.id)
+
+    if account.app_folder_id != folder_id:
+        account.app_folder_id = folder_id
+    _app_folder_ids[account.id] = folder_id
+
+    return folder_id
+
+
+def refresh_app_folder_id(account_id: str, drive, stale_folder_id: str) -> str:
+    """
+    Called when Drive answered 404 for stale_folder_id: drops it from
+    the cache and resolves the folder again. Concurrent callers with
+    the same stale ID share a single lookup.
+    """
+
+    with _app_folder_lock(account_id):
+        folder_id = _app_folder_ids.get(account_id)
+        if folder_id and folder_id != stale_folder_id:
+            return folder_id
+
+        folder_id = ensure_app_folder(drive, account_id)
+        _app_folder_ids[account_id] = folder_id
+        return folder_id
+
+
+def cached_app_folder_id(account_id: str) -> str | None:
+    return _app_folder_ids.get(account_id)
+
+
+def is_not_found(error: Exception) -> bool:
+    return isinstance(error, HttpError) and error.resp.status == 404
+
 
 #  real upload helper to Google Drive service
 
+_TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, HttpError):
+        return error.resp.status in _TRANSIENT_STATUSES
+    return isinstance(error, (httplib2.HttpLib2Error, ConnectionError, TimeoutError))
+
+
+def _execute_resumable(request):
+    """
+    Drives a resumable upload to completion. After a transient failure
+    the next call asks Drive for the last acknowledged byte and resumes
+    from there instead of restarting the chunk.
+    """
+
+    response = None
+    failures = 0
+    while response is None:
+        try:
+            _, response = request.next_chunk()
+            failures = 0
+        except Exception as e:
+            if not is_transient(e) or failures >= settings.DRIVE_UPLOAD_MAX_RESUME_ATTEMPTS:
+                raise
+            failures += 1
+            time.sleep(min(2 ** failures, 30))
+
+    return response
+
+
 def upload_chunk_to_drive(
     drive,
     *,
     folder_id: str,
     chunk_name: str,
-    data: bytes,
+    stream,
+    part_size: int,
 ):
-    media = MediaInMemoryUpload(
-        data,
+    """
+    Uploads a seekable chunk stream. Chunks larger than one part go
+    through a resumable session, part_size bytes at a time, so memory
+    stays O(part_size) whatever the chunk size.
+    """
+
+    stream.seek(0, io.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+
+    media = MediaIoBaseUpload(
+        stream,
         mimetype="application/octet-stream",
-        resumable=False,
+        chunksize=part_size,
+        resumable=size > part_size,
     )
 
     file_metadata = {
@@ -73,29 +189,210 @@ def upload_chunk_to_drive(
         "parents": [folder_id],
     }
 
-    file = drive.files().create(
+    request = drive.files().create(
         body=file_metadata,
         media_body=media,
         fields="id",
-    ).execute()
+    )
+
+    if not media.resumable():
+        return request.execute()["id"]
+
+    return _execute_resumable(request)["id"]
+
 
-    return file["id"]
+# =========================
+# Streaming resumable upload
+# =========================
 
-def download_chunk_from_drive(drive, provider_file_id: str, chunk_size: int = 1024 * 1024):
+class _SequentialReadStream:
     """
-    Generator that streams a file from Google Drive in chunks.
-    Yields bytes.
+    Seekable file-like view of a sequential read(n) callable, the body
+    of a MediaIoBaseUpload. Each part starts with a seek to the first
+    byte Drive has not acknowledged; everything before it is dropped,
+    so memory stays around one part (chunksize) no matter how large
+    the upload is. Seeking back past that point is not possible.
     """
+
+    def __init__(self, read, size: int):
+        self._read = read
+        self._size = size
+        self._buffer = bytearray()
+        self._buffer_start = 0
+        self._position = 0
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def _fill(self, end: int):
+        missing = end - self._buffer_start - len(self._buffer)
+        while missing > 0:
+            data = self._read(missing)
+            if not data:
+                raise Exception("Stream ended before the declared size")
+            self._buffer += data
+            missing -= len(data)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_END:
+            # MediaIoBaseUpload measures the size this way
+            self._position = self._size + offset
+            return self._position
+        if whence == io.SEEK_CUR:
+            offset += self._position
+
+        if offset < self._buffer_start:
+            raise Exception("Cannot rewind a streaming upload past acknowledged bytes")
+
+        self._fill(offset)
+        del self._buffer[:offset - self._buffer_start]
+        self._buffer_start = offset
+        self._position = offset
+        return offset
+
+    def read(self, n=-1):
+        end = self._size if n is None or n < 0 else min(self._size, self._position + n)
+        if end <= self._position:
+            return b""
+
+        self._fill(end)
+        data = bytes(self._buffer[self._position - self._buffer_start:end - self._buffer_start])
+        self._position = end
+        return data
+
+
+def upload_stream_to_drive(
+    drive,
+    *,
+    folder_id: str,
+    chunk_name: str,
+    read,
+    size: int,
+    part_size: int,
+):
+    """
+    Uploads exactly `size` bytes pulled from read(n) through a Drive
+    resumable session, sending each part as soon as it is available.
+    """
+
+    media = MediaIoBaseUpload(
+        _SequentialReadStream(read, size),
+        mimetype="application/octet-stream",
+        chunksize=part_size,
+        resumable=True,
+    )
+
+    file_metadata = {
+        "name": chunk_name,
+        "parents": [folder_id],
+    }
+
+    request = drive.files().create(
+        body=file_metadata,
+        media_body=media,
+        fields="id",
+    )
+
+    return _execute_resumable(request)["id"]
+
+class _AdaptivePieceSize:
+    """
+    Size of the next ranged request of a streamed download: follows the
+    measured throughput so one request takes about target_seconds,
+    within [minimum, maximum] and in 256 KiB steps. Fast links get few
+    large requests, slow ones keep pieces small enough to stream.
+    """
+
+    _STEP = 256 * 1024
+
+    def __init__(self, *, initial: int, minimum: int, maximum: int, target_seconds: float):
+        self._minimum = max(self._STEP, minimum)
+        self._maximum = max(self._minimum, maximum)
+        self._target_seconds = target_seconds
+        self.size = self._clamp(initial)
+
+    def _clamp(self, size: float) -> int:
+        size = int(size) // self._STEP * self._STEP
+        return min(max(size, self._minimum), self._maximum)
+
+    def update(self, received: int, seconds: float) -> int:
+        if received and seconds > 0:
+            wanted = received / seconds * self._target_seconds
+            # Grow at most 2x per request so one fast burst does not jump
+            # straight to the maximum
+            self.size = self._clamp(min(wanted, self.size * 2))
+        return self.size
+
+
+def _piece_size(chunk_size: int | None) -> _AdaptivePieceSize:
+    return _AdaptivePieceSize(
+        initial=chunk_size or settings.DRIVE_DOWNLOAD_MIN_PIECE_BYTES,
+        minimum=settings.DRIVE_DOWNLOAD_MIN_PIECE_BYTES,
+        maximum=settings.DRIVE_DOWNLOAD_MAX_PIECE_BYTES,
+        target_seconds=settings.DRIVE_DOWNLOAD_PIECE_TARGET_MS / 1000,
+    )
+
+
+def _get_media_range(drive, provider_file_id: str, start: int, end: int) -> bytes:
     request = drive.files().get_media(fileId=provider_file_id)
-    buffer = io.BytesIO()
-    downloader = MediaIoBaseDownload(buffer, request, chunksize=chunk_size)
-
-    done = False
-    while not done:
-        status, done = downloader.next_chunk()
-        buffer.seek(0)
-        data = buffer.read()
+    request.headers["range"] = f"bytes={start}-{end}"
+    return request.execute()
+
+
+def download_chunk_from_drive(drive, provider_file_id: str, chunk_size: int | None = None):
+    """
+    Generator that streams a whole file from Google Drive with ranged
+    get_media calls, yielding each response body as received.
+    chunk_size is only the first request's size (see _AdaptivePieceSize).
+    The file size is not needed: a short piece, or 416 right past the
+    end, ends the download.
+    """
+    piece_size = _piece_size(chunk_size)
+    position = 0
+    while True:
+        wanted = piece_size.size
+
+        started = time.monotonic()
+        try:
+            data = _get_media_range(drive, provider_file_id, position, position + wanted - 1)
+        except HttpError as e:
+            if e.resp.status == 416:
+                return  # the previous piece ended exactly at the end
+            raise
+
+        piece_size.update(len(data), time.monotonic() - started)
         if data:
             yield data
-        buffer.truncate(0)
-        buffer.seek(0)
\ No newline at end of file
+        if len(data) < wanted:
+            return
+        position += len(data)
+
+
+def download_chunk_range_from_drive(
+    drive,
+    provider_file_id: str,
+    start: int,
+    end: int,
+    chunk_size: int | None = None,
+):
+    """
+    Generator that streams bytes start..end (inclusive) of a Drive
+    file with ranged get_media calls, sized like download_chunk_from_drive.
+    """
+    piece_size = _piece_size(chunk_size)
+    position = start
+    while position <= end:
+        piece_end = min(position + piece_size.size - 1, end)
+
+        started = time.monotonic()
+        data = _get_media_range(drive, provider_file_id, position, piece_end)
+
+        if not data:
+            raise Exception(f"Drive returned no data for {provider_file_id} at byte {position}")
+
+        piece_size.update(len(data), time.monotonic() - started)
+        yield data
+        position += len(data)
@@ -0,0 +1,251 @@
+import asyncio
+import hashlib
+import queue
+import threading
+from dataclasses import dataclass, field
+from tempfile import SpooledTemporaryFile
+from typing import Any, AsyncIterator, BinaryIO, Callable, List
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.config import settings
+
+
+class UploadIngestError(Exception):
+    pass
+
+
+# =========================
+# Ingested Upload
+# =========================
+
+@dataclass
+class IngestedUpload:
+    """
+    A received file: its bytes (spooled, or in the file the caller
+    chose) plus the size and SHA-256 digest computed while the bytes
+    were arriving.
+    """
+
+    filename: str
+    file: BinaryIO
+    size_bytes: int = 0
+    checksum: str | None = None
+    _hasher: Any = field(default_factory=hashlib.sha256, repr=False)
+
+    def write(self, data: bytes):
+        self._hasher.update(data)
+        self.file.write(data)
+        self.size_bytes += len(data)
+
+    def finish(self):
+        self.checksum = self._hasher.hexdigest()
+        self.file.seek(0)
+
+    def close(self):
+        self.file.close()
+
+
+# =========================
+# Multipart Ingestion
+# =========================
+
+class _MultipartIngestor:
+    """
+    Feeds request body chunks to the multipart parser and writes file
+    parts straight into spooled files, hashing them on the way.
+
+    Parser callbacks only queue work; the queued writes are applied in
+    a worker thread so disk and hashing never block the event loop.
+    """
+
+    def __init__(self, boundary: bytes, open_file: Callable[[], BinaryIO]):
+        self.files: List[IngestedUpload] = []
+        self._open_file = open_file
+
+        self._current: IngestedUpload | None = None
+        self._disposition = b""
+        self._header_name = b""
+        self._header_value = b""
+        self._pending = []
+
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+            },
+        )
+
+    def _on_part_begin(self):
+        self._current = None
+        self._disposition = b""
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"filename" not in options:
+            # Plain form fields are not used by the upload endpoints
+            return
+
+        self._current = IngestedUpload(
+            filename=options[b"filename"].decode("utf-8", errors="replace"),
+            file=self._open_file(),
+        )
+        self.files.append(self._current)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._current is not None:
+            self._pending.append((self._current.write, data[start:end]))
+
+    def _on_part_end(self):
+        if self._current is not None:
+            self._pending.append((self._current.finish, None))
+        self._current = None
+
+    def _apply_pending(self):
+        pending, self._pending = self._pending, []
+        for action, data in pending:
+            if data is None:
+                action()
+            else:
+                action(data)
+
+    async def feed(self, chunk: bytes):
+        self._parser.write(chunk)
+        if self._pending:
+            await asyncio.to_thread(self._apply_pending)
+
+    def finalize(self):
+        self._parser.finalize()
+
+    def close(self):
+        for upload in self.files:
+            upload.close()
+
+
+def _spool_file() -> BinaryIO:
+    return SpooledTemporaryFile(max_size=settings.UPLOAD_SPOOL_MAX_MEMORY_BYTES)
+
+
+async def ingest_multipart_files(
+    stream: AsyncIterator[bytes],
+    content_type: str,
+    open_file: Callable[[], BinaryIO] | None = None,
+) -> List[IngestedUpload]:
+    """
+    Receives every file part of a multipart/form-data body in one pass.
+    Size and SHA-256 are computed as bytes arrive, so the files only
+    need to be read again to upload them. Each part is written to a
+    file from open_file(), a spooled temporary file by default.
+    """
+
+    _, params = parse_options_header(content_type)
+    boundary = params.get(b"boundary")
+    if not boundary:
+        raise UploadIngestError("Missing multipart boundary")
+
+    ingestor = _MultipartIngestor(boundary, open_file or _spool_file)
+    try:
+        async for chunk in stream:
+            await ingestor.feed(chunk)
+        ingestor.finalize()
+    except Exception as e:
+        ingestor.close()
+        if isinstance(e, UploadIngestError):
+            raise
+        raise UploadIngestError(f"Malformed multipart body: {e}")
+
+    unfinished = [upload for upload in ingestor.files if upload.checksum is None]
+    if unfinished:
+        ingestor.close()
+        raise UploadIngestError("Multipart body ended in the middle of a file")
+
+    return ingestor.files
+
+
+# =========================
+# Streaming Request Body
+# =========================
+
+_EOF = object()
+
+
+class StreamingBodyReader:
+    """
+    Bridges an async request body to a blocking read(n) used by the
+    Drive upload thread. At most max_queued_chunks body chunks wait in
+    between, so memory stays bounded and nothing touches the disk.
+
+    Size and SHA-256 are computed on the read side; checksum is set
+    once the end of the body has been read.
+    """
+
+    def __init__(self, max_queued_chunks: int):
+        self._queue = queue.Queue(maxsize=max(1, max_queued_chunks))
+        self._aborted = threading.Event()
+        self._leftover = b""
+        self._eof = False
+        self._hasher = hashlib.sha256()
+
+        self.size_bytes = 0
+        self.checksum: str | None = None
+
+    # ---- event loop side ----
+
+    async def feed(self, data: bytes):
+        if data:
+            await asyncio.to_thread(self._put, data)
+
+    async def finish(self):
+        await asyncio.to_thread(self._put, _EOF)
+
+    def abort(self):
+        self._aborted.set()
+
+    def _put(self, item):
+        while not self._aborted.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise UploadIngestError("Upload was aborted")
+
+    # ---- upload thread side ----
+
+    def read(self, size: int) -> bytes:
+        while not self._leftover and not self._eof:
+            if self._aborted.is_set():
+                raise UploadIngestError("Upload was aborted")
+            try:
+                item = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            if item is _EOF:
+                self._eof = True
+                self.checksum = self._hasher.hexdigest()
+            else:
+                self._hasher.update(item)
+                self.size_bytes += len(item)
+                self._leftover = item
+
+        data, self._leftover = self._leftover[:size], self._leftover[size:]
+        return data
@@ -0,0 +1,370 @@
+import heapq
+import itertools
+import threading
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.trip_member import TripMember
+
+
+class PlacementError(Exception):
+    pass
+
+
+@dataclass
+class Placement:
+    member_id: str
+    user_id: str
+    size_bytes: int
+
+
+# =========================
+# Free-Space Index
+# =========================
+
+class _MemberSpace:
+    __slots__ = ("member_id", "user_id", "allocated", "used", "last_used", "version")
+
+    def __init__(self, member: TripMember):
+        self.member_id = member.id
+        self.user_id = member.user_id
+        self.allocated = member.allocated_bytes
+        self.used = member.used_bytes
+        self.last_used = 0
+        self.version = 0
+
+    @property
+    def free(self) -> int:
+        return max(self.allocated - self.used, 0)
+
+    @property
+    def ratio(self) -> float:
+        return self.used / self.allocated if self.allocated > 0 else 1.0
+
+
+class TripSpaceIndex:
+    """
+    Free space of one trip's members, kept ordered two ways:
+
+    - by_free: sorted (free, user_id) for best-fit / largest-first lookups
+    - a usage-ratio heap (lazy deletion) for fairness-first lookups
+
+    Both are updated in O(log n) per change instead of being rebuilt.
+    """
+
+    def __init__(self, members: List[TripMember]):
+        self.members: Dict[str, _MemberSpace] = {}
+        self.by_free: List[Tuple[int, str]] = []
+        self._ratio_heap = []
+        self._clock = itertools.count(1)
+        self.loaded_at = time.monotonic()
+        self.lock = threading.Lock()
+
+        for member in members:
+            space = _MemberSpace(member)
+            self.members[space.user_id] = space
+            self.by_free.append((space.free, space.user_id))
+            self._ratio_heap.append(self._heap_entry(space))
+
+        self.by_free.sort()
+        heapq.heapify(self._ratio_heap)
+
+    def _heap_entry(self, space: _MemberSpace):
+        # Ties on usage ratio go to the least recently used member
+        return (space.ratio, space.last_used, space.version, space.user_id)
+
+    def adjust(self, user_id: str, delta: int, *, touch: bool = False):
+        space = self.members.get(user_id)
+        if space is None:
+            return
+
+        old = (space.free, user_id)
+        self.by_free.pop(bisect_left(self.by_free, old))
+
+        space.used = max(space.used + delta, 0)
+        space.version += 1
+        if touch:
+            space.last_used = next(self._clock)
+
+        insort(self.by_free, (space.free, user_id))
+        heapq.heappush(self._ratio_heap, self._heap_entry(space))
+
+        # Drop stale heap entries once they outnumber the live ones
+        if len(self._ratio_heap) > 4 * len(self.members) + 64:
+            self._ratio_heap = [self._heap_entry(m) for m in self.members.values()]
+            heapq.heapify(self._ratio_heap)
+
+    def candidates(self, size: int) -> List[_MemberSpace]:
+        """Members with at least size bytes free, smallest free first."""
+        start = bisect_left(self.by_free, (size, ""))
+        return [self.members[user_id] for _, user_id in self.by_free[start:]]
+
+    def smallest_fit(self, size: int) -> _MemberSpace | None:
+        start = bisect_left(self.by_free, (size, ""))
+        if start == len(self.by_free):
+            return None
+        return self.members[self.by_free[start][1]]
+
+    def lowest_ratio_fit(self, size: int) -> _MemberSpace | None:
+        skipped = []
+        found = None
+
+        while self._ratio_heap:
+            entry = heapq.heappop(self._ratio_heap)
+            space = self.members.get(entry[3])
+            if space is None or entry[2] != space.version:
+                continue  # stale entry
+            skipped.append(entry)
+            if space.allocated > 0 and space.free >= size:
+                found = space
+                break
+
+        for entry in skipped:
+            heapq.heappush(self._ratio_heap, entry)
+        return found
+
+    def largest_first(self):
+        for free, user_id in reversed(self.by_free):
+            if free <= 0:
+                return
+            yield self.members[user_id]
+
+    @property
+    def total_free(self) -> int:
+        return sum(free for free, _ in self.by_free)
+
+
+# =========================
+# Strategies
+# =========================
+# A strategy picks one member to hold the whole file, or None. Files no
+# single member can hold are split largest-first (fewest fragments).
+
+Strategy = Callable[[TripSpaceIndex, int], "_MemberSpace | None"]
+
+
+def best_fit(index: TripSpaceIndex, size: int):
+    # Smallest free space that still holds the file
+    return index.smallest_fit(size)
+
+
+def fairness(index: TripSpaceIndex, size: int):
+    # SRS balanced round-robin: lowest usage ratio, LRU on ties
+    return index.lowest_ratio_fit(size)
+
+
+def min_fragments(index: TripSpaceIndex, size: int):
+    # One fragment whenever possible, taken from the largest free space
+    for space in index.largest_first():
+        return space if space.free >= size else None
+    return None
+
+
+def balanced_best_fit(index: TripSpaceIndex, size: int):
+    # SRS medium files: 60% balance + 40% efficiency
+    candidates = index.candidates(size)
+    if not candidates:
+        return None
+    # Efficiency is the tightest fit: least room left after placement,
+    # scaled to [0, 1] across the candidates
+    slack = max(candidates[-1].free - size, 1)
+    return max(
+        candidates,
+        key=lambda m: 0.6 * (1 - m.ratio) + 0.4 * (1 - (m.free - size) / slack),
+    )
+
+
+def least_used_first(index: TripSpaceIndex, size: int):
+    # SRS large files: 70% balance + 30% capacity
+    candidates = index.candidates(size)
+    if not candidates:
+        return None
+    # Capacity relative to the roomiest candidate, so it stays in [0, 1]
+    max_free = max(candidates[-1].free, 1)
+    return max(
+        candidates,
+        key=lambda m: 0.7 * (1 - m.ratio) + 0.3 * (m.free / max_free),
+    )
+
+
+def adaptive(index: TripSpaceIndex, size: int):
+    # SRS FR-5: strategy depends on file size
+    if size < settings.PLACEMENT_SMALL_FILE_BYTES:
+        return fairness(index, size)
+    if size < settings.PLACEMENT_LARGE_FILE_BYTES:
+        return balanced_best_fit(index, size)
+    return least_used_first(index, size)
+
+
+STRATEGIES: Dict[str, Strategy] = {
+    "adaptive": adaptive,
+    "best_fit": best_fit,
+    "fairness": fairness,
+    "min_fragments": min_fragments,
+    "balanced_best_fit": balanced_best_fit,
+    "least_used_first": least_used_first,
+}
+
+
+def register_strategy(name: str, strategy: Strategy):
+    STRATEGIES[name] = strategy
+
+
+def _split_largest_first(index: TripSpaceIndex, size: int) -> List[Tuple[_MemberSpace, int]]:
+    plan = []
+    remaining = size
+    for space in index.largest_first():
+        take = min(space.free, remaining)
+        plan.append((space, take))
+        remaining -= take
+        if remaining == 0:
+            return plan
+    raise PlacementError("Insufficient pooled storage")
+
+
+# =========================
+# Placement Engine
+# =========================
+
+class PlacementEngine:
+    """
+    Plans where new bytes go, against a per-trip free-space index that
+    is loaded once and then kept current: plan() charges the index
+    straight away, record_usage() applies frees. The database stays the
+    source of truth - callers verify the chosen members when they write
+    and call refresh() if the index turned out to be stale.
+    """
+
+    def __init__(self, *, strategy: str, index_ttl_seconds: float):
+        self._strategy = strategy
+        self._index_ttl_seconds = index_ttl_seconds
+        self._indexes: Dict[str, TripSpaceIndex] = {}
+        self._lock = threading.Lock()
+
+    def _index(self, db: Session, trip_id: str) -> TripSpaceIndex:
+        with self._lock:
+            index = self._indexes.get(trip_id)
+            if index is not None and time.monotonic() - index.loaded_at < self._index_ttl_seconds:
+                return index
+
+        return self.refresh(db, trip_id)
+
+    def refresh(self, db: Session, trip_id: str) -> TripSpaceIndex:
+        members = (
+            db.execute(select(TripMember).where(TripMember.trip_id == trip_id))
+            .scalars()
+            .all()
+        )
+        index = TripSpaceIndex(members)
+        with self._lock:
+            self._indexes[trip_id] = index
+        return index
+
+    def invalidate(self, trip_id: str):
+        with self._lock:
+            self._indexes.pop(trip_id, None)
+
+    def plan(
+        self,
+        db: Session,
+        trip_id: str,
+        size: int,
+        *,
+        strategy: str | None = None,
+        allow_split: bool = True,
+    ) -> List[Placement]:
+        """
+        Chooses members for size bytes and charges them in the index.
+        Raises PlacementError if the trip cannot hold the bytes.
+        """
+
+        pick = STRATEGIES[strategy or self._strategy]
+        index = self._index(db, trip_id)
+
+        with index.lock:
+            if not index.members:
+                raise PlacementError("No members found for trip")
+
+            chosen = pick(index, size)
+            if chosen is not None:
+                plan = [(chosen, size)]
+            elif not allow_split:
+                raise PlacementError("No member has room for the whole object")
+            else:
+                plan = _split_largest_first(index, size)
+
+            for space, take in plan:
+                index.adjust(space.user_id, take, touch=True)
+
+        return [
+            Placement(member_id=space.member_id, user_id=space.user_id, size_bytes=take)
+            for space, take in plan
+        ]
+
+    def plan_spread(
+        self,
+        db: Session,
+        trip_id: str,
+        size: int,
+        count: int,
+        *,
+        exclude: Iterable[str] = (),
+    ) -> List[Placement]:
+        """
+        Picks count distinct members outside exclude, each to hold size
+        bytes - lowest usage ratio first, least recently used on ties -
+        and charges them in the index. Used for replicas and shards.
+        Raises PlacementError if fewer members have room.
+        """
+
+        excluded = set(exclude)
+        index = self._index(db, trip_id)
+
+        with index.lock:
+            candidates = [
+                space for space in index.candidates(size)
+                if space.user_id not in excluded and space.allocated > 0
+            ]
+            if len(candidates) < count:
+                raise PlacementError(f"Fewer than {count} other members have room for {size} bytes")
+
+            chosen = sorted(candidates, key=lambda space: (space.ratio, space.last_used))[:count]
+            for space in chosen:
+                index.adjust(space.user_id, size, touch=True)
+
+        return [
+            Placement(member_id=space.member_id, user_id=space.user_id, size_bytes=size)
+            for space in chosen
+        ]
+
+    def plan_replica(self, db: Session, trip_id: str, size: int, *, exclude: Iterable[str]) -> Placement:
+        """One member outside exclude for a copy of size bytes (see plan_spread)."""
+
+        return self.plan_spread(db, trip_id, size, 1, exclude=exclude)[0]
+
+    def record_usage(self, trip_id: str, deltas: Dict[str, int]):
+        """
+        Applies used_bytes changes (by user_id) made outside plan(),
+        e.g. storage freed by deletes.
+        """
+
+        with self._lock:
+            index = self._indexes.get(trip_id)
+        if index is None:
+            return
+
+        with index.lock:
+            for user_id, delta in deltas.items():
+                index.adjust(user_id, delta)
+
+
+placement_engine = PlacementEngine(
+    strategy=settings.PLACEMENT_STRATEGY,
+    index_ttl_seconds=settings.PLACEMENT_INDEX_TTL_SECONDS,
+)
@@ -0,0 +1,210 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from sqlalchemy import select, update, delete, case
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.quota_reservation import QuotaReservation
+from app.models.trip_member import TripMember
+from app.services.placement import Placement
+
+
+# =========================
+# Atomic Charges
+# =========================
+
+def charge_member(db: Session, member_id: str, size: int) -> bool:
+    """
+    used_bytes += size only if it still fits the allocation. A single
+    conditional UPDATE: no row locks, no read-modify-write race.
+    """
+
+    charged = db.execute(
+        update(TripMember)
+        .where(
+            TripMember.id == member_id,
+            TripMember.used_bytes + size <= TripMember.allocated_bytes,
+        )
+        .values(used_bytes=TripMember.used_bytes + size)
+    )
+    return charged.rowcount == 1
+
+
+def refund_member(db: Session, trip_id: str, user_id: str, size: int):
+    db.execute(
+        update(TripMember)
+        .where(
+            TripMember.trip_id == trip_id,
+            TripMember.user_id == user_id,
+        )
+        .values(
+            used_bytes=case(
+                (TripMember.used_bytes > size, TripMember.used_bytes - size),
+                else_=0,
+            )
+        )
+    )
+
+
+def refund_members(db: Session, trip_id: str, freed: Dict[str, int]):
+    """
+    Gives back bytes to many members of a trip ({user_id: bytes}) in a
+    single UPDATE.
+    """
+
+    if not freed:
+        return
+
+    amount = case(freed, value=TripMember.user_id, else_=0)
+    db.execute(
+        update(TripMember)
+        .where(
+            TripMember.trip_id == trip_id,
+            TripMember.user_id.in_(list(freed)),
+        )
+        .values(
+            used_bytes=case(
+                (TripMember.used_bytes > amount, TripMember.used_bytes - amount),
+                else_=0,
+            )
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+
+# =========================
+# Reservations
+# =========================
+
+def _expiry() -> datetime:
+    return datetime.utcnow() + timedelta(seconds=settings.QUOTA_RESERVATION_TTL_SECONDS)
+
+
+def charge_plan(db: Session, plan: List[Placement]) -> bool:
+    """
+    Charges every member of a placement plan. Returns False, with the
+    plan's own charges undone, if any member ran out of room in the
+    meantime. Other work in the caller's transaction is left alone.
+    """
+
+    charged: List[Placement] = []
+    for placement in plan:
+        if not charge_member(db, placement.member_id, placement.size_bytes):
+            for done in charged:
+                db.execute(
+                    update(TripMember)
+                    .where(TripMember.id == done.member_id)
+                    .values(used_bytes=TripMember.used_bytes - done.size_bytes)
+                )
+            return False
+        charged.append(placement)
+    return True
+
+
+def reserve_plan(db: Session, trip_id: str, content_id: str, plan: List[Placement]):
+    # Marks the plan's charges as belonging to unfinished content
+    expires_at = _expiry()
+    for placement in plan:
+        db.add(
+            QuotaReservation(
+                trip_id=trip_id,
+                user_id=placement.user_id,
+                content_id=content_id,
+                size_bytes=placement.size_bytes,
+                expires_at=expires_at,
+            )
+        )
+
+
+def reserve_block(db: Session, trip_id: str, user_id: str, content_id: str, block_id: str, size: int):
+    # The owner was already charged; the row lets an abandoned block be reclaimed
+    db.add(
+        QuotaReservation(
+            trip_id=trip_id,
+            user_id=user_id,
+            content_id=content_id,
+            block_id=block_id,
+            size_bytes=size,
+            expires_at=_expiry(),
+        )
+    )
+
+
+def extend_reservations(db: Session, content_id: str):
+    """Pushes expiry back while an upload of the content is running."""
+
+    extend_reservations_of(db, [content_id])
+
+
+def extend_reservations_of(db: Session, content_ids):
+    db.execute(
+        update(QuotaReservation)
+        .where(QuotaReservation.content_id.in_(content_ids))
+        .values(expires_at=_expiry())
+        .execution_options(synchronize_session=False)
+    )
+
+
+class ReservationRenewal:
+    """
+    Paces the renewals of a streamed upload's reservation: due() turns
+    true once every QUOTA_RESERVATION_RENEW_SECONDS, and the caller
+    then extends the reservation.
+    """
+
+    def __init__(self):
+        self._renewed_at = time.monotonic()
+
+    def due(self) -> bool:
+        now = time.monotonic()
+        if now - self._renewed_at < settings.QUOTA_RESERVATION_RENEW_SECONDS:
+            return False
+        self._renewed_at = now
+        return True
+
+
+def finalize_reservations(db: Session, content_id: str):
+    """
+    The content is complete (or deleted, which frees its bytes itself):
+    its charges are no longer reservations.
+    """
+
+    finalize_reservations_of(db, [content_id])
+
+
+def finalize_reservations_of(db: Session, content_ids: List[str]):
+    db.execute(
+        delete(QuotaReservation)
+        .where(QuotaReservation.content_id.in_(content_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+
+def expired_reservations(db: Session) -> List[QuotaReservation]:
+    return (
+        db.execute(
+            select(QuotaReservation)
+            .where(QuotaReservation.expires_at <= datetime.utcnow())
+        )
+        .scalars()
+        .all()
+    )
+
+
+_last_sweep = 0.0
+_sweep_lock = threading.Lock()
+
+
+def sweep_due() -> bool:
+    """At most one sweep per QUOTA_SWEEP_INTERVAL_SECONDS per process."""
+
+    global _last_sweep
+    with _sweep_lock:
+        now = time.monotonic()
+        if now - _last_sweep < settings.QUOTA_SWEEP_INTERVAL_SECONDS:
+            return False
+        _last_sweep = now
+        return True
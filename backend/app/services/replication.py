@@ -0,0 +1,234 @@
+import logging
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.chunk_replica import ChunkReplica
+from app.models.file_chunk import FileChunk
+from app.models.file_content import FileContent
+from app.models.trip import Trip
+from app.models.user_cloud_account import UserCloudAccount
+from app.services.drive_gc import tombstone_objects
+from app.services.google_drive_service import (
+    download_chunk_from_drive,
+    get_drive_client,
+    resolve_app_folder_id,
+)
+from app.services.placement import PlacementError, placement_engine
+from app.services.quota_service import charge_member
+from app.services.upload_engine import ChunkUploadTask, stream_chunk_upload
+
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Chunk Replication
+# =========================
+
+def _piece_reader(pieces: Iterable[bytes]) -> Callable[[int], bytes]:
+    # read(n) over an iterator of byte pieces, for streaming uploads
+    iterator = iter(pieces)
+    leftover = b""
+
+    def read(size: int) -> bytes:
+        nonlocal leftover
+        if not leftover:
+            leftover = next(iterator, b"")
+        data, leftover = leftover[:size], leftover[size:]
+        return data
+
+    return read
+
+
+def _google_drive_account(db: Session, user_id: str) -> UserCloudAccount | None:
+    return (
+        db.query(UserCloudAccount)
+        .filter(
+            UserCloudAccount.user_id == user_id,
+            UserCloudAccount.provider == "google_drive",
+        )
+        .first()
+    )
+
+
+def replicate_chunk(db: Session, chunk_id: str) -> ChunkReplica | None:
+    """
+    Copies a stored chunk to the Drive of another member, streaming it
+    from the primary copy. Returns None when the chunk is gone, already
+    replicated, or no other member has room.
+
+    The replica's owner is charged only after the copy is on Drive, so
+    no write lock is held during the transfer; a copy that cannot be
+    charged any more is handed to the garbage collector.
+    """
+
+    row = db.execute(
+        select(FileChunk, FileContent.trip_id)
+        .join(FileContent, FileContent.id == FileChunk.content_id)
+        .where(FileChunk.id == chunk_id)
+    ).first()
+    if row is None:
+        return None
+    chunk, trip_id = row
+    if chunk.provider_file_id == "PENDING":
+        return None
+
+    replicas = db.execute(
+        select(func.count()).select_from(ChunkReplica).where(ChunkReplica.chunk_id == chunk_id)
+    ).scalar_one()
+    if replicas:
+        return None
+
+    source_account = _google_drive_account(db, chunk.owner_user_id)
+    if not source_account:
+        return None
+
+    try:
+        placement = placement_engine.plan_replica(db, trip_id, chunk.size_bytes, exclude=[chunk.owner_user_id])
+    except PlacementError:
+        return None
+
+    target_account = _google_drive_account(db, placement.user_id)
+    if not target_account:
+        placement_engine.record_usage(trip_id, {placement.user_id: -chunk.size_bytes})
+        return None
+
+    drive = get_drive_client(target_account)
+    replica_id = str(uuid.uuid4())
+    task = ChunkUploadTask(
+        chunk_id=replica_id,
+        owner_user_id=placement.user_id,
+        account_id=target_account.id,
+        drive=drive,
+        folder_id=resolve_app_folder_id(target_account, drive),
+        chunk_name=f"replica_{chunk.content_id}_{chunk.offset_bytes}.bin",
+        offset_bytes=chunk.offset_bytes,
+        size_bytes=chunk.size_bytes,
+    )
+
+    # Persist a newly resolved app folder before the transfer
+    db.commit()
+
+    try:
+        provider_file_id = stream_chunk_upload(
+            task,
+            _piece_reader(download_chunk_from_drive(get_drive_client(source_account), chunk.provider_file_id)),
+            part_size=settings.DRIVE_UPLOAD_PART_BYTES,
+        )
+    except Exception:
+        # A resumable session that never completed leaves no file on
+        # Drive, so there is nothing to tombstone
+        placement_engine.record_usage(trip_id, {placement.user_id: -chunk.size_bytes})
+        raise
+
+    def discard_copy():
+        # The copy is on Drive but not recorded: hand it to the GC
+        db.rollback()
+        tombstone_objects(db, [{"id": replica_id, "owner_user_id": placement.user_id, "provider_file_id": provider_file_id}])
+        db.commit()
+        placement_engine.refresh(db, trip_id)
+
+    try:
+        # The charge takes the write lock, so the chunk cannot be deleted
+        # between the check below and the commit
+        charged = charge_member(db, placement.member_id, chunk.size_bytes)
+        still_stored = db.execute(select(FileChunk.id).where(FileChunk.id == chunk_id)).first()
+
+        if not charged or not still_stored:
+            discard_copy()
+            return None
+
+        replica = ChunkReplica(
+            id=replica_id,
+            chunk_id=chunk_id,
+            owner_user_id=placement.user_id,
+            provider="google_drive",
+            provider_file_id=provider_file_id,
+            size_bytes=chunk.size_bytes,
+        )
+        db.add(replica)
+        db.commit()
+    except Exception:
+        discard_copy()
+        raise
+
+    logger.info("Chunk %s replicated to %s", chunk_id, placement.user_id)
+    return replica
+
+
+class ChunkReplicator:
+    """
+    Replicates chunks in the background. Small chunks are scheduled when
+    their upload completes; any other chunk once it has been read
+    hot_reads times in this process. A chunk whose replication failed
+    is scheduled again on its next read.
+    """
+
+    def __init__(self, *, max_workers: int, hot_reads: int):
+        self._hot_reads = max(1, hot_reads)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="chunk-replica")
+        self._reads = Counter()
+        self._scheduled = set()
+        self._lock = threading.Lock()
+
+    def schedule(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            fresh = [chunk_id for chunk_id in chunk_ids if chunk_id not in self._scheduled]
+            self._scheduled.update(fresh)
+        for chunk_id in fresh:
+            self._pool.submit(self._run, chunk_id)
+
+    def record_reads(self, chunk_ids: Iterable[str]):
+        hot = []
+        with self._lock:
+            # Counts are per process and only need to be roughly right
+            if len(self._reads) > 100_000:
+                self._reads.clear()
+            for chunk_id in chunk_ids:
+                self._reads[chunk_id] += 1
+                if self._reads[chunk_id] == self._hot_reads:
+                    hot.append(chunk_id)
+        self.schedule(hot)
+
+    def _run(self, chunk_id: str):
+        db = SessionLocal()
+        try:
+            replicate_chunk(db, chunk_id)
+        except Exception as e:
+            db.rollback()
+            logger.warning("Replication of chunk %s failed: %s", chunk_id, e)
+            with self._lock:
+                self._reads[chunk_id] = self._hot_reads - 1
+        finally:
+            db.close()
+            with self._lock:
+                self._scheduled.discard(chunk_id)
+
+
+chunk_replicator = ChunkReplicator(
+    max_workers=settings.REPLICATION_MAX_WORKERS,
+    hot_reads=settings.REPLICATION_HOT_READS,
+)
+
+
+def replicates_chunks(db: Session, trip_id: str) -> bool:
+    return bool(db.execute(select(Trip.replicate_chunks).where(Trip.id == trip_id)).scalar())
+
+
+def schedule_small_chunk_replicas(db: Session, trip_id: str, chunks: List[FileChunk]):
+    """Queues replicas for the small chunks of a just stored file."""
+
+    if not replicates_chunks(db, trip_id):
+        return
+    chunk_replicator.schedule(
+        chunk.id for chunk in chunks
+        if chunk.size_bytes <= settings.REPLICATION_SMALL_CHUNK_BYTES
+    )
@@ -1,12 +1,49 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, case, func
 from typing import List, Tuple
+from collections import Counter, defaultdict
+import io
+import logging
+import uuid
 
-from app.models.trip_member import TripMember
 from app.models.virtual_file import VirtualFile
 from app.models.file_chunk import FileChunk
+from app.models.file_shard import FileShard
+from app.models.chunk_replica import ChunkReplica
+from app.models.file_content import FileContent
+from app.models.content_block import ContentBlock
 from app.models.user_cloud_account import UserCloudAccount
-from app.services.google_drive_service import get_drive_client, ensure_app_folder, upload_chunk_to_drive, download_chunk_from_drive
+from app.core.config import settings
+from app.services.google_drive_service import (
+    get_drive_client,
+    resolve_app_folder_id,
+    cached_app_folder_id,
+    download_chunk_from_drive,
+    download_chunk_range_from_drive,
+)
+from app.services.download_engine import hedged_source, prefetch_ordered
+from app.services.upload_engine import ChunkUploadTask, FileRangeReader, collect_chunk_uploads, stream_chunk_upload
+from app.services.chunk_cache import chunk_cache
+from app.services.block_store import load_block_pieces, release_blocks
+from app.services.drive_gc import tombstone_blocks, tombstone_chunks, tombstone_objects, tombstone_replicas, tombstone_shards
+from app.services.replication import chunk_replicator, replicates_chunks, schedule_small_chunk_replicas
+from app.services.stripe_engine import StripeLayout, default_stripe_layout, read_stripes, stripes_large_files, upload_stripes
+from app.services.placement import Placement, PlacementError, placement_engine
+from app.services.quota_service import (
+    charge_plan,
+    reserve_plan,
+    extend_reservations,
+    finalize_reservations,
+    finalize_reservations_of,
+    expired_reservations,
+    ReservationRenewal,
+    refund_member,
+    refund_members,
+    sweep_due,
+)
+
+
+logger = logging.getLogger(__name__)
 
 
 # =========================
@@ -21,100 +58,419 @@ class FileNotFoundError(Exception):
     pass
 
 
+class FileNotReadyError(Exception):
+    pass
+
+
 # =========================
 # Upload Service
 # =========================
 
-def create_virtual_file_with_chunks(
+def _link_existing_content(
     *,
     db: Session,
     trip_id: str,
     uploader_user_id: str,
     path: str,
     file_size: int,
-    checksum: str | None = None,
-) -> VirtualFile:
+    checksum: str,
+) -> VirtualFile | None:
+    """
+    If the trip already stores these bytes, creates a VirtualFile that
+    references them: no new chunks, no Drive traffic, no quota charge.
+    """
 
-    members: List[TripMember] = (
+    content = (
         db.execute(
-            select(TripMember)
-            .where(TripMember.trip_id == trip_id)
-            .with_for_update()
+            select(FileContent)
+            .where(
+                FileContent.trip_id == trip_id,
+                FileContent.checksum == checksum,
+                FileContent.size_bytes == file_size,
+                FileContent.status == "READY",
+            )
+            .limit(1)
         )
-        .scalars()
-        .all()
+        .scalar_one_or_none()
+    )
+    if not content:
+        return None
+
+    # Only take a reference while the content is still alive
+    linked = db.execute(
+        update(FileContent)
+        .where(FileContent.id == content.id, FileContent.ref_count > 0)
+        .values(ref_count=FileContent.ref_count + 1)
     )
+    if linked.rowcount != 1:
+        db.rollback()
+        return None
+
+    virtual_file = VirtualFile(
+        trip_id=trip_id,
+        path=path,
+        size_bytes=file_size,
+        checksum=checksum,
+        content_id=content.id,
+        uploaded_by=uploader_user_id,
+    )
+    db.add(virtual_file)
+    db.commit()
+    db.refresh(virtual_file)
+
+    logger.info("Deduplicated upload: file %s -> content %s", virtual_file.id, content.id)
 
-    if not members:
-        raise InsufficientStorageError("No members found for trip")
+    return virtual_file
+
+
+def _reserve_placement(db: Session, trip_id: str, file_size: int) -> List[Placement]:
+    """
+    Plans chunk placement from the cached free-space index and charges
+    the chosen members with conditional updates. If a member ran out of
+    room in the meantime, the index is reloaded and the file placed again.
+    """
+
+    for _ in range(max(1, settings.PLACEMENT_MAX_ATTEMPTS)):
+        try:
+            plan = placement_engine.plan(db, trip_id, file_size)
+        except PlacementError:
+            # The index may lag behind storage freed elsewhere
+            placement_engine.refresh(db, trip_id)
+            try:
+                plan = placement_engine.plan(db, trip_id, file_size)
+            except PlacementError as e:
+                raise InsufficientStorageError(str(e))
 
-    free_map: List[Tuple[TripMember, int]] = []
-    for m in members:
-        free = m.allocated_bytes - m.used_bytes
-        if free > 0:
-            free_map.append((m, free))
+        if charge_plan(db, plan):
+            return plan
+
+        placement_engine.refresh(db, trip_id)
+
+    raise InsufficientStorageError("Storage changed during placement, please retry")
+
+
+def _reserve_stripes(db: Session, trip_id: str, file_size: int) -> Tuple[StripeLayout, List[Placement]] | None:
+    """
+    Places the shards of a large file on k + m distinct members and
+    charges them. Returns None when the file is too small for striping
+    or the trip lacks enough members with room; it is chunked instead.
+    """
 
-    if not free_map:
-        raise InsufficientStorageError("No free storage available")
+    if not settings.STRIPE_ENABLED or file_size < settings.STRIPE_MIN_FILE_BYTES:
+        return None
+    # Parity costs quota: only trips that opted in are striped
+    if not stripes_large_files(db, trip_id):
+        return None
 
-    free_map.sort(key=lambda x: x[1], reverse=True)
+    layout = default_stripe_layout(file_size)
+    for _ in range(max(1, settings.PLACEMENT_MAX_ATTEMPTS)):
+        try:
+            plan = placement_engine.plan_spread(db, trip_id, layout.shard_bytes, layout.total_shards)
+        except PlacementError:
+            return None
 
-    plan: List[Tuple[TripMember, int]] = []
+        if charge_plan(db, plan):
+            return layout, plan
 
-    for member, free in free_map:
-        if free >= file_size:
-            plan = [(member, file_size)]
-            break
+        placement_engine.refresh(db, trip_id)
 
-    if not plan:
-        total_free = sum(free for _, free in free_map)
-        if total_free < file_size:
-            raise InsufficientStorageError("Insufficient pooled storage")
+    return None
 
-        remaining = file_size
-        for member, free in free_map:
-            if remaining <= 0:
-                break
 
-            take = min(free, remaining)
-            if take > 0:
-                plan.append((member, take))
-                remaining -= take
+def _add_planned_file(
+    db: Session,
+    *,
+    trip_id: str,
+    uploader_user_id: str,
+    path: str,
+    file_size: int,
+    checksum: str | None,
+    plan: List[Placement],
+    layout: StripeLayout | None = None,
+    reserve: bool = True,
+) -> VirtualFile:
+    # Content, reservations (unless reserve is off), VirtualFile and
+    # PENDING chunks (or shards, given a stripe layout) for an already
+    # charged plan. Flushed, not committed.
+    content = FileContent(
+        trip_id=trip_id,
+        # Set once the server has hashed the bytes it stored
+        checksum=None,
+        size_bytes=file_size,
+        ref_count=1,
+        status="PENDING",
+    )
+    if layout:
+        content.storage_mode = "stripes"
+        content.stripe_data_shards = layout.data_shards
+        content.stripe_parity_shards = layout.parity_shards
+        content.stripe_cell_bytes = layout.cell_bytes
+    db.add(content)
+    db.flush()
 
-        if remaining != 0:
-            raise InsufficientStorageError("Failed to allocate full file")
+    if reserve:
+        reserve_plan(db, trip_id, content.id, plan)
 
     virtual_file = VirtualFile(
         trip_id=trip_id,
         path=path,
         size_bytes=file_size,
         checksum=checksum,
+        content_id=content.id,
         uploaded_by=uploader_user_id,
     )
     db.add(virtual_file)
     db.flush()
 
+    if layout:
+        for index, placement in enumerate(plan):
+            db.add(
+                FileShard(
+                    content_id=content.id,
+                    shard_index=index,
+                    owner_user_id=placement.user_id,
+                    provider="PENDING",
+                    provider_file_id="PENDING",
+                    size_bytes=placement.size_bytes,
+                )
+            )
+        return virtual_file
+
     offset = 0
-    for member, size in plan:
+    for placement in plan:
         chunk = FileChunk(
-            virtual_file_id=virtual_file.id,
-            owner_user_id=member.user_id,
+            content_id=content.id,
+            owner_user_id=placement.user_id,
             provider="PENDING",
             provider_file_id="PENDING",
             offset_bytes=offset,
-            size_bytes=size,
+            size_bytes=placement.size_bytes,
         )
         db.add(chunk)
+        offset += placement.size_bytes
+
+    return virtual_file
 
-        member.used_bytes += size
-        offset += size
 
-    db.commit()
+def create_virtual_file_with_chunks(
+    *,
+    db: Session,
+    trip_id: str,
+    uploader_user_id: str,
+    path: str,
+    file_size: int,
+    checksum: str | None = None,
+    allow_striping: bool = True,
+    reserve: bool = True,
+) -> VirtualFile:
+    # reserve=False keeps the charge without a reservation: the file
+    # is never expired, however long its bytes take to arrive
+
+    if checksum:
+        duplicate = _link_existing_content(
+            db=db,
+            trip_id=trip_id,
+            uploader_user_id=uploader_user_id,
+            path=path,
+            file_size=file_size,
+            checksum=checksum,
+        )
+        if duplicate:
+            return duplicate
+
+    if sweep_due():
+        expire_quota_reservations(db)
+
+    # Large files of trips with stripe_large_files are erasure coded
+    # across members
+    striped = _reserve_stripes(db, trip_id, file_size) if allow_striping else None
+    if striped:
+        layout, plan = striped
+    else:
+        layout, plan = None, _reserve_placement(db, trip_id, file_size)
+
+    virtual_file = _add_planned_file(
+        db,
+        trip_id=trip_id,
+        uploader_user_id=uploader_user_id,
+        path=path,
+        file_size=file_size,
+        checksum=checksum,
+        plan=plan,
+        layout=layout,
+        reserve=reserve,
+    )
+
+    try:
+        db.commit()
+    except Exception:
+        db.rollback()
+        placement_engine.refresh(db, trip_id)
+        raise
     db.refresh(virtual_file)
 
-    print("UPLOAD SUCCESS")
-    print("VirtualFile ID:", virtual_file.id)
-    print("DB URL:", db.bind.url)
+    logger.info("Virtual file %s created in trip %s", virtual_file.id, trip_id)
+
+    return virtual_file
+
+
+# Batch uploads
+
+def _ready_contents_by_checksum(db: Session, trip_id: str, checksums) -> dict:
+    found = {}
+    wanted = list(set(checksums))
+    for i in range(0, len(wanted), 500):
+        for content in db.execute(
+            select(FileContent)
+            .where(
+                FileContent.trip_id == trip_id,
+                FileContent.checksum.in_(wanted[i:i + 500]),
+                FileContent.status == "READY",
+            )
+        ).scalars():
+            found.setdefault((content.checksum, content.size_bytes), content)
+    return found
+
+
+def create_virtual_files_batch(
+    *,
+    db: Session,
+    trip_id: str,
+    uploader_user_id: str,
+    files: List[Tuple[str, int, str | None]],
+) -> list:
+    """
+    Creates VirtualFiles for many (path, size, checksum) entries in one
+    transaction: one dedup lookup, one placement pass, one commit.
+    Identical files within the batch share one content.
+
+    Returns, per entry, the VirtualFile or the InsufficientStorageError
+    that kept it from being placed.
+    """
+
+    if sweep_due():
+        expire_quota_reservations(db)
+
+    stored = _ready_contents_by_checksum(db, trip_id, [c for _, _, c in files if c])
+    planned = {}
+    results = []
+
+    try:
+        for path, file_size, checksum in files:
+            key = (checksum, file_size)
+            content = stored.get(key) if checksum else None
+
+            if content is not None:
+                linked = db.execute(
+                    update(FileContent)
+                    .where(FileContent.id == content.id, FileContent.ref_count > 0)
+                    .values(ref_count=FileContent.ref_count + 1)
+                )
+                if linked.rowcount != 1:
+                    content = None
+            elif checksum and key in planned:
+                # Same bytes earlier in this batch: upload them once
+                content = planned[key]
+                content.ref_count += 1
+
+            if content is not None:
+                virtual_file = VirtualFile(
+                    trip_id=trip_id,
+                    path=path,
+                    size_bytes=file_size,
+                    checksum=checksum,
+                    content_id=content.id,
+                    uploaded_by=uploader_user_id,
+                )
+                db.add(virtual_file)
+                results.append(virtual_file)
+                continue
+
+            try:
+                plan = _reserve_placement(db, trip_id, file_size)
+            except InsufficientStorageError as e:
+                results.append(e)
+                continue
+
+            virtual_file = _add_planned_file(
+                db,
+                trip_id=trip_id,
+                uploader_user_id=uploader_user_id,
+                path=path,
+                file_size=file_size,
+                checksum=checksum,
+                plan=plan,
+            )
+            if checksum:
+                planned[key] = virtual_file.content
+            results.append(virtual_file)
+
+        db.commit()
+
+    except Exception:
+        db.rollback()
+        placement_engine.refresh(db, trip_id)
+        raise
+
+    for result in results:
+        if isinstance(result, VirtualFile):
+            db.refresh(result)
+
+    logger.info("Batch upload planned: %d files, %d placed", len(files), sum(isinstance(r, VirtualFile) for r in results))
+
+    return results
+
+
+def create_virtual_file_for_blocks(
+    *,
+    db: Session,
+    trip_id: str,
+    uploader_user_id: str,
+    path: str,
+    file_size: int,
+    checksum: str | None = None,
+) -> VirtualFile:
+    """
+    Like create_virtual_file_with_chunks, but the content will be stored
+    as deduplicated blocks: nothing is planned up front, each new block
+    is charged to an owner when it is stored.
+    """
+
+    if checksum:
+        duplicate = _link_existing_content(
+            db=db,
+            trip_id=trip_id,
+            uploader_user_id=uploader_user_id,
+            path=path,
+            file_size=file_size,
+            checksum=checksum,
+        )
+        if duplicate:
+            return duplicate
+
+    content = FileContent(
+        trip_id=trip_id,
+        # Set once the bytes have been verified against it
+        checksum=None,
+        size_bytes=file_size,
+        ref_count=1,
+        status="PENDING",
+        storage_mode="blocks",
+    )
+    db.add(content)
+    db.flush()
+
+    virtual_file = VirtualFile(
+        trip_id=trip_id,
+        path=path,
+        size_bytes=file_size,
+        checksum=checksum,
+        content_id=content.id,
+        uploaded_by=uploader_user_id,
+    )
+    db.add(virtual_file)
+    db.commit()
+    db.refresh(virtual_file)
 
     return virtual_file
 
@@ -128,44 +484,206 @@ def delete_virtual_file(
     db: Session,
     virtual_file_id: str,
 ):
-    print("DELETE REQUEST FOR FILE ID:", virtual_file_id)
-    print("DB URL:", db.bind.url)
-
     virtual_file = db.get(VirtualFile, virtual_file_id)
     if not virtual_file:
         raise FileNotFoundError("Virtual file not found")
 
-    chunks = (
+    delete_virtual_files(
+        db=db,
+        trip_id=virtual_file.trip_id,
+        virtual_file_ids=[virtual_file_id],
+    )
+
+    logger.info("Virtual file %s deleted", virtual_file_id)
+
+
+def _delete_file_rows(db: Session, rows) -> Counter:
+    """
+    Deletes a batch of (virtual_file_id, content_id) rows and whatever
+    content they were the last reference to. Returns the bytes freed
+    per owner.
+    """
+
+    references = Counter(content_id for _, content_id in rows)
+    content_ids = list(references)
+
+    db.execute(
+        delete(VirtualFile)
+        .where(VirtualFile.id.in_([virtual_file_id for virtual_file_id, _ in rows]))
+    )
+    db.execute(
+        update(FileContent)
+        .where(FileContent.id.in_(content_ids))
+        .values(ref_count=FileContent.ref_count - case(references, value=FileContent.id, else_=0))
+        .execution_options(synchronize_session=False)
+    )
+
+    # Storage is only freed when the last reference is dropped
+    dead = db.execute(
+        select(FileContent.id, FileContent.storage_mode)
+        .where(FileContent.id.in_(content_ids), FileContent.ref_count <= 0)
+    ).all()
+    if not dead:
+        return Counter()
+
+    dead_ids = [content_id for content_id, _ in dead]
+    dead_chunked = [content_id for content_id, mode in dead if mode not in ("blocks", "stripes")]
+    dead_blocks = [content_id for content_id, mode in dead if mode == "blocks"]
+    dead_striped = [content_id for content_id, mode in dead if mode == "stripes"]
+
+    freed = Counter()
+    if dead_chunked:
+        freed.update(
+            dict(
+                db.execute(
+                    select(FileChunk.owner_user_id, func.sum(FileChunk.size_bytes))
+                    .where(FileChunk.content_id.in_(dead_chunked))
+                    .group_by(FileChunk.owner_user_id)
+                ).all()
+            )
+        )
+        # Replicas go with their chunks
+        dead_chunk_ids = select(FileChunk.id).where(FileChunk.content_id.in_(dead_chunked))
+        replicated = ChunkReplica.chunk_id.in_(dead_chunk_ids)
+        freed.update(
+            dict(
+                db.execute(
+                    select(ChunkReplica.owner_user_id, func.sum(ChunkReplica.size_bytes))
+                    .where(replicated)
+                    .group_by(ChunkReplica.owner_user_id)
+                ).all()
+            )
+        )
+        tombstone_replicas(db, replicated)
         db.execute(
-            select(FileChunk)
-            .where(FileChunk.virtual_file_id == virtual_file_id)
-            .with_for_update()
+            delete(ChunkReplica)
+            .where(replicated)
+            .execution_options(synchronize_session=False)
         )
-        .scalars()
-        .all()
-    )
 
-    for chunk in chunks:
-        member = (
-            db.execute(
-                select(TripMember)
-                .where(
-                    TripMember.trip_id == virtual_file.trip_id,
-                    TripMember.user_id == chunk.owner_user_id,
-                )
-                .with_for_update()
+        tombstone_chunks(db, dead_chunked)
+        db.execute(
+            delete(FileChunk)
+            .where(FileChunk.content_id.in_(dead_chunked))
+            .execution_options(synchronize_session=False)
+        )
+
+    if dead_blocks:
+        freed.update(release_blocks(db, dead_blocks))
+
+    if dead_striped:
+        freed.update(
+            dict(
+                db.execute(
+                    select(FileShard.owner_user_id, func.sum(FileShard.size_bytes))
+                    .where(FileShard.content_id.in_(dead_striped))
+                    .group_by(FileShard.owner_user_id)
+                ).all()
             )
-            .scalar_one()
         )
+        tombstone_shards(db, dead_striped)
+        db.execute(
+            delete(FileShard)
+            .where(FileShard.content_id.in_(dead_striped))
+            .execution_options(synchronize_session=False)
+        )
+
+    finalize_reservations_of(db, dead_ids)
+    db.execute(
+        delete(FileContent)
+        .where(FileContent.id.in_(dead_ids))
+        .execution_options(synchronize_session=False)
+    )
+
+    return freed
 
-        member.used_bytes -= chunk.size_bytes
-        if member.used_bytes < 0:
-            member.used_bytes = 0
 
-    db.delete(virtual_file)
+def delete_virtual_files(
+    *,
+    db: Session,
+    trip_id: str,
+    virtual_file_ids: List[str] | None = None,
+    path_prefix: str | None = None,
+) -> int:
+    """
+    Deletes many files of a trip, selected by ID and/or path prefix,
+    with a handful of set-based statements per 500 files: one grouped
+    sum of freed bytes per owner and one UPDATE of trip_members for
+    the whole call. Returns the number of files deleted.
+    """
+
+    query = select(VirtualFile.id, VirtualFile.content_id).where(VirtualFile.trip_id == trip_id)
+    if path_prefix:
+        query = query.where(VirtualFile.path.startswith(path_prefix, autoescape=True))
+
+    if virtual_file_ids is None:
+        rows = db.execute(query).all()
+    else:
+        rows = []
+        for i in range(0, len(virtual_file_ids), 500):
+            rows += db.execute(query.where(VirtualFile.id.in_(virtual_file_ids[i:i + 500]))).all()
+
+    freed = Counter()
+    for i in range(0, len(rows), 500):
+        freed.update(_delete_file_rows(db, rows[i:i + 500]))
+
+    refund_members(db, trip_id, freed)
     db.commit()
 
-    print("DELETE SUCCESS:", virtual_file_id)
+    placement_engine.record_usage(trip_id, {user_id: -size for user_id, size in freed.items()})
+
+    return len(rows)
+
+
+def expire_quota_reservations(db: Session) -> int:
+    """
+    Gives back storage charged for uploads that never finished: pending
+    files past their reservation expiry are deleted, and dedup blocks
+    nobody ended up referencing are dropped.
+    """
+
+    expired = expired_reservations(db)
+    content_ids = {r.content_id for r in expired if not r.block_id}
+    freed = {}
+
+    for reservation in expired:
+        if reservation.block_id:
+            unreferenced = (
+                ContentBlock.id == reservation.block_id,
+                ContentBlock.ref_count == 0,
+            )
+            # An uploaded block goes to the collector with its row
+            tombstone_blocks(db, *unreferenced)
+            dropped = db.execute(delete(ContentBlock).where(*unreferenced))
+            if dropped.rowcount == 1:
+                refund_member(db, reservation.trip_id, reservation.user_id, reservation.size_bytes)
+                key = (reservation.trip_id, reservation.user_id)
+                freed[key] = freed.get(key, 0) + reservation.size_bytes
+            db.delete(reservation)
+    db.commit()
+
+    for (trip_id, user_id), size in freed.items():
+        placement_engine.record_usage(trip_id, {user_id: -size})
+
+    for content_id in content_ids:
+        content = db.get(FileContent, content_id)
+        if content is None or content.status == "READY":
+            finalize_reservations(db, content_id)
+            db.commit()
+            continue
+
+        virtual_files = db.execute(
+            select(VirtualFile.id).where(VirtualFile.content_id == content_id)
+        ).scalars().all()
+        for virtual_file_id in virtual_files:
+            try:
+                delete_virtual_file(db=db, virtual_file_id=virtual_file_id)
+            except FileNotFoundError:
+                pass  # Another worker's sweep got there first
+
+        logger.info("Upload reservation of content %s expired", content_id)
+
+    return len(expired)
 
 
 # chunk reconstruction(mocked btytes    )
@@ -187,7 +705,7 @@ def iter_virtual_file_bytes(
     chunks = (
         db.execute(
             select(FileChunk)
-            .where(FileChunk.virtual_file_id == virtual_file_id)
+            .where(FileChunk.content_id == virtual_file.content_id)
             .order_by(FileChunk.offset_bytes)
         )
         .scalars()
@@ -202,68 +720,271 @@ def iter_virtual_file_bytes(
         yield b"\x00" * chunk.size_bytes
 
 
-def upload_chunks_to_google_drive(
-    *,
-    db: Session,
-    virtual_file_id: str,
-):
+def _load_owner_accounts(db: Session, owner_ids) -> dict:
     """
-    Uploads all chunks of a VirtualFile to the respective
-    owners' Google Drives and updates provider_file_id.
+    Google Drive accounts of the given users, keyed by user_id.
     """
 
-    virtual_file = db.get(VirtualFile, virtual_file_id)
-    if not virtual_file:
-        raise FileNotFoundError("Virtual file not found")
+    return {
+        account.user_id: account
+        for account in (
+            db.query(UserCloudAccount)
+            .filter(
+                UserCloudAccount.user_id.in_(owner_ids),
+                UserCloudAccount.provider == "google_drive",
+            )
+            .all()
+        )
+    }
 
-    chunks = (
+
+def _build_upload_tasks(
+    accounts: dict,
+    virtual_file: VirtualFile,
+    chunks: List[FileChunk],
+    targets: dict | None = None,
+) -> List[ChunkUploadTask]:
+    """
+    Resolves each chunk owner's Drive client and app folder once.
+    Pass the same targets dict to share them across several files.
+    """
+
+    if targets is None:
+        targets = {}
+    tasks: List[ChunkUploadTask] = []
+
+    for chunk in chunks:
+        account = accounts.get(chunk.owner_user_id)
+        if not account:
+            raise Exception(f"User {chunk.owner_user_id} has no Google Drive linked")
+
+        if chunk.owner_user_id not in targets:
+            drive = get_drive_client(account)
+            targets[chunk.owner_user_id] = (drive, resolve_app_folder_id(account, drive))
+        drive, folder_id = targets[chunk.owner_user_id]
+
+        tasks.append(
+            ChunkUploadTask(
+                chunk_id=chunk.id,
+                owner_user_id=chunk.owner_user_id,
+                account_id=account.id,
+                drive=drive,
+                folder_id=folder_id,
+                chunk_name=f"chunk_{virtual_file.content_id}_{chunk.offset_bytes}.bin",
+                offset_bytes=chunk.offset_bytes,
+                size_bytes=chunk.size_bytes,
+            )
+        )
+
+    return tasks
+
+
+def _load_chunks(db: Session, virtual_file: VirtualFile) -> List[FileChunk]:
+    return (
         db.execute(
             select(FileChunk)
-            .where(FileChunk.virtual_file_id == virtual_file_id)
+            .where(FileChunk.content_id == virtual_file.content_id)
             .order_by(FileChunk.offset_bytes)
         )
         .scalars()
         .all()
     )
 
-    for chunk in chunks:
-        # 1. Get owner's Google account
-        account = (
-            db.query(UserCloudAccount)
-            .filter(
-                UserCloudAccount.user_id == chunk.owner_user_id,
-                UserCloudAccount.provider == "google_drive",
+
+def _load_chunks_in_range(db: Session, virtual_file: VirtualFile, start: int, end: int) -> List[FileChunk]:
+    return (
+        db.execute(
+            select(FileChunk)
+            .where(
+                FileChunk.content_id == virtual_file.content_id,
+                FileChunk.offset_bytes <= end,
+                FileChunk.offset_bytes + FileChunk.size_bytes > start,
             )
-            .first()
+            .order_by(FileChunk.offset_bytes)
         )
+        .scalars()
+        .all()
+    )
+
+
+def _record_uploaded_chunks(
+    db: Session,
+    virtual_file: VirtualFile,
+    chunks: List[FileChunk],
+    accounts: dict,
+    provider_file_ids: dict,
+    checksum: str | None = None,
+):
+    # All chunks are on Drive: record them in one transaction
+    for chunk in chunks:
+        chunk.provider = "google_drive"
+        chunk.provider_file_id = provider_file_ids[chunk.id]
+
+    # Complete content can now be shared by duplicate uploads. Only a
+    # checksum the server computed over the stored bytes keys it for
+    # dedup; placeholder or unverified content stays un-keyed.
+    virtual_file.content.status = "READY"
+    if checksum:
+        virtual_file.content.checksum = checksum
+    finalize_reservations(db, virtual_file.content_id)
+
+    # Keep app folder IDs that were re-resolved after a 404
+    for account in accounts.values():
+        folder_id = cached_app_folder_id(account.id)
+        if folder_id and folder_id != account.app_folder_id:
+            account.app_folder_id = folder_id
+
+
+def _tombstone_unrecorded(db: Session, chunks, provider_file_ids: dict):
+    # Queues objects of a failed upload ({chunk_id: provider_file_id})
+    # whose chunk or shard rows will never point at them
+    owners = {chunk.id: chunk.owner_user_id for chunk in chunks}
+    tombstone_objects(db, [
+        {"id": str(uuid.uuid4()), "owner_user_id": owners[chunk_id], "provider_file_id": provider_file_id}
+        for chunk_id, provider_file_id in provider_file_ids.items()
+    ])
+
+
+def _upload_chunks_in_parallel(
+    db: Session,
+    virtual_file: VirtualFile,
+    open_range,
+    on_chunk_uploaded=None,
+    checksum: str | None = None,
+):
+    # Chunks of deduplicated or already stored content are skipped, and
+    # so are chunks an earlier, interrupted attempt already stored
+    chunks = [
+        chunk for chunk in _load_chunks(db, virtual_file)
+        if chunk.provider_file_id == "PENDING"
+    ]
+
+    accounts = _load_owner_accounts(db, {chunk.owner_user_id for chunk in chunks})
+    tasks = _build_upload_tasks(accounts, virtual_file, chunks)
+
+    # Keep the reservation alive for the whole upload
+    extend_reservations(db, virtual_file.content_id)
+    db.commit()
+
+    provider_file_ids, errors = collect_chunk_uploads(
+        tasks,
+        lambda task: open_range(task.offset_bytes, task.size_bytes),
+        max_workers=settings.UPLOAD_MAX_WORKERS,
+        max_workers_per_owner=settings.UPLOAD_MAX_WORKERS_PER_OWNER,
+        part_size=settings.DRIVE_UPLOAD_PART_BYTES,
+        on_uploaded=on_chunk_uploaded,
+    )
+    if errors:
+        if on_chunk_uploaded is None:
+            # Nothing recorded the chunks that did reach Drive: reclaim them
+            _tombstone_unrecorded(db, chunks, provider_file_ids)
+            db.commit()
+        raise next(iter(errors.values()))
+
+    _record_uploaded_chunks(db, virtual_file, chunks, accounts, provider_file_ids, checksum)
+    db.commit()
+    schedule_small_chunk_replicas(db, virtual_file.trip_id, chunks)
+
+
+def _stripe_layout(content: FileContent) -> StripeLayout:
+    return StripeLayout(
+        data_shards=content.stripe_data_shards,
+        parity_shards=content.stripe_parity_shards,
+        cell_bytes=content.stripe_cell_bytes,
+        size_bytes=content.size_bytes,
+    )
+
 
+def _upload_stripes(db: Session, virtual_file: VirtualFile, read):
+    """
+    Encodes the bytes pulled from read(n) and streams every shard to its
+    owner concurrently. Returns (shards, accounts, provider_file_ids)
+    for _record_uploaded_chunks.
+    """
+
+    content = virtual_file.content
+    shards = list(content.shards)
+    accounts = _load_owner_accounts(db, {shard.owner_user_id for shard in shards})
+
+    tasks: List[ChunkUploadTask] = []
+    for shard in shards:
+        account = accounts.get(shard.owner_user_id)
         if not account:
-            raise Exception(f"User {chunk.owner_user_id} has no Google Drive linked")
+            raise Exception(f"User {shard.owner_user_id} has no Google Drive linked")
 
-        # 2. Drive client + app folder
         drive = get_drive_client(account)
-        folder_id = ensure_app_folder(drive)
-
-        # 3. Generate fake data (for now)
-        data = b"\x01" * chunk.size_bytes
+        tasks.append(
+            ChunkUploadTask(
+                chunk_id=shard.id,
+                owner_user_id=shard.owner_user_id,
+                account_id=account.id,
+                drive=drive,
+                folder_id=resolve_app_folder_id(account, drive),
+                chunk_name=f"shard_{content.id}_{shard.shard_index}.bin",
+                offset_bytes=0,
+                size_bytes=shard.size_bytes,
+            )
+        )
 
-        chunk_name = f"chunk_{virtual_file.id}_{chunk.offset_bytes}.bin"
+    # Keep the reservation alive for the whole upload
+    extend_reservations(db, content.id)
+    db.commit()
 
-        # 4. Upload
-        provider_file_id = upload_chunk_to_drive(
-            drive,
-            folder_id=folder_id,
-            chunk_name=chunk_name,
-            data=data,
+    uploaded = {}
+    try:
+        provider_file_ids = upload_stripes(
+            _stripe_layout(content),
+            tasks,
+            read,
+            part_size=settings.DRIVE_UPLOAD_PART_BYTES,
+            max_queued_cells=settings.STRIPE_QUEUED_CELLS,
+            on_uploaded=uploaded.__setitem__,
         )
+    except Exception:
+        # Shards that reached Drive are never recorded: reclaim them
+        _tombstone_unrecorded(db, shards, uploaded)
+        db.commit()
+        raise
+
+    return shards, accounts, provider_file_ids
 
-        # 5. Update DB
-        chunk.provider = "google_drive"
-        chunk.provider_file_id = provider_file_id
 
+def _store_stripes(db: Session, virtual_file: VirtualFile, read, checksum: str | None = None):
+    shards, accounts, provider_file_ids = _upload_stripes(db, virtual_file, read)
+    _record_uploaded_chunks(db, virtual_file, shards, accounts, provider_file_ids, checksum)
     db.commit()
 
 
+def upload_chunks_to_google_drive(
+    *,
+    db: Session,
+    virtual_file_id: str,
+    on_chunk_uploaded=None,
+):
+    """
+    Uploads all chunks of a VirtualFile to the respective
+    owners' Google Drives and updates provider_file_id.
+    on_chunk_uploaded(chunk_id, provider_file_id) is called from the
+    upload threads as each chunk completes.
+    """
+
+    virtual_file = db.get(VirtualFile, virtual_file_id)
+    if not virtual_file:
+        raise FileNotFoundError("Virtual file not found")
+
+    # Generate fake data (for now)
+    if virtual_file.content.storage_mode == "stripes":
+        _store_stripes(db, virtual_file, io.BytesIO(b"\x01" * virtual_file.size_bytes).read)
+        return
+
+    _upload_chunks_in_parallel(
+        db,
+        virtual_file,
+        lambda offset, size: io.BytesIO(b"\x01" * size),
+        on_chunk_uploaded,
+    )
+
+
 
 # Real Bytes Upload
 
@@ -271,62 +992,249 @@ def upload_real_file_to_google_drive(
         db: Session,
         Virtual_file_id: str,
         file_stream,
+        on_chunk_uploaded=None,
+        checksum: str | None = None,
+):
+    """
+    Uploads real file bytes to the respective users' Google Drives.
+    Chunks for different owners are sent concurrently, each one
+    reading its own byte range from file_stream (see
+    upload_chunks_to_google_drive for on_chunk_uploaded).
+
+    checksum is the SHA-256 the server computed over file_stream; it
+    makes the stored content available to dedup.
+    """
+
+    virtual_file = db.get(VirtualFile, Virtual_file_id)
+    if not virtual_file:
+        raise FileNotFoundError("Virtual file not found")
+
+    if virtual_file.content.storage_mode == "stripes":
+        file_stream.seek(0)
+        _store_stripes(db, virtual_file, file_stream.read, checksum)
+        return
+
+    _upload_chunks_in_parallel(
+        db,
+        virtual_file,
+        FileRangeReader(file_stream).open_range,
+        on_chunk_uploaded,
+        checksum,
+    )
+
+
+def upload_files_batch_to_google_drive(
+    *,
+    db: Session,
+    uploads: List[Tuple[VirtualFile, object, str | None]],
+) -> dict:
+    """
+    Uploads the chunks of many files through one worker pool, with one
+    account lookup and one Drive client / app folder per owner.
+
+    uploads is a list of (VirtualFile, seekable file stream, SHA-256 the
+    server computed over the stream or None). A file
+    whose chunks fail is deleted again (releasing its plan) without
+    affecting the others. Returns {virtual_file_id: error or None}.
+    """
+
+    # One upload per PENDING content; duplicates in the batch share it
+    by_content = {}
+    for virtual_file, file_stream, checksum in uploads:
+        if virtual_file.content.status != "READY":
+            by_content.setdefault(virtual_file.content_id, (virtual_file, file_stream, checksum))
+
+    chunks_by_content = {}
+    for chunk in db.execute(
+        select(FileChunk)
+        .where(
+            FileChunk.content_id.in_(list(by_content)),
+            FileChunk.provider_file_id == "PENDING",
+        )
+        .order_by(FileChunk.offset_bytes)
+    ).scalars():
+        chunks_by_content.setdefault(chunk.content_id, []).append(chunk)
+
+    accounts = _load_owner_accounts(
+        db,
+        {chunk.owner_user_id for chunks in chunks_by_content.values() for chunk in chunks},
+    )
+
+    targets = {}
+    tasks = []
+    readers = {}
+    setup_errors = {}
+    for content_id, (virtual_file, file_stream, _) in by_content.items():
+        try:
+            content_tasks = _build_upload_tasks(
+                accounts,
+                virtual_file,
+                chunks_by_content.get(content_id, []),
+                targets=targets,
+            )
+        except Exception as e:
+            setup_errors[content_id] = e
+            continue
+
+        reader = FileRangeReader(file_stream)
+        for task in content_tasks:
+            readers[task.chunk_id] = reader
+        tasks.extend(content_tasks)
+        extend_reservations(db, content_id)
+    db.commit()
+
+    provider_file_ids, chunk_errors = collect_chunk_uploads(
+        tasks,
+        lambda task: readers[task.chunk_id].open_range(task.offset_bytes, task.size_bytes),
+        max_workers=settings.UPLOAD_MAX_WORKERS,
+        max_workers_per_owner=settings.UPLOAD_MAX_WORKERS_PER_OWNER,
+        part_size=settings.DRIVE_UPLOAD_PART_BYTES,
+        fail_fast=False,
+    )
+
+    content_errors = dict(setup_errors)
+    stored_chunks = defaultdict(list)
+    for content_id, (virtual_file, _, checksum) in by_content.items():
+        if content_id in content_errors:
+            continue
+        chunks = chunks_by_content.get(content_id, [])
+        failed = [chunk_errors[c.id] for c in chunks if c.id in chunk_errors]
+        if failed:
+            content_errors[content_id] = failed[0]
+            # Chunks that did reach Drive are reclaimed with the content
+            for chunk in chunks:
+                if chunk.id in provider_file_ids:
+                    chunk.provider = "google_drive"
+                    chunk.provider_file_id = provider_file_ids[chunk.id]
+            continue
+        _record_uploaded_chunks(db, virtual_file, chunks, accounts, provider_file_ids, checksum)
+        stored_chunks[virtual_file.trip_id].extend(chunks)
+    db.commit()
+    for trip_id, trip_chunks in stored_chunks.items():
+        schedule_small_chunk_replicas(db, trip_id, trip_chunks)
+
+    # Failed contents are released together with every file using them
+    results = {}
+    for virtual_file, _, _ in uploads:
+        error = content_errors.get(virtual_file.content_id)
+        results[virtual_file.id] = error
+        if error is not None:
+            try:
+                delete_virtual_file(db=db, virtual_file_id=virtual_file.id)
+            except FileNotFoundError:
+                pass
+
+    return results
+
+
+# Pipelined streaming upload
+
+def _renewing_read(db: Session, content_id: str, read):
+    # read(n) that keeps the reservation alive while the body arrives;
+    # it runs on the thread that owns db
+    renewal = ReservationRenewal()
+
+    def _read(size: int) -> bytes:
+        if renewal.due():
+            extend_reservations(db, content_id)
+            db.commit()
+        return read(size)
+
+    return _read
+
+
+def stream_file_to_google_drive(
+    *,
+    db: Session,
+    virtual_file_id: str,
+    stream,
+    expected_checksum: str | None = None,
 ):
-      """
-    Streams real file bytes and uploads them chunk-by-chunk
-    to respective users' Google Drives.
-    """
-      
-      Virtual_file = db.get(VirtualFile, Virtual_file_id)
-      if not Virtual_file:
-          raise FileNotFoundError("Virtual file not found")
-      
-      chunks = (
-          db.execute(
-              select(FileChunk)
-              .where(FileChunk.virtual_file_id == Virtual_file_id)
-              .order_by(FileChunk.offset_bytes)
-
-          ).scalars()
-          .all()
-      )
-
-      for chunk in chunks:
-          account = (
-              db.query(UserCloudAccount)
-              .filter(
-                  UserCloudAccount.user_id == chunk.owner_user_id,
-                  UserCloudAccount.provider == "goodle_drive",
-              )
-              .first()
-          )
-
-          if not account:
-              raise Exception(f"User {chunk.owner_user_id} has no Google Drive linked")
-          
-          drive = get_drive_client(account)
-          folder_id = ensure_app_folder(drive)
-
-        #   Read Exact bytes for this chunk
-
-          data = file_stream.read(chunk.size_bytes)
-      
-          if len(data) != chunk.size_bytes:
-              raise Exception("Failed to read enough bytes for chunk")
-          
-          chunk_name= f"chunk_{Virtual_file.id}_{chunk.offset_bytes}.bin"
-
-          provider_file_id = upload_chunk_to_drive(
-              drive,
-              folder_id=folder_id,
-              chunk_name=chunk_name,
-              data=data,
-          )
-          chunk.provider = "google_drive"
-          chunk.provider_file_id = provider_file_id
-
-      db.commit()
-      
+    """
+    Uploads a file whose bytes are still arriving. stream.read(n) is
+    consumed sequentially and each chunk's byte range is forwarded to
+    its owner's Drive through a resumable upload while it is received.
+    Striped files are encoded on the fly, all shards uploading at once.
+    """
+
+    virtual_file = db.get(VirtualFile, virtual_file_id)
+    if not virtual_file:
+        raise FileNotFoundError("Virtual file not found")
+
+    read = _renewing_read(db, virtual_file.content_id, stream.read)
+    if virtual_file.content.storage_mode == "stripes":
+        chunks, accounts, provider_file_ids = _upload_stripes(db, virtual_file, read)
+    else:
+        chunks, accounts = begin_stream_upload(db, virtual_file)
+        tasks = _build_upload_tasks(accounts, virtual_file, chunks)
+
+        provider_file_ids = {}
+        for chunk, task in zip(chunks, tasks):
+            provider_file_ids[task.chunk_id] = stream_chunk_upload(
+                task,
+                read,
+                part_size=settings.DRIVE_UPLOAD_PART_BYTES,
+            )
+            record_streamed_chunk(db, chunk, provider_file_ids[task.chunk_id])
+
+    if stream.read(1):
+        raise Exception("Request body is larger than the declared file size")
+
+    if expected_checksum and stream.checksum != expected_checksum:
+        raise Exception("Checksum mismatch")
+
+    finish_stream_upload(db, virtual_file, chunks, accounts, provider_file_ids, stream.checksum)
+
+
+def begin_stream_upload(db: Session, virtual_file: VirtualFile) -> Tuple[List[FileChunk], dict]:
+    """
+    Loads the chunks of a chunked file about to be streamed and their
+    owners' Drive accounts, and extends its reservation for the upload.
+    Commits.
+    """
+
+    chunks = _load_chunks(db, virtual_file)
+    accounts = _load_owner_accounts(db, {chunk.owner_user_id for chunk in chunks})
+    for chunk in chunks:
+        if chunk.owner_user_id not in accounts:
+            raise Exception(f"User {chunk.owner_user_id} has no Google Drive linked")
+
+    # Keep the reservation alive for the whole upload
+    extend_reservations(db, virtual_file.content_id)
+    db.commit()
+
+    return chunks, accounts
+
+
+def record_streamed_chunk(db: Session, chunk: FileChunk, provider_file_id: str):
+    """
+    Records one chunk of a streamed upload as soon as it is on Drive, so
+    that deleting the file after a failed upload reclaims it. The
+    content stays PENDING until finish_stream_upload. Commits.
+    """
+
+    chunk.provider = "google_drive"
+    chunk.provider_file_id = provider_file_id
+    db.commit()
+
+
+def finish_stream_upload(
+    db: Session,
+    virtual_file: VirtualFile,
+    chunks: list,
+    accounts: dict,
+    provider_file_ids: dict,
+    checksum: str,
+):
+    """Records a verified streamed upload (chunks or shards) and commits."""
+
+    virtual_file.checksum = checksum
+    _record_uploaded_chunks(db, virtual_file, chunks, accounts, provider_file_ids, checksum)
+    db.commit()
+
+    if virtual_file.content.storage_mode == "chunks":
+        schedule_small_chunk_replicas(db, virtual_file.trip_id, chunks)
+
 
     #   Download Chunk from drive
 
@@ -334,49 +1242,160 @@ def stream_virtual_file_from_drive(
     *,
     db: Session,
     virtual_file_id: str,
+    start: int = 0,
+    end: int | None = None,
 ):
     """
-    Generator that streams reconstructed file bytes
-    from Google Drive chunks in correct order.
+    Returns an iterator over bytes start..end (inclusive) of a file,
+    reconstructed from its Google Drive chunks in correct order.
+
+    Only chunks (or dedup blocks) overlapping the range are fetched; the
+    partial ones at either end use ranged Drive reads. Lookup errors are raised
+    here, before any byte is streamed.
     """
 
     virtual_file = db.get(VirtualFile, virtual_file_id)
     if not virtual_file:
         raise FileNotFoundError("Virtual file not found")
-
-    chunks = (
-        db.execute(
-            select(FileChunk)
-            .where(FileChunk.virtual_file_id == virtual_file_id)
-            .order_by(FileChunk.offset_bytes)
-        )
-        .scalars()
-        .all()
+    if virtual_file.content.status != "READY":
+        raise FileNotReadyError("File is still being uploaded")
+
+    if end is None:
+        end = virtual_file.size_bytes - 1
+
+    if virtual_file.content.storage_mode == "stripes":
+        return _stream_stripes(db, virtual_file.content, start, end)
+
+    # Replicated chunks are read hedged: a slow copy is raced by the next one
+    sources = [
+        hedged_source([
+            _chunk_download_source(account, provider_file_id, chunk_start, chunk_end, chunk_size)
+            for account, provider_file_id in copies
+        ])
+        for copies, chunk_start, chunk_end, chunk_size in plan_chunk_reads(db, virtual_file, start, end)
+    ]
+
+    # Next chunks are fetched in the background while the current one streams
+    return prefetch_ordered(
+        sources,
+        window=settings.DOWNLOAD_PREFETCH_CHUNKS,
+        max_buffer_bytes=settings.DOWNLOAD_PREFETCH_MAX_BUFFER_BYTES,
     )
 
+
+def plan_chunk_reads(db: Session, virtual_file: VirtualFile, start: int, end: int) -> list:
+    """
+    Lookups of a chunked or block download. Returns, for every chunk
+    (or block) overlapping start..end in order, (copies, chunk_start,
+    chunk_end, chunk_size): copies are (account, provider_file_id)
+    pairs, primary first, and chunk_start..chunk_end is the byte range
+    needed from the chunk.
+    """
+
+    replicas = defaultdict(list)
+    if virtual_file.content.storage_mode == "blocks":
+        chunks = load_block_pieces(db, virtual_file.content_id, start, end)
+    else:
+        chunks = _load_chunks_in_range(db, virtual_file, start, end)
+        for replica in db.execute(
+            select(ChunkReplica).where(ChunkReplica.chunk_id.in_([chunk.id for chunk in chunks]))
+        ).scalars():
+            replicas[replica.chunk_id].append(replica)
+
     if not chunks:
         raise FileNotFoundError("No chunks found for file")
 
+    accounts = _load_owner_accounts(
+        db,
+        {chunk.owner_user_id for chunk in chunks}
+        | {replica.owner_user_id for copies in replicas.values() for replica in copies},
+    )
+
+    reads = []
     for chunk in chunks:
-        account = (
-            db.query(UserCloudAccount)
-            .filter(
-                UserCloudAccount.user_id == chunk.owner_user_id,
-                UserCloudAccount.provider == "google_drive",
-            )
-            .first()
-        )
+        account = accounts.get(chunk.owner_user_id)
 
         if not account or not chunk.provider_file_id:
             raise Exception(
                 f"Chunk owner {chunk.owner_user_id} not linked to Google Drive"
             )
 
-        drive = get_drive_client(account)
+        # Byte range needed from this chunk, relative to the chunk
+        chunk_start = max(start - chunk.offset_bytes, 0)
+        chunk_end = min(end - chunk.offset_bytes, chunk.size_bytes - 1)
+
+        copies = [(account, chunk.provider_file_id)] + [
+            (accounts[replica.owner_user_id], replica.provider_file_id)
+            for replica in (replicas.get(chunk.id, []) if replicas else [])
+            if replica.owner_user_id in accounts
+        ]
+        if chunk_cache.contains(chunk.provider_file_id):
+            # Served from local disk; no need to race other copies
+            copies = copies[:1]
+
+        reads.append((copies, chunk_start, chunk_end, chunk.size_bytes))
+
+    if virtual_file.content.storage_mode != "blocks" and replicates_chunks(db, virtual_file.trip_id):
+        chunk_replicator.record_reads(chunk.id for chunk in chunks)
+
+    return reads
+
+
+def _stream_stripes(db: Session, content: FileContent, start: int, end: int):
+    # Striped files are rebuilt from any k of their shards
+    layout = _stripe_layout(content)
+    shards = {shard.shard_index: shard for shard in content.shards}
+    accounts = _load_owner_accounts(db, {shard.owner_user_id for shard in shards.values()})
 
-        # Stream this chunk from Drive
-        for data in download_chunk_from_drive(
+    readable = [shard for shard in shards.values() if shard.owner_user_id in accounts]
+    if len(readable) < layout.data_shards:
+        raise Exception("Too many shard owners are not linked to Google Drive")
+
+    def _open_shard(index: int, first_byte: int, last_byte: int):
+        shard = shards[index]
+        account = accounts.get(shard.owner_user_id)
+        if not account:
+            raise Exception(f"Shard owner {shard.owner_user_id} not linked to Google Drive")
+        return _chunk_download_source(account, shard.provider_file_id, first_byte, last_byte, shard.size_bytes)()
+
+    return read_stripes(
+        layout,
+        _open_shard,
+        start,
+        end,
+        slow_after=settings.STRIPE_SLOW_SHARD_MS / 1000,
+        max_queued_cells=settings.STRIPE_QUEUED_CELLS,
+    )
+
+
+def _chunk_download_source(
+    account: UserCloudAccount,
+    provider_file_id: str,
+    start: int,
+    end: int,
+    chunk_size: int,
+):
+    def _source():
+        cached = chunk_cache.read(provider_file_id, start, end)
+        if cached is not None:
+            return cached
+
+        drive = get_drive_client(account)
+        if start == 0 and end == chunk_size - 1:
+            # Whole objects are kept for the next reader
+            return chunk_cache.fill(
+                provider_file_id,
+                chunk_size,
+                download_chunk_from_drive(
+                    drive,
+                    provider_file_id=provider_file_id,
+                ),
+            )
+        return download_chunk_range_from_drive(
             drive,
-            provider_file_id=chunk.provider_file_id,
-        ):
-            yield data
+            provider_file_id,
+            start,
+            end,
+        )
+
+    return _source
@@ -0,0 +1,312 @@
+import logging
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.trip import Trip
+from app.services.erasure import ReedSolomon
+from app.services.upload_engine import ChunkUploadTask, stream_chunk_upload
+
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Stripe Layout
+# =========================
+
+@dataclass
+class StripeLayout:
+    """
+    A file cut into stripes of data_shards cells; each stripe also gets
+    parity_shards parity cells. Shard i is cell i of every stripe, so
+    all shards have the same size and the last stripe is zero padded.
+    """
+
+    data_shards: int
+    parity_shards: int
+    cell_bytes: int
+    size_bytes: int
+
+    @property
+    def total_shards(self) -> int:
+        return self.data_shards + self.parity_shards
+
+    @property
+    def stripe_bytes(self) -> int:
+        return self.data_shards * self.cell_bytes
+
+    @property
+    def stripes(self) -> int:
+        return max(1, -(-self.size_bytes // self.stripe_bytes))
+
+    @property
+    def shard_bytes(self) -> int:
+        return self.stripes * self.cell_bytes
+
+
+def default_stripe_layout(size_bytes: int) -> StripeLayout:
+    return StripeLayout(
+        data_shards=settings.STRIPE_DATA_SHARDS,
+        parity_shards=settings.STRIPE_PARITY_SHARDS,
+        cell_bytes=settings.STRIPE_CELL_BYTES,
+        size_bytes=size_bytes,
+    )
+
+
+def stripes_large_files(db: Session, trip_id: str) -> bool:
+    return bool(db.execute(select(Trip.stripe_large_files).where(Trip.id == trip_id)).scalar())
+
+
+# =========================
+# Striped Upload
+# =========================
+
+class _PipeAborted(Exception):
+    pass
+
+
+class _CellPipe:
+    """
+    Bounded hand-off of cells from the encoder to one shard's upload
+    thread, exposed to the upload as a blocking read(n).
+    """
+
+    def __init__(self, max_queued_cells: int):
+        self._queue = queue.Queue(maxsize=max(1, max_queued_cells))
+        self._aborted = threading.Event()
+        self._leftover = b""
+
+    def abort(self):
+        self._aborted.set()
+
+    def put(self, cell: bytes):
+        while not self._aborted.is_set():
+            try:
+                self._queue.put(cell, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+        raise _PipeAborted("Striped upload was aborted")
+
+    def read(self, size: int) -> bytes:
+        while not self._leftover:
+            if self._aborted.is_set():
+                raise _PipeAborted("Striped upload was aborted")
+            try:
+                self._leftover = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+        data, self._leftover = self._leftover[:size], self._leftover[size:]
+        return data
+
+
+def _read_exact(read: Callable[[int], bytes], size: int) -> bytes:
+    parts = []
+    while size > 0:
+        data = read(size)
+        if not data:
+            raise Exception("Stream ended before the declared size")
+        parts.append(data)
+        size -= len(data)
+    return b"".join(parts)
+
+
+def upload_stripes(
+    layout: StripeLayout,
+    tasks: List[ChunkUploadTask],
+    read: Callable[[int], bytes],
+    *,
+    part_size: int,
+    max_queued_cells: int,
+    on_uploaded: Optional[Callable[[str, str], None]] = None,
+) -> Dict[str, str]:
+    """
+    Encodes the bytes pulled from read(n) stripe by stripe and streams
+    every shard to its owner at the same time; tasks[i] uploads shard i.
+    Memory stays around max_queued_cells cells per shard.
+
+    Returns {task.chunk_id: provider_file_id}. If one shard fails, the
+    others are aborted and its error is raised; on_uploaded(chunk_id,
+    provider_file_id) has been called for every shard that did finish.
+    """
+
+    codec = ReedSolomon(layout.data_shards, layout.parity_shards)
+    cell = layout.cell_bytes
+    pipes = [_CellPipe(max_queued_cells) for _ in tasks]
+
+    def _abort_all(future=None):
+        if future is None or future.exception() is not None:
+            for pipe in pipes:
+                pipe.abort()
+
+    def _upload_shard(task: ChunkUploadTask, pipe: _CellPipe) -> str:
+        provider_file_id = stream_chunk_upload(task, pipe.read, part_size=part_size)
+        # Reported before the future completes, so before any error is raised
+        if on_uploaded is not None:
+            on_uploaded(task.chunk_id, provider_file_id)
+        return provider_file_id
+
+    with ThreadPoolExecutor(max_workers=len(tasks), thread_name_prefix="shard-upload") as pool:
+        futures = [
+            pool.submit(_upload_shard, task, pipe)
+            for task, pipe in zip(tasks, pipes)
+        ]
+        for future in futures:
+            future.add_done_callback(_abort_all)
+
+        try:
+            remaining = layout.size_bytes
+            for _ in range(layout.stripes):
+                data = _read_exact(read, min(layout.stripe_bytes, remaining))
+                remaining -= len(data)
+
+                data = data.ljust(layout.stripe_bytes, b"\0")
+                cells = [data[i * cell:(i + 1) * cell] for i in range(layout.data_shards)]
+                for pipe, shard_cell in zip(pipes, cells + codec.encode(cells)):
+                    pipe.put(shard_cell)
+        except _PipeAborted:
+            pass  # a shard upload failed; its error is raised below
+        except Exception:
+            _abort_all()
+            raise
+
+        wait(futures)
+
+    errors = [future.exception() for future in futures if future.exception() is not None]
+    if errors:
+        raise next((e for e in errors if not isinstance(e, _PipeAborted)), errors[0])
+
+    return {task.chunk_id: future.result() for task, future in zip(tasks, futures)}
+
+
+# =========================
+# Striped Download
+# =========================
+
+class _ShardReader:
+    """
+    Fetches cells first_stripe..last_stripe of one shard in a background
+    thread, keeping at most max_queued_cells of them ready.
+    """
+
+    def __init__(
+        self,
+        open_range: Callable[[int, int], Iterable[bytes]],
+        first_stripe: int,
+        last_stripe: int,
+        cell_bytes: int,
+        max_queued_cells: int,
+    ):
+        self._open_range = open_range
+        self._first_stripe = first_stripe
+        self._last_stripe = last_stripe
+        self._cell_bytes = cell_bytes
+        self._queue = queue.Queue(maxsize=max(1, max_queued_cells))
+        self._stopped = threading.Event()
+
+        threading.Thread(target=self._run, name="shard-read", daemon=True).start()
+
+    def _put(self, item) -> bool:
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        cell = self._cell_bytes
+        buffer = bytearray()
+        try:
+            for piece in self._open_range(self._first_stripe * cell, (self._last_stripe + 1) * cell - 1):
+                buffer += piece
+                while len(buffer) >= cell:
+                    if not self._put(bytes(buffer[:cell])):
+                        return
+                    del buffer[:cell]
+            if buffer:
+                raise Exception("Shard ended in the middle of a cell")
+        except Exception as e:
+            self._put(e)
+
+    def next_cell(self, timeout: float | None) -> bytes:
+        # queue.Empty on timeout; a download error is raised as is
+        item = self._queue.get(timeout=timeout)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def stop(self):
+        self._stopped.set()
+
+
+def read_stripes(
+    layout: StripeLayout,
+    open_shard: Callable[[int, int, int], Iterable[bytes]],
+    start: int,
+    end: int,
+    *,
+    slow_after: float,
+    max_queued_cells: int,
+) -> Iterator[bytes]:
+    """
+    Yields bytes start..end (inclusive) of a striped file.
+    open_shard(index, first_byte, last_byte) streams a range of shard i.
+
+    The data shards are read in parallel. A shard that fails, or keeps
+    the next stripe waiting longer than slow_after seconds, is dropped
+    and a parity shard takes over from the current stripe; any k cells
+    of a stripe rebuild it.
+    """
+
+    codec = ReedSolomon(layout.data_shards, layout.parity_shards)
+    first = start // layout.stripe_bytes
+    last = end // layout.stripe_bytes
+
+    def _reader(index: int, from_stripe: int) -> _ShardReader:
+        return _ShardReader(
+            lambda first_byte, last_byte: open_shard(index, first_byte, last_byte),
+            from_stripe,
+            last,
+            layout.cell_bytes,
+            max_queued_cells,
+        )
+
+    active = {index: _reader(index, first) for index in range(layout.data_shards)}
+    spares = list(range(layout.data_shards, layout.total_shards))
+
+    try:
+        for stripe in range(first, last + 1):
+            cells = {}
+            pending = list(active)
+            while len(cells) < layout.data_shards:
+                index = pending.pop(0)
+                try:
+                    cells[index] = active[index].next_cell(timeout=slow_after if spares else None)
+                except Exception as e:
+                    active.pop(index).stop()
+                    if not spares:
+                        raise
+                    spare = spares.pop(0)
+                    reason = "too slow" if isinstance(e, queue.Empty) else repr(e)
+                    logger.warning("Shard %d replaced by parity shard %d: %s", index, spare, reason)
+                    active[spare] = _reader(spare, stripe)
+                    pending.append(spare)
+
+            data = b"".join(codec.decode(cells))
+            stripe_start = stripe * layout.stripe_bytes
+            low = start - stripe_start if stripe == first else 0
+            high = end - stripe_start + 1 if stripe == last else layout.stripe_bytes
+            yield data[low:high]
+    finally:
+        for reader in active.values():
+            reader.stop()
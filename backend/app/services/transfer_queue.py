@@ -0,0 +1,460 @@
+import logging
+import os
+import socket
+import tempfile
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import BinaryIO, List, Set
+
+from sqlalchemy import select, update, or_, and_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.file_chunk import FileChunk
+from app.models.file_shard import FileShard
+from app.models.transfer_job import TransferJob
+from app.models.virtual_file import VirtualFile
+from app.services.quota_service import extend_reservations_of
+from app.services.storage_service import (
+    FileNotFoundError,
+    delete_virtual_file,
+    upload_chunks_to_google_drive,
+    upload_real_file_to_google_drive,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Exceptions
+# =========================
+
+class TransferJobNotFoundError(Exception):
+    pass
+
+
+# =========================
+# Enqueueing
+# =========================
+
+_ACTIVE_STATUSES = ["QUEUED", "RUNNING"]
+
+
+def open_staging_file() -> BinaryIO:
+    """
+    A new file in the staging directory, for an upload body to be
+    written to as it arrives. enqueue_transfer takes it over; if no job
+    does, the caller removes it with remove_staged_file.
+    """
+
+    os.makedirs(settings.TRANSFER_STAGING_DIR, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=settings.TRANSFER_STAGING_DIR, suffix=".incoming", delete=False)
+
+
+def remove_staged_file(staged_path: str | None):
+    if not staged_path:
+        return
+    try:
+        os.unlink(staged_path)
+    except OSError:
+        pass
+
+
+def enqueue_transfer(
+    db: Session,
+    *,
+    virtual_file: VirtualFile,
+    staged_file=None,
+    checksum: str | None = None,
+    priority: int = 0,
+) -> TransferJob:
+    """
+    Queues the Drive upload of a planned file: the bytes of staged_file
+    (from open_staging_file, with the SHA-256 computed while it was
+    written), or generated bytes (as upload_chunks_to_google_drive)
+    without one.
+    """
+
+    job_id = str(uuid.uuid4())
+    staged_path = None
+    if staged_file is not None:
+        # The job takes the file over by renaming it, not by copying;
+        # it stays until the job is finished, also across restarts
+        staged_file.flush()
+        staged_path = os.path.join(settings.TRANSFER_STAGING_DIR, f"{job_id}.upload")
+        os.replace(staged_file.name, staged_path)
+    kind = "store_file" if staged_path else "store_placeholder"
+
+    job = TransferJob(
+        id=job_id,
+        kind=kind,
+        trip_id=virtual_file.trip_id,
+        user_id=virtual_file.uploaded_by,
+        virtual_file_id=virtual_file.id,
+        staged_path=staged_path,
+        checksum=checksum,
+        priority=priority,
+        max_attempts=max(1, settings.TRANSFER_MAX_ATTEMPTS),
+    )
+    try:
+        db.add(job)
+        db.commit()
+    except Exception:
+        db.rollback()
+        remove_staged_file(staged_path)
+        raise
+
+    logger.info("Transfer job %s queued: %s of file %s", job.id, kind, virtual_file.id)
+    return job
+
+
+# =========================
+# Job Status
+# =========================
+
+def describe_transfer_job(db: Session, job_id: str) -> dict:
+    """
+    Status of a job plus the upload state of every chunk (or shard) of
+    its file: stored once the chunk is on Drive, pending otherwise.
+    """
+
+    job = db.get(TransferJob, job_id)
+    if not job:
+        raise TransferJobNotFoundError("Transfer job not found")
+
+    virtual_file = db.get(VirtualFile, job.virtual_file_id) if job.virtual_file_id else None
+    striped = virtual_file is not None and virtual_file.content.storage_mode == "stripes"
+
+    pieces = []
+    if virtual_file is not None:
+        content = virtual_file.content
+        if striped:
+            for shard in db.execute(
+                select(FileShard)
+                .where(FileShard.content_id == content.id)
+                .order_by(FileShard.shard_index)
+            ).scalars():
+                pieces.append({
+                    "shard_index": shard.shard_index,
+                    "owner_user_id": shard.owner_user_id,
+                    "size_bytes": shard.size_bytes,
+                    "status": "pending" if shard.provider_file_id == "PENDING" else "stored",
+                })
+        else:
+            for chunk in db.execute(
+                select(FileChunk)
+                .where(FileChunk.content_id == content.id)
+                .order_by(FileChunk.offset_bytes)
+            ).scalars():
+                pieces.append({
+                    "offset_bytes": chunk.offset_bytes,
+                    "owner_user_id": chunk.owner_user_id,
+                    "size_bytes": chunk.size_bytes,
+                    "status": "pending" if chunk.provider_file_id == "PENDING" else "stored",
+                })
+
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "priority": job.priority,
+        "virtual_file_id": job.virtual_file_id,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "last_error": job.last_error,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "next_attempt_at": job.next_attempt_at if job.status == "QUEUED" else None,
+        "total_bytes": sum(piece["size_bytes"] for piece in pieces),
+        "stored_bytes": sum(piece["size_bytes"] for piece in pieces if piece["status"] == "stored"),
+        "shards" if striped else "chunks": pieces,
+    }
+
+
+# =========================
+# Worker Pool
+# =========================
+
+def _record_stored_chunk(chunk_id: str, provider_file_id: str):
+    # Committed as each chunk lands, so a retried job (or the status
+    # endpoint) sees it; the upload's own transaction records the rest
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(FileChunk)
+            .where(FileChunk.id == chunk_id, FileChunk.provider_file_id == "PENDING")
+            .values(provider="google_drive", provider_file_id=provider_file_id)
+        )
+        db.commit()
+    except Exception as e:
+        logger.warning("Stored chunk %s not recorded: %s", chunk_id, e)
+    finally:
+        db.close()
+
+
+class TransferWorkerPool:
+    """
+    Worker threads running queued transfer jobs, highest priority
+    first. A job is claimed with a conditional UPDATE that takes its
+    lease, so any number of processes can share the table. A heartbeat
+    thread renews the leases of running jobs and keeps the quota
+    reservations of queued ones alive.
+
+    Failed attempts are retried with exponential backoff; chunks that
+    reached Drive are not uploaded again. After the last attempt the
+    file is deleted, releasing its plan.
+    """
+
+    def __init__(
+        self,
+        *,
+        workers: int,
+        poll_interval_seconds: float,
+        lease_seconds: int,
+        heartbeat_seconds: int,
+        retry_base_seconds: float,
+        retry_max_seconds: int,
+    ):
+        self._workers = max(1, workers)
+        self._poll_interval_seconds = poll_interval_seconds
+        self._lease_seconds = lease_seconds
+        self._heartbeat_seconds = max(1, min(heartbeat_seconds, lease_seconds // 2))
+        self._retry_base_seconds = retry_base_seconds
+        self._retry_max_seconds = retry_max_seconds
+
+        # Lease owner for every job claimed by this process
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._running: Set[str] = set()
+        self._running_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        if any(thread.is_alive() for thread in self._threads):
+            return
+        self._stopped.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"transfer-worker-{i}", daemon=True)
+            for i in range(self._workers)
+        ]
+        self._threads.append(threading.Thread(target=self._heartbeat, name="transfer-heartbeat", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float | None = None):
+        # Running uploads are not interrupted; their leases lapse and
+        # another worker resumes them
+        self._stopped.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                ran = self.run_once()
+            except Exception as e:
+                logger.exception("Transfer worker failed")
+                ran = False
+
+            if not ran:
+                self._stopped.wait(self._poll_interval_seconds)
+
+    def run_once(self) -> bool:
+        """Claims and runs one due job. Returns False if none was due."""
+
+        job_id = self._claim()
+        if job_id is None:
+            return False
+
+        with self._running_lock:
+            self._running.add(job_id)
+        try:
+            self._execute(job_id)
+        finally:
+            with self._running_lock:
+                self._running.discard(job_id)
+        return True
+
+    # ---- claiming ----
+
+    def _claimable(self, now: datetime):
+        return or_(
+            and_(TransferJob.status == "QUEUED", TransferJob.next_attempt_at <= now),
+            # Worker died or stalled mid-job
+            and_(TransferJob.status == "RUNNING", TransferJob.lease_expires_at <= now),
+        )
+
+    def _claim(self) -> str | None:
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            candidates = db.execute(
+                select(TransferJob.id)
+                .where(self._claimable(now))
+                .order_by(TransferJob.priority.desc(), TransferJob.next_attempt_at)
+                .limit(self._workers)
+            ).scalars().all()
+
+            for job_id in candidates:
+                claimed = db.execute(
+                    update(TransferJob)
+                    .where(TransferJob.id == job_id, self._claimable(now))
+                    .values(
+                        status="RUNNING",
+                        attempts=TransferJob.attempts + 1,
+                        lease_owner=self.worker_id,
+                        lease_expires_at=now + timedelta(seconds=self._lease_seconds),
+                        started_at=now,
+                    )
+                )
+                db.commit()
+                if claimed.rowcount == 1:
+                    return job_id
+            return None
+        finally:
+            db.close()
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self._heartbeat_seconds):
+            with self._running_lock:
+                running = list(self._running)
+            if not running:
+                continue
+
+            db = SessionLocal()
+            try:
+                renewed = db.execute(
+                    update(TransferJob)
+                    .where(
+                        TransferJob.id.in_(running),
+                        TransferJob.lease_owner == self.worker_id,
+                    )
+                    .values(lease_expires_at=datetime.utcnow() + timedelta(seconds=self._lease_seconds))
+                    .execution_options(synchronize_session=False)
+                )
+                if renewed.rowcount < len(running):
+                    logger.warning("Lease lost on %d transfer job(s)", len(running) - renewed.rowcount)
+
+                # Queued files must not lose their plan while they wait
+                extend_reservations_of(
+                    db,
+                    select(VirtualFile.content_id)
+                    .join(TransferJob, TransferJob.virtual_file_id == VirtualFile.id)
+                    .where(TransferJob.status.in_(_ACTIVE_STATUSES)),
+                )
+                db.commit()
+            except Exception as e:
+                logger.warning("Transfer heartbeat failed: %s", e)
+            finally:
+                db.close()
+
+    # ---- running ----
+
+    def _execute(self, job_id: str):
+        db = SessionLocal()
+        try:
+            job = db.get(TransferJob, job_id)
+            logger.info("Transfer job %s started, attempt %d of %d", job.id, job.attempts, job.max_attempts)
+
+            if job.attempts > job.max_attempts:
+                # Only reached through lapsed leases: the job keeps killing its worker
+                self._fail(db, job, Exception("Worker lost the job too many times"))
+                return
+
+            try:
+                self._transfer(db, job)
+            except Exception as e:
+                db.rollback()
+                if isinstance(e, FileNotFoundError) or job.attempts >= job.max_attempts:
+                    self._fail(db, job, e)
+                else:
+                    self._retry(db, job, e)
+                return
+
+            if self._finish(db, job, status="SUCCEEDED", finished_at=datetime.utcnow(), last_error=None):
+                remove_staged_file(job.staged_path)
+                logger.info("Transfer job %s succeeded", job.id)
+        finally:
+            db.close()
+
+    def _transfer(self, db: Session, job: TransferJob):
+        virtual_file = db.get(VirtualFile, job.virtual_file_id) if job.virtual_file_id else None
+        if virtual_file is None:
+            raise FileNotFoundError("Virtual file was deleted")
+
+        # Stored meanwhile, e.g. by an attempt that lost its lease
+        if virtual_file.content.status == "READY":
+            return
+
+        if job.kind == "store_file":
+            # The checksum was computed while the body was staged; the
+            # staged copy must still hold all of it
+            if os.path.getsize(job.staged_path) != virtual_file.size_bytes:
+                raise Exception(f"Staged upload of file {virtual_file.id} is incomplete")
+
+            with open(job.staged_path, "rb") as staged:
+                upload_real_file_to_google_drive(
+                    db,
+                    virtual_file.id,
+                    staged,
+                    on_chunk_uploaded=_record_stored_chunk,
+                    checksum=job.checksum,
+                )
+        elif job.kind == "store_placeholder":
+            upload_chunks_to_google_drive(
+                db=db,
+                virtual_file_id=virtual_file.id,
+                on_chunk_uploaded=_record_stored_chunk,
+            )
+        else:
+            raise Exception(f"Unknown transfer job kind {job.kind}")
+
+    def _finish(self, db: Session, job: TransferJob, **values) -> bool:
+        # Only the lease holder may move the job on
+        finished = db.execute(
+            update(TransferJob)
+            .where(TransferJob.id == job.id, TransferJob.lease_owner == self.worker_id)
+            .values(lease_owner=None, lease_expires_at=None, **values)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return finished.rowcount == 1
+
+    def _retry(self, db: Session, job: TransferJob, error: Exception):
+        backoff = min(self._retry_base_seconds * 2 ** (job.attempts - 1), self._retry_max_seconds)
+        self._finish(
+            db,
+            job,
+            status="QUEUED",
+            next_attempt_at=datetime.utcnow() + timedelta(seconds=backoff),
+            last_error=str(error)[:500],
+        )
+        logger.warning("Transfer job %s failed, retrying in %ss: %r", job.id, backoff, error)
+
+    def _fail(self, db: Session, job: TransferJob, error: Exception):
+        if not self._finish(db, job, status="FAILED", finished_at=datetime.utcnow(), last_error=str(error)[:500]):
+            return
+
+        # Give back the reserved plan and any chunks already on Drive
+        if job.virtual_file_id:
+            try:
+                delete_virtual_file(db=db, virtual_file_id=job.virtual_file_id)
+            except FileNotFoundError:
+                pass
+        remove_staged_file(job.staged_path)
+        logger.error("Transfer job %s failed: %r", job.id, error)
+
+
+transfer_worker_pool = TransferWorkerPool(
+    workers=settings.TRANSFER_WORKERS,
+    poll_interval_seconds=settings.TRANSFER_POLL_INTERVAL_SECONDS,
+    lease_seconds=settings.TRANSFER_LEASE_SECONDS,
+    heartbeat_seconds=settings.TRANSFER_HEARTBEAT_SECONDS,
+    retry_base_seconds=settings.TRANSFER_RETRY_BASE_SECONDS,
+    retry_max_seconds=settings.TRANSFER_RETRY_MAX_SECONDS,
+)
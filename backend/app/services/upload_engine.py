@@ -0,0 +1,252 @@
+import io
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ALL_COMPLETED, FIRST_EXCEPTION, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+from app.services.google_drive_service import (
+    upload_chunk_to_drive,
+    upload_stream_to_drive,
+    refresh_app_folder_id,
+    is_not_found,
+)
+
+
+# =========================
+# Upload Tasks
+# =========================
+
+@dataclass
+class ChunkUploadTask:
+    chunk_id: str
+    owner_user_id: str
+    account_id: str
+    drive: Any
+    folder_id: str
+    chunk_name: str
+    offset_bytes: int
+    size_bytes: int
+
+
+class FileRangeReader:
+    """
+    Hands out independent byte-range views of a single seekable stream
+    (e.g. the spooled file behind an upload).
+
+    seek + read on the shared stream is done under a lock so several
+    upload workers can pull their own range from it.
+    """
+
+    def __init__(self, file_stream):
+        self._stream = file_stream
+        self._lock = threading.Lock()
+
+    def open_range(self, offset: int, size: int) -> "FileRangeStream":
+        return FileRangeStream(self, offset, size)
+
+    def _read_at(self, position: int, size: int) -> bytes:
+        with self._lock:
+            self._stream.seek(position)
+            return self._stream.read(size)
+
+
+class FileRangeStream:
+    """
+    Seekable, read-only file-like view of [offset, offset + size).
+    Reads go to the shared stream on demand; nothing is buffered here.
+    """
+
+    def __init__(self, reader: FileRangeReader, offset: int, size: int):
+        self._reader = reader
+        self._offset = offset
+        self._size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, position: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            position += self._position
+        elif whence == io.SEEK_END:
+            position += self._size
+        self._position = max(0, min(position, self._size))
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self._size - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        if size == 0:
+            return b""
+
+        data = self._reader._read_at(self._offset + self._position, size)
+        if len(data) != size:
+            raise Exception("Failed to read enough bytes for chunk")
+
+        self._position += size
+        return data
+
+
+# =========================
+# Single Chunk Uploads
+# =========================
+
+def upload_to_app_folder(task: ChunkUploadTask, upload: Callable[[str], str]) -> str:
+    """
+    Runs upload(folder_id) against the task's app folder. If Drive says
+    the folder is gone (404), it is resolved again and upload retried once.
+    """
+
+    try:
+        return upload(task.folder_id)
+    except Exception as e:
+        if not is_not_found(e):
+            raise
+
+    folder_id = refresh_app_folder_id(task.account_id, task.drive, task.folder_id)
+    return upload(folder_id)
+
+
+def stream_chunk_upload(task: ChunkUploadTask, read: Callable[[int], bytes], *, part_size: int) -> str:
+    """
+    Forwards the next task.size_bytes bytes of a sequential stream to
+    the owner's Drive, one resumable part at a time.
+    """
+
+    return upload_to_app_folder(
+        task,
+        lambda folder_id: upload_stream_to_drive(
+            task.drive,
+            folder_id=folder_id,
+            chunk_name=task.chunk_name,
+            read=read,
+            size=task.size_bytes,
+            part_size=part_size,
+        ),
+    )
+
+
+def upload_chunk_bytes(task: ChunkUploadTask, data: bytes, *, part_size: int) -> str:
+    """
+    Uploads an in-memory chunk (e.g. a dedup block) to the owner's Drive.
+    """
+
+    return upload_to_app_folder(
+        task,
+        lambda folder_id: upload_chunk_to_drive(
+            task.drive,
+            folder_id=folder_id,
+            chunk_name=task.chunk_name,
+            stream=io.BytesIO(data),
+            part_size=part_size,
+        ),
+    )
+
+
+# =========================
+# Parallel Upload Engine
+# =========================
+
+def _interleave_by_owner(tasks: List[ChunkUploadTask]) -> List[ChunkUploadTask]:
+    # Round-robin over owners so early workers don't all queue
+    # behind the same owner's slots.
+    by_owner: Dict[str, List[ChunkUploadTask]] = defaultdict(list)
+    for task in tasks:
+        by_owner[task.owner_user_id].append(task)
+
+    ordered: List[ChunkUploadTask] = []
+    queues = list(by_owner.values())
+    while queues:
+        for queue in list(queues):
+            ordered.append(queue.pop(0))
+            if not queue:
+                queues.remove(queue)
+
+    return ordered
+
+
+def collect_chunk_uploads(
+    tasks: List[ChunkUploadTask],
+    open_range: Callable[[ChunkUploadTask], Any],
+    *,
+    max_workers: int,
+    max_workers_per_owner: int,
+    part_size: int,
+    fail_fast: bool = True,
+    on_uploaded: Callable[[str, str], None] | None = None,
+) -> Tuple[Dict[str, str], Dict[str, Exception]]:
+    """
+    Uploads chunks concurrently, bounded globally by max_workers and
+    per owner by max_workers_per_owner. open_range(task) must return a
+    seekable stream over that chunk's bytes.
+
+    Returns ({chunk_id: provider_file_id}, {chunk_id: error}). With
+    fail_fast, chunks not started yet are cancelled after the first
+    failure; otherwise every chunk is attempted. Either way, uploads
+    already running are waited for, so the results hold every chunk
+    that reached Drive. on_uploaded(chunk_id, provider_file_id) is
+    called from the upload thread as each chunk completes.
+    """
+
+    if not tasks:
+        return {}, {}
+
+    owner_slots = {
+        task.owner_user_id: threading.BoundedSemaphore(max(1, max_workers_per_owner))
+        for task in tasks
+    }
+
+    def _upload(task: ChunkUploadTask) -> str:
+        with owner_slots[task.owner_user_id]:
+            stream = open_range(task)
+            provider_file_id = upload_to_app_folder(
+                task,
+                lambda folder_id: upload_chunk_to_drive(
+                    task.drive,
+                    folder_id=folder_id,
+                    chunk_name=task.chunk_name,
+                    stream=stream,
+                    part_size=part_size,
+                ),
+            )
+
+        if on_uploaded is not None:
+            on_uploaded(task.chunk_id, provider_file_id)
+        return provider_file_id
+
+    results: Dict[str, str] = {}
+    errors: Dict[str, Exception] = {}
+    workers = max(1, min(max_workers, len(tasks)))
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chunk-upload") as pool:
+        futures = {
+            pool.submit(_upload, task): task
+            for task in _interleave_by_owner(tasks)
+        }
+
+        done, not_done = wait(futures, return_when=FIRST_EXCEPTION if fail_fast else ALL_COMPLETED)
+        for future in not_done:
+            future.cancel()
+
+        # Uploads in flight still land on Drive: keep their IDs
+        wait(not_done)
+
+        for future in futures:
+            if future.cancelled():
+                continue
+            chunk_id = futures[future].chunk_id
+            error = future.exception()
+            if error is not None:
+                errors[chunk_id] = error
+            else:
+                results[chunk_id] = future.result()
+
+    return results, errors
@@ -0,0 +1,321 @@
+import hashlib
+import logging
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.trip_member import TripMember
+from app.models.upload_session import UploadSession
+from app.models.virtual_file import VirtualFile
+from app.services.block_store import find_ready_blocks, store_file_blocks
+from app.services.chunking import iter_content_defined_blocks
+from app.services.quota_service import sweep_due
+from app.services.storage_service import (
+    create_virtual_file_for_blocks,
+    delete_virtual_file,
+    expire_quota_reservations,
+    InsufficientStorageError,
+    FileNotFoundError,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+# =========================
+# Exceptions
+# =========================
+
+class InvalidNegotiationError(Exception):
+    pass
+
+
+class UploadSessionNotFoundError(Exception):
+    pass
+
+
+class UploadSessionClosedError(Exception):
+    pass
+
+
+# =========================
+# Negotiation
+# =========================
+
+def _block_sizes(
+    size_bytes: int,
+    block_hashes: List[str],
+    block_size: int | None,
+    block_sizes: List[int],
+) -> List[int]:
+    if size_bytes <= 0:
+        raise InvalidNegotiationError("File size must be positive")
+    if not block_hashes:
+        return []
+
+    if block_sizes:
+        if len(block_sizes) != len(block_hashes):
+            raise InvalidNegotiationError("block_sizes and block_hashes must have the same length")
+        if any(size <= 0 for size in block_sizes) or sum(block_sizes) != size_bytes:
+            raise InvalidNegotiationError("block_sizes must be positive and add up to size_bytes")
+        # A missing block is read whole into memory before it is hashed
+        if max(block_sizes) > settings.DEDUP_BLOCK_MAX_BYTES:
+            raise InvalidNegotiationError(
+                f"Blocks may not be larger than {settings.DEDUP_BLOCK_MAX_BYTES} bytes"
+            )
+        return list(block_sizes)
+
+    if not block_size or block_size <= 0:
+        raise InvalidNegotiationError("block_size or block_sizes is required with block_hashes")
+    if min(block_size, size_bytes) > settings.DEDUP_BLOCK_MAX_BYTES:
+        raise InvalidNegotiationError(
+            f"block_size may not be larger than {settings.DEDUP_BLOCK_MAX_BYTES} bytes"
+        )
+
+    expected = -(-size_bytes // block_size)
+    if len(block_hashes) != expected:
+        raise InvalidNegotiationError(
+            f"Expected {expected} block hashes for {size_bytes} bytes, got {len(block_hashes)}"
+        )
+    return [min(block_size, size_bytes - i * block_size) for i in range(expected)]
+
+
+def _ensure_pool_has_room(db: Session, trip_id: str, size_bytes: int):
+    free = db.execute(
+        select(func.coalesce(func.sum(TripMember.allocated_bytes - TripMember.used_bytes), 0))
+        .where(TripMember.trip_id == trip_id)
+    ).scalar_one()
+    if free < size_bytes:
+        raise InsufficientStorageError("Insufficient pooled storage")
+
+
+def negotiate_upload(
+    *,
+    db: Session,
+    trip_id: str,
+    user_id: str,
+    path: str,
+    size_bytes: int,
+    checksum: str,
+    block_size: int | None = None,
+    block_hashes: List[str] | None = None,
+    block_sizes: List[int] | None = None,
+) -> Tuple[VirtualFile, UploadSession | None]:
+    """
+    Decides what the client still has to send before it sends anything.
+
+    Content the trip already holds - the whole file, or every one of its
+    blocks - is linked immediately and no session is returned. Otherwise
+    an OPEN session lists the blocks still to upload.
+    """
+
+    block_hashes = list(block_hashes or [])
+    sizes = _block_sizes(size_bytes, block_hashes, block_size, list(block_sizes or []))
+
+    expire_upload_sessions(db)
+    if sweep_due():
+        expire_quota_reservations(db)
+
+    stored = find_ready_blocks(db, trip_id, block_hashes)
+    missing = [i for i, block_hash in enumerate(block_hashes) if block_hash not in stored]
+    _ensure_pool_has_room(
+        db,
+        trip_id,
+        sum(sizes[i] for i in missing) if block_hashes else size_bytes,
+    )
+
+    virtual_file = create_virtual_file_for_blocks(
+        db=db,
+        trip_id=trip_id,
+        uploader_user_id=user_id,
+        path=path,
+        file_size=size_bytes,
+        checksum=checksum,
+    )
+    if virtual_file.content.status == "READY":
+        return virtual_file, None
+
+    if block_hashes and not missing:
+        # Every block is already stored: build the file from references
+        try:
+            store_file_blocks(
+                db=db,
+                content=virtual_file.content,
+                blocks=((block_hash, None) for block_hash in block_hashes),
+            )
+        except Exception:
+            delete_virtual_file(db=db, virtual_file_id=virtual_file.id)
+            raise
+        return virtual_file, None
+
+    session = UploadSession(
+        trip_id=trip_id,
+        user_id=user_id,
+        virtual_file_id=virtual_file.id,
+        size_bytes=size_bytes,
+        checksum=checksum,
+        block_hashes=block_hashes,
+        block_sizes=sizes,
+        missing_blocks=missing,
+        expires_at=datetime.utcnow() + timedelta(seconds=settings.UPLOAD_SESSION_TTL_SECONDS),
+    )
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+
+    logger.info("Upload session %s opened for file %s: %d missing blocks", session.id, virtual_file.id, len(missing))
+
+    return virtual_file, session
+
+
+def session_body_size(session: UploadSession) -> int:
+    """
+    Bytes the client must send: the missing blocks back to back, or the
+    whole file when it did not negotiate blocks.
+    """
+
+    if not session.block_hashes:
+        return session.size_bytes
+    return sum(session.block_sizes[i] for i in session.missing_blocks)
+
+
+# =========================
+# Session Body
+# =========================
+
+def _read_exact(stream, size: int) -> bytes:
+    parts = []
+    while size > 0:
+        data = stream.read(size)
+        if not data:
+            raise Exception("Stream ended before the declared size")
+        parts.append(data)
+        size -= len(data)
+    return b"".join(parts)
+
+
+def _received_whole_file(session: UploadSession) -> bool:
+    return len(session.missing_blocks) == len(session.block_hashes)
+
+
+def _negotiated_blocks(session: UploadSession, stream) -> Iterator[Tuple[str, bytes | None]]:
+    missing = set(session.missing_blocks)
+    for index, block_hash in enumerate(session.block_hashes):
+        if index not in missing:
+            yield block_hash, None
+            continue
+
+        data = _read_exact(stream, session.block_sizes[index])
+        if hashlib.sha256(data).hexdigest() != block_hash:
+            raise Exception(f"Block {index} does not match its negotiated hash")
+        yield block_hash, data
+
+    # Runs before the blocks are linked into the file
+    if stream.read(1):
+        raise Exception("Request body is larger than the negotiated blocks")
+    if _received_whole_file(session) and stream.checksum != session.checksum:
+        raise Exception("Checksum mismatch")
+
+
+def _server_split_blocks(session: UploadSession, stream) -> Iterator[Tuple[str, bytes]]:
+    size = 0
+    for data in iter_content_defined_blocks(
+        stream.read,
+        min_size=settings.DEDUP_BLOCK_MIN_BYTES,
+        avg_size=settings.DEDUP_BLOCK_AVG_BYTES,
+        max_size=settings.DEDUP_BLOCK_MAX_BYTES,
+    ):
+        size += len(data)
+        if size > session.size_bytes:
+            raise Exception("Request body is larger than the declared file size")
+        yield hashlib.sha256(data).hexdigest(), data
+
+    if size != session.size_bytes:
+        raise Exception("Stream ended before the declared size")
+    if stream.checksum != session.checksum:
+        raise Exception("Checksum mismatch")
+
+
+def store_session_body(*, db: Session, session: UploadSession, stream):
+    """
+    Stores a session's file as deduplicated blocks while its body is
+    read (stream is a StreamingBodyReader). Without negotiated blocks
+    the body is the whole file, split here with content-defined chunking.
+    """
+
+    virtual_file = db.get(VirtualFile, session.virtual_file_id)
+    if not virtual_file:
+        raise FileNotFoundError("Virtual file not found")
+
+    if session.block_hashes:
+        blocks = _negotiated_blocks(session, stream)
+    else:
+        blocks = _server_split_blocks(session, stream)
+
+    store_file_blocks(db=db, content=virtual_file.content, blocks=blocks)
+
+    # Whole-file dedup only trusts a checksum over bytes we received
+    if _received_whole_file(session):
+        virtual_file.content.checksum = session.checksum
+        db.commit()
+
+
+# =========================
+# Session Lifecycle
+# =========================
+
+def get_open_upload_session(db: Session, session_id: str) -> UploadSession:
+    session = db.get(UploadSession, session_id)
+    if not session:
+        raise UploadSessionNotFoundError("Upload session not found")
+
+    if session.status == "OPEN" and session.expires_at <= datetime.utcnow():
+        expire_upload_sessions(db)
+        db.refresh(session)
+
+    if session.status != "OPEN":
+        raise UploadSessionClosedError(f"Upload session is {session.status.lower()}")
+
+    return session
+
+
+def complete_upload_session(db: Session, session: UploadSession):
+    session.status = "COMPLETE"
+    session.missing_blocks = []
+    db.commit()
+
+
+def expire_upload_sessions(db: Session) -> int:
+    """
+    Closes OPEN sessions past their expiry and deletes their
+    never-finished files.
+    """
+
+    expired = (
+        db.execute(
+            select(UploadSession)
+            .where(
+                UploadSession.status == "OPEN",
+                UploadSession.expires_at <= datetime.utcnow(),
+            )
+        )
+        .scalars()
+        .all()
+    )
+
+    for session in expired:
+        virtual_file_id = session.virtual_file_id
+        session.status = "EXPIRED"
+        session.virtual_file_id = None
+        db.commit()
+
+        if virtual_file_id:
+            try:
+                delete_virtual_file(db=db, virtual_file_id=virtual_file_id)
+            except FileNotFoundError:
+                pass
+
+    return len(expired)
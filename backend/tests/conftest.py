@@ -0,0 +1,73 @@
+import os
+import tempfile
+import uuid
+
+# Settings are read when app.core.config is first imported
+_DB_DIR = tempfile.mkdtemp(prefix="tripvault-tests-")
+os.environ.setdefault("GOOGLE_CLIENT_ID", "test-client")
+os.environ.setdefault("GOOGLE_CLIENT_SECRET", "test-secret")
+os.environ.setdefault("GOOGLE_REDIRECT_URI", "http://localhost/callback")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'tripvault.db')}"
+os.environ["DATABASE_ASYNC_URL"] = ""
+os.environ["TRANSFER_JOBS_ENABLED"] = "false"
+os.environ["TRANSFER_STAGING_DIR"] = os.path.join(_DB_DIR, "transfer_staging")
+os.environ["CHUNK_CACHE_DIR"] = os.path.join(_DB_DIR, "chunk_cache")
+
+import pytest
+
+from app import models
+from app.core.database import SessionLocal, engine
+from app.models.base import Base
+
+
+Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.rollback()
+        session.close()
+
+        with engine.begin() as connection:
+            for table in reversed(Base.metadata.sorted_tables):
+                connection.execute(table.delete())
+
+
+@pytest.fixture
+def make_trip(db):
+    """
+    Creates a trip whose members get the given allocations, in bytes.
+    Returns (trip, [members]).
+    """
+
+    def _make_trip(*allocations: int):
+        users = [
+            models.User(email=f"{uuid.uuid4()}@example.com", name=f"user-{i}")
+            for i in range(len(allocations))
+        ]
+        db.add_all(users)
+        db.flush()
+
+        trip = models.Trip(name="Trip", created_by=users[0].id)
+        db.add(trip)
+        db.flush()
+
+        members = [
+            models.TripMember(
+                trip_id=trip.id,
+                user_id=user.id,
+                role="ADMIN" if i == 0 else "MEMBER",
+                allocated_bytes=allocated,
+                used_bytes=0,
+            )
+            for i, (user, allocated) in enumerate(zip(users, allocations))
+        ]
+        db.add_all(members)
+        db.commit()
+        return trip, members
+
+    return _make_trip
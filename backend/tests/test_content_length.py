@@ -0,0 +1,35 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from app.api.v1.files import _content_length
+
+
+def _request(*headers):
+    return Request({
+        "type": "http",
+        "method": "POST",
+        "path": "/",
+        "headers": [(name.encode(), value.encode()) for name, value in headers],
+    })
+
+
+def test_content_length_is_parsed():
+    assert _content_length(_request(("content-length", "1024"))) == 1024
+
+
+def test_missing_content_length_is_411():
+    with pytest.raises(HTTPException) as raised:
+        _content_length(_request(("transfer-encoding", "chunked")))
+    assert raised.value.status_code == 411
+
+
+def test_missing_content_length_is_allowed_when_optional():
+    assert _content_length(_request(), required=False) is None
+
+
+@pytest.mark.parametrize("value", ["abc", "-5", "1.5", ""])
+def test_malformed_content_length_is_400(value):
+    with pytest.raises(HTTPException) as raised:
+        _content_length(_request(("content-length", value)))
+    assert raised.value.status_code == 400
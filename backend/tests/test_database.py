@@ -0,0 +1,27 @@
+import pytest
+
+from app.core import database
+from app.core.config import settings
+
+
+def test_missing_async_driver_only_fails_the_async_setup(monkeypatch):
+    monkeypatch.setattr(settings, "DATABASE_ASYNC_URL", "postgresql+nosuchdriver://user:pw@localhost/db")
+    monkeypatch.setattr(database, "async_engine", None)
+    monkeypatch.setattr(database, "AsyncSessionLocal", None)
+
+    with pytest.raises(database.AsyncDatabaseUnavailableError):
+        database.get_async_sessionmaker()
+
+    # The sync engine is unaffected
+    with database.SessionLocal() as db:
+        assert db.connection().exec_driver_sql("SELECT 1").scalar() == 1
+
+
+def test_async_engine_is_created_on_first_use(monkeypatch):
+    monkeypatch.setattr(database, "async_engine", None)
+    monkeypatch.setattr(database, "AsyncSessionLocal", None)
+
+    make_session = database.get_async_sessionmaker()
+
+    assert database.async_engine is not None
+    assert database.get_async_sessionmaker() is make_session
@@ -0,0 +1,127 @@
+from sqlalchemy import select
+
+from app.models.drive_tombstone import DriveTombstone
+from app.models.file_chunk import FileChunk
+from app.models.file_content import FileContent
+from app.models.trip_member import TripMember
+from app.models.virtual_file import VirtualFile
+from app.services.storage_service import create_virtual_file_with_chunks, delete_virtual_file
+
+
+CHECKSUM = "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+
+
+def _stored_file(db, trip, user_id, size):
+    """A planned file whose chunks then landed on Drive, as after an upload."""
+
+    virtual_file = create_virtual_file_with_chunks(
+        db=db,
+        trip_id=trip.id,
+        uploader_user_id=user_id,
+        path="/photos/a.jpg",
+        file_size=size,
+    )
+    chunks = db.execute(
+        select(FileChunk).where(FileChunk.content_id == virtual_file.content_id)
+    ).scalars().all()
+    for i, chunk in enumerate(chunks):
+        chunk.provider_file_id = f"drive-{i}"
+
+    content = db.get(FileContent, virtual_file.content_id)
+    content.checksum = CHECKSUM
+    content.status = "READY"
+    db.commit()
+    return virtual_file
+
+
+def _total_used(db, trip):
+    db.expire_all()
+    return sum(
+        db.execute(select(TripMember.used_bytes).where(TripMember.trip_id == trip.id)).scalars()
+    )
+
+
+def test_same_checksum_and_size_takes_a_reference(db, make_trip):
+    trip, members = make_trip(10_000, 10_000)
+    original = _stored_file(db, trip, members[0].user_id, 1000)
+
+    duplicate = create_virtual_file_with_chunks(
+        db=db,
+        trip_id=trip.id,
+        uploader_user_id=members[1].user_id,
+        path="/photos/copy.jpg",
+        file_size=1000,
+        checksum=CHECKSUM,
+    )
+
+    assert duplicate.content_id == original.content_id
+    assert db.get(FileContent, original.content_id).ref_count == 2
+    assert _total_used(db, trip) == 1000
+
+
+def test_different_size_is_not_deduplicated(db, make_trip):
+    trip, members = make_trip(10_000, 10_000)
+    original = _stored_file(db, trip, members[0].user_id, 1000)
+
+    other = create_virtual_file_with_chunks(
+        db=db,
+        trip_id=trip.id,
+        uploader_user_id=members[0].user_id,
+        path="/photos/b.jpg",
+        file_size=999,
+        checksum=CHECKSUM,
+    )
+
+    assert other.content_id != original.content_id
+    assert _total_used(db, trip) == 1999
+
+
+def test_pending_content_is_not_deduplicated(db, make_trip):
+    trip, members = make_trip(10_000)
+    original = _stored_file(db, trip, members[0].user_id, 1000)
+    db.get(FileContent, original.content_id).status = "PENDING"
+    db.commit()
+
+    other = create_virtual_file_with_chunks(
+        db=db,
+        trip_id=trip.id,
+        uploader_user_id=members[0].user_id,
+        path="/photos/b.jpg",
+        file_size=1000,
+        checksum=CHECKSUM,
+    )
+
+    assert other.content_id != original.content_id
+
+
+def test_storage_is_freed_only_with_the_last_reference(db, make_trip):
+    trip, members = make_trip(10_000, 10_000)
+    original = _stored_file(db, trip, members[0].user_id, 1000)
+    duplicate = create_virtual_file_with_chunks(
+        db=db,
+        trip_id=trip.id,
+        uploader_user_id=members[1].user_id,
+        path="/photos/copy.jpg",
+        file_size=1000,
+        checksum=CHECKSUM,
+    )
+    content_id = original.content_id
+    original_id, duplicate_id = original.id, duplicate.id
+
+    delete_virtual_file(db=db, virtual_file_id=original_id)
+
+    db.expire_all()
+    assert db.get(VirtualFile, original_id) is None
+    assert db.get(FileContent, content_id).ref_count == 1
+    assert db.execute(select(DriveTombstone)).first() is None
+    assert _total_used(db, trip) == 1000
+
+    delete_virtual_file(db=db, virtual_file_id=duplicate_id)
+
+    db.expire_all()
+    assert db.get(FileContent, content_id) is None
+    assert db.execute(select(FileChunk).where(FileChunk.content_id == content_id)).first() is None
+    assert _total_used(db, trip) == 0
+
+    tombstoned = db.execute(select(DriveTombstone.provider_file_id)).scalars().all()
+    assert tombstoned and all(file_id.startswith("drive-") for file_id in tombstoned)
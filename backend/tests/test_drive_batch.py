@@ -0,0 +1,90 @@
+import threading
+
+from app.services import google_drive_service
+from app.services.drive_batch import DriveBatcher
+
+
+class _Request:
+    def __init__(self, value):
+        self.value = value
+
+    def execute(self):
+        return {"value": self.value}
+
+
+class _HttpBatch:
+    def __init__(self, sent, callback):
+        self.sent = sent
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.sent.append(len(self.requests))
+        for request_id, request in self.requests:
+            self.callback(request_id, request.execute(), None)
+
+
+class _Drive:
+    def __init__(self, sent):
+        self.sent = sent
+
+    def new_batch_http_request(self, callback):
+        return _HttpBatch(self.sent, callback)
+
+
+def test_calls_for_one_account_share_a_batch_across_rebuilt_clients():
+    sent = []
+    batcher = DriveBatcher(max_requests=4, window_seconds=60)
+    old_client, new_client = _Drive(sent), _Drive(sent)
+
+    futures = [
+        batcher.submit("account-a", drive, lambda d, i=i: _Request(i))
+        for i, drive in enumerate([old_client, new_client, old_client, new_client])
+    ]
+
+    assert [future.result(timeout=5) for future in futures] == [{"value": i} for i in range(4)]
+    assert sent == [4]
+
+
+def test_calls_for_different_accounts_are_batched_apart():
+    sent = []
+    batcher = DriveBatcher(max_requests=2, window_seconds=60)
+    drive = _Drive(sent)
+
+    futures = [
+        batcher.submit(account_id, drive, lambda d, i=i: _Request(i))
+        for i, account_id in enumerate(["account-a", "account-b", "account-a", "account-b"])
+    ]
+
+    assert [future.result(timeout=5)["value"] for future in futures] == [0, 1, 2, 3]
+    assert sent == [2, 2]
+
+
+def test_app_folder_refresh_only_waits_for_the_same_account(monkeypatch):
+    lookup_started = threading.Event()
+    release_lookup = threading.Event()
+
+    def ensure_app_folder(drive, account_id):
+        if account_id == "slow-account":
+            lookup_started.set()
+            release_lookup.wait(5)
+        return f"folder-{account_id}"
+
+    monkeypatch.setattr(google_drive_service, "ensure_app_folder", ensure_app_folder)
+
+    slow = threading.Thread(
+        target=google_drive_service.refresh_app_folder_id,
+        args=("slow-account", None, "stale"),
+    )
+    slow.start()
+    try:
+        assert lookup_started.wait(5)
+        assert google_drive_service.refresh_app_folder_id("other-account", None, "stale") == "folder-other-account"
+    finally:
+        release_lookup.set()
+        slow.join(5)
+
+    assert google_drive_service.cached_app_folder_id("slow-account") == "folder-slow-account"
@@ -0,0 +1,50 @@
+import itertools
+import os
+
+import pytest
+
+from app.services.erasure import ReedSolomon
+
+
+def _stripe(rs: ReedSolomon, cell_size: int):
+    data = [os.urandom(cell_size) for _ in range(rs.data_shards)]
+    return data, data + rs.encode(data)
+
+
+def test_encode_returns_parity_cells_of_the_same_size():
+    rs = ReedSolomon(4, 2)
+    data, shards = _stripe(rs, 64)
+
+    assert len(shards) == rs.total_shards == 6
+    assert all(len(cell) == 64 for cell in shards)
+
+
+@pytest.mark.parametrize("data_shards, parity_shards", [(1, 1), (3, 2), (4, 2), (6, 3)])
+def test_any_k_shards_rebuild_the_data(data_shards, parity_shards):
+    rs = ReedSolomon(data_shards, parity_shards)
+    data, shards = _stripe(rs, 37)
+
+    for indexes in itertools.combinations(range(rs.total_shards), data_shards):
+        assert rs.decode({i: shards[i] for i in indexes}) == data
+
+
+def test_decode_uses_data_cells_as_is_when_all_present():
+    rs = ReedSolomon(3, 2)
+    data, shards = _stripe(rs, 16)
+
+    assert rs.decode(dict(enumerate(shards))) == data
+
+
+def test_decode_needs_k_shards():
+    rs = ReedSolomon(4, 2)
+    data, shards = _stripe(rs, 16)
+
+    with pytest.raises(ValueError):
+        rs.decode({i: shards[i] for i in (0, 4, 5)})
+
+
+def test_invalid_shard_counts_are_rejected():
+    with pytest.raises(ValueError):
+        ReedSolomon(0, 2)
+    with pytest.raises(ValueError):
+        ReedSolomon(200, 57)
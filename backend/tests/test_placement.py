@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+from app.services.placement import TripSpaceIndex, balanced_best_fit, least_used_first
+
+
+def _index(*members):
+    """members: (user_id, allocated_bytes, used_bytes)"""
+
+    return TripSpaceIndex([
+        SimpleNamespace(id=f"member-{user_id}", user_id=user_id, allocated_bytes=allocated, used_bytes=used)
+        for user_id, allocated, used in members
+    ])
+
+
+def test_least_used_first_is_not_swamped_by_one_large_member():
+    index = _index(
+        ("busy-giant", 1_000_000, 600_000),  # 60% used, lots of room
+        ("idle", 1_000, 0),                  # 0% used
+    )
+
+    assert least_used_first(index, 100).user_id == "idle"
+
+
+def test_least_used_first_breaks_usage_ties_on_capacity():
+    index = _index(("small", 1_000, 500), ("large", 10_000, 5_000))
+
+    assert least_used_first(index, 100).user_id == "large"
+
+
+def test_balanced_best_fit_prefers_the_tightest_fit_at_equal_usage():
+    index = _index(("roomy", 10_000, 5_000), ("tight", 240, 120))
+
+    assert balanced_best_fit(index, 100).user_id == "tight"
+
+
+def test_balanced_best_fit_still_weighs_usage_first():
+    index = _index(("tight-but-full", 1_000, 890), ("roomy-and-idle", 10_000, 0))
+
+    assert balanced_best_fit(index, 100).user_id == "roomy-and-idle"
+
+
+def test_strategies_skip_members_without_room():
+    index = _index(("full", 100, 100), ("free", 1_000, 0))
+
+    assert least_used_first(index, 50).user_id == "free"
+    assert balanced_best_fit(index, 50).user_id == "free"
+    assert least_used_first(index, 5_000) is None
@@ -0,0 +1,167 @@
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, update
+
+from app.models.content_block import ContentBlock
+from app.models.drive_tombstone import DriveTombstone
+from app.models.quota_reservation import QuotaReservation
+from app.models.trip_member import TripMember
+from app.models.virtual_file import VirtualFile
+from app.services import storage_service
+from app.services.placement import Placement
+from app.services.quota_service import charge_plan, refund_members
+from app.services.storage_service import create_virtual_file_with_chunks, expire_quota_reservations
+
+
+def _used(db, members):
+    db.expire_all()
+    return [db.get(TripMember, member.id).used_bytes for member in members]
+
+
+def test_charge_plan_charges_every_member(db, make_trip):
+    trip, members = make_trip(100, 100)
+
+    plan = [
+        Placement(member_id=members[0].id, user_id=members[0].user_id, size_bytes=60),
+        Placement(member_id=members[1].id, user_id=members[1].user_id, size_bytes=40),
+    ]
+    assert charge_plan(db, plan)
+    db.commit()
+
+    assert _used(db, members) == [60, 40]
+
+
+def test_charge_plan_undoes_its_charges_when_a_member_is_full(db, make_trip):
+    trip, members = make_trip(100, 100, 10)
+
+    plan = [
+        Placement(member_id=members[0].id, user_id=members[0].user_id, size_bytes=50),
+        Placement(member_id=members[1].id, user_id=members[1].user_id, size_bytes=50),
+        Placement(member_id=members[2].id, user_id=members[2].user_id, size_bytes=50),
+    ]
+    assert not charge_plan(db, plan)
+    db.commit()
+
+    assert _used(db, members) == [0, 0, 0]
+
+
+def test_charge_plan_leaves_earlier_usage_alone(db, make_trip):
+    trip, members = make_trip(100, 100)
+    members[0].used_bytes = 30
+    db.commit()
+
+    plan = [
+        Placement(member_id=members[0].id, user_id=members[0].user_id, size_bytes=20),
+        Placement(member_id=members[1].id, user_id=members[1].user_id, size_bytes=101),
+    ]
+    assert not charge_plan(db, plan)
+    db.commit()
+
+    assert _used(db, members) == [30, 0]
+
+
+def test_refund_members_gives_back_bytes_per_user(db, make_trip):
+    trip, members = make_trip(100, 100, 100)
+    for member, used in zip(members, (50, 40, 30)):
+        member.used_bytes = used
+    db.commit()
+
+    refund_members(db, trip.id, {members[0].user_id: 20, members[1].user_id: 40})
+    db.commit()
+
+    assert _used(db, members) == [30, 0, 30]
+
+
+def test_refund_members_never_goes_below_zero(db, make_trip):
+    trip, members = make_trip(100)
+    members[0].used_bytes = 10
+    db.commit()
+
+    refund_members(db, trip.id, {members[0].user_id: 25})
+    db.commit()
+
+    assert _used(db, members) == [0]
+
+
+def test_expired_block_reservation_drops_and_tombstones_the_block(db, make_trip):
+    trip, members = make_trip(100)
+    members[0].used_bytes = 40
+    block = ContentBlock(
+        trip_id=trip.id,
+        hash="b" * 64,
+        size_bytes=40,
+        owner_user_id=members[0].user_id,
+        provider="google_drive",
+        provider_file_id="drive-block",
+        ref_count=0,
+    )
+    db.add(block)
+    db.flush()
+    db.add(
+        QuotaReservation(
+            trip_id=trip.id,
+            user_id=members[0].user_id,
+            content_id=str(uuid.uuid4()),
+            block_id=block.id,
+            size_bytes=40,
+            expires_at=datetime.utcnow() - timedelta(seconds=1),
+        )
+    )
+    db.commit()
+    block_id = block.id
+
+    assert expire_quota_reservations(db) == 1
+
+    db.expire_all()
+    assert db.get(ContentBlock, block_id) is None
+    assert db.execute(select(DriveTombstone.provider_file_id)).scalars().all() == ["drive-block"]
+    assert _used(db, members) == [0]
+
+
+def _planned_file(db, trip, members, reserve):
+    virtual_file = create_virtual_file_with_chunks(
+        db=db,
+        trip_id=trip.id,
+        uploader_user_id=members[0].user_id,
+        path="/planned.bin",
+        file_size=50,
+        reserve=reserve,
+    )
+    db.execute(update(QuotaReservation).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+    db.commit()
+    return virtual_file.id
+
+
+def test_unstored_reserved_file_is_deleted_when_its_reservation_expires(db, make_trip):
+    trip, members = make_trip(100)
+    virtual_file_id = _planned_file(db, trip, members, reserve=True)
+
+    assert expire_quota_reservations(db) == 1
+
+    db.expire_all()
+    assert db.get(VirtualFile, virtual_file_id) is None
+    assert _used(db, members) == [0]
+
+
+def test_file_planned_without_reservation_is_kept(db, make_trip):
+    trip, members = make_trip(100)
+    virtual_file_id = _planned_file(db, trip, members, reserve=False)
+
+    assert expire_quota_reservations(db) == 0
+
+    db.expire_all()
+    assert db.get(VirtualFile, virtual_file_id) is not None
+    assert _used(db, members) == [50]
+
+
+def test_sweep_tolerates_files_another_sweep_deleted(db, make_trip, monkeypatch):
+    trip, members = make_trip(100)
+    _planned_file(db, trip, members, reserve=True)
+
+    def already_deleted(**kwargs):
+        raise storage_service.FileNotFoundError("Virtual file not found")
+
+    monkeypatch.setattr(storage_service, "delete_virtual_file", already_deleted)
+
+    assert expire_quota_reservations(db) == 1
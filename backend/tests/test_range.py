@@ -0,0 +1,73 @@
+import pytest
+
+from app.api.v1.files import _etag_for, _if_range_matches, _parse_range
+from app.models.file_content import FileContent
+from app.models.virtual_file import VirtualFile
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=900-5000", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes = 10-20", (10, 20)),
+    ],
+)
+def test_satisfiable_ranges(header, expected):
+    assert _parse_range(header, 1000) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        "",
+        "items=0-99",
+        "bytes=abc",
+        "bytes=-",
+        "bytes=10-5",
+        "bytes=0-10,20-30",
+        "bytes=1-2-3",
+    ],
+)
+def test_invalid_ranges_are_ignored(header):
+    assert _parse_range(header, 1000) is None
+
+
+@pytest.mark.parametrize(
+    "header, size",
+    [
+        ("bytes=1000-", 1000),
+        ("bytes=1000-1200", 1000),
+        ("bytes=-0", 1000),
+        ("bytes=-10", 0),
+    ],
+)
+def test_unsatisfiable_ranges_raise(header, size):
+    with pytest.raises(ValueError):
+        _parse_range(header, size)
+
+
+def test_if_range_matches_the_strong_etag_only():
+    etag = '"abc123"'
+
+    assert _if_range_matches('"abc123"', etag)
+    assert not _if_range_matches('W/"abc123"', etag)
+    assert not _if_range_matches('"other"', etag)
+    assert not _if_range_matches("Wed, 21 Oct 2015 07:28:00 GMT", etag)
+
+
+def test_if_range_never_matches_a_weak_etag():
+    assert not _if_range_matches('W/"abc123"', 'W/"abc123"')
+
+
+def test_etag_is_strong_only_over_the_server_checksum():
+    content = FileContent(trip_id="trip", size_bytes=10, checksum=None)
+    virtual_file = VirtualFile(id="file", trip_id="trip", path="/a", size_bytes=10, checksum="declared", content=content)
+
+    assert _etag_for(virtual_file) == 'W/"file-10"'
+
+    content.checksum = "stored"
+    assert _etag_for(virtual_file) == '"stored"'
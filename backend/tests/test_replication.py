@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+from sqlalchemy import select
+
+from app import models
+from app.models.chunk_replica import ChunkReplica
+from app.models.drive_tombstone import DriveTombstone
+from app.services import replication
+from app.services.replication import ChunkReplicator, replicate_chunk
+
+
+@pytest.fixture
+def stored_chunk(db, make_trip, monkeypatch):
+    trip, members = make_trip(1_000, 1_000)
+    db.add_all([
+        models.UserCloudAccount(user_id=member.user_id, provider="google_drive", access_token="t", refresh_token="r", app_folder_id="folder")
+        for member in members
+    ])
+    content = models.FileContent(trip_id=trip.id, size_bytes=10, checksum="sum")
+    db.add(content)
+    db.flush()
+    chunk = models.FileChunk(content_id=content.id, owner_user_id=members[0].user_id, offset_bytes=0, size_bytes=10, provider="google_drive", provider_file_id="primary")
+    db.add(chunk)
+    db.commit()
+
+    monkeypatch.setattr(replication, "get_drive_client", lambda account: None)
+    monkeypatch.setattr(replication, "download_chunk_from_drive", lambda drive, file_id: iter([b"x" * 10]))
+    return chunk
+
+
+def test_a_copy_that_cannot_be_recorded_is_tombstoned(db, stored_chunk, monkeypatch):
+    monkeypatch.setattr(replication, "stream_chunk_upload", lambda task, read, part_size: "copy-on-drive")
+
+    def charge_member(db, member_id, size):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(replication, "charge_member", charge_member)
+
+    with pytest.raises(RuntimeError):
+        replicate_chunk(db, stored_chunk.id)
+
+    assert db.execute(select(DriveTombstone.provider_file_id)).scalars().all() == ["copy-on-drive"]
+    assert db.execute(select(ChunkReplica)).first() is None
+
+
+def test_an_unfinished_upload_leaves_nothing_to_tombstone(db, stored_chunk, monkeypatch):
+    def stream_chunk_upload(task, read, part_size):
+        raise RuntimeError("drive down")
+
+    monkeypatch.setattr(replication, "stream_chunk_upload", stream_chunk_upload)
+
+    with pytest.raises(RuntimeError):
+        replicate_chunk(db, stored_chunk.id)
+
+    assert db.execute(select(DriveTombstone)).first() is None
+
+
+def test_a_failed_chunk_is_scheduled_again_on_its_next_read(monkeypatch):
+    attempts = []
+    finished = threading.Semaphore(0)
+
+    def replicate(db, chunk_id):
+        attempts.append(chunk_id)
+        finished.release()
+        raise RuntimeError("drive down")
+
+    monkeypatch.setattr(replication, "replicate_chunk", replicate)
+    replicator = ChunkReplicator(max_workers=1, hot_reads=3)
+
+    replicator.record_reads(["hot"] * 3)
+    assert finished.acquire(timeout=5)
+    deadline = time.monotonic() + 5
+    while replicator._scheduled and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    replicator.record_reads(["hot"])
+    assert finished.acquire(timeout=5)
+    assert attempts == ["hot", "hot"]
@@ -0,0 +1,116 @@
+import os
+from datetime import datetime, timedelta
+
+from app.models.transfer_job import TransferJob
+from app.services.storage_service import create_virtual_file_with_chunks
+from app.services.transfer_queue import TransferWorkerPool, enqueue_transfer, open_staging_file, remove_staged_file
+
+
+def _pool(lease_seconds: int = 60) -> TransferWorkerPool:
+    return TransferWorkerPool(
+        workers=2,
+        poll_interval_seconds=1,
+        lease_seconds=lease_seconds,
+        heartbeat_seconds=1,
+        retry_base_seconds=1,
+        retry_max_seconds=10,
+    )
+
+
+def _job(db, trip, members, **values) -> str:
+    job = TransferJob(
+        kind="store_file",
+        trip_id=trip.id,
+        user_id=members[0].user_id,
+        max_attempts=3,
+        **values,
+    )
+    db.add(job)
+    db.commit()
+    return job.id
+
+
+def test_claim_takes_the_lease_of_a_queued_job(db, make_trip):
+    trip, members = make_trip(100)
+    job_id = _job(db, trip, members)
+    pool = _pool(lease_seconds=60)
+
+    assert pool._claim() == job_id
+
+    db.expire_all()
+    job = db.get(TransferJob, job_id)
+    assert job.status == "RUNNING"
+    assert job.attempts == 1
+    assert job.lease_owner == pool.worker_id
+    assert job.lease_expires_at > datetime.utcnow() + timedelta(seconds=50)
+
+
+def test_claim_prefers_higher_priority(db, make_trip):
+    trip, members = make_trip(100)
+    _job(db, trip, members, priority=0)
+    urgent = _job(db, trip, members, priority=10)
+
+    assert _pool()._claim() == urgent
+
+
+def test_claim_skips_jobs_not_yet_due(db, make_trip):
+    trip, members = make_trip(100)
+    _job(db, trip, members, next_attempt_at=datetime.utcnow() + timedelta(minutes=5))
+
+    assert _pool()._claim() is None
+
+
+def test_a_held_lease_is_not_claimed_again(db, make_trip):
+    trip, members = make_trip(100)
+    job_id = _job(db, trip, members)
+
+    assert _pool()._claim() == job_id
+    assert _pool()._claim() is None
+
+
+def test_an_expired_lease_is_reclaimed(db, make_trip):
+    trip, members = make_trip(100)
+    job_id = _job(
+        db,
+        trip,
+        members,
+        status="RUNNING",
+        attempts=1,
+        lease_owner="dead-worker",
+        lease_expires_at=datetime.utcnow() - timedelta(seconds=1),
+    )
+    pool = _pool()
+
+    assert pool._claim() == job_id
+
+    db.expire_all()
+    job = db.get(TransferJob, job_id)
+    assert job.lease_owner == pool.worker_id
+    assert job.attempts == 2
+    assert job.lease_expires_at > datetime.utcnow()
+
+
+def test_enqueue_takes_the_staged_file_over(db, make_trip):
+    trip, members = make_trip(1000)
+    virtual_file = create_virtual_file_with_chunks(
+        db=db,
+        trip_id=trip.id,
+        uploader_user_id=members[0].user_id,
+        path="/staged.bin",
+        file_size=5,
+    )
+
+    staged_file = open_staging_file()
+    staged_file.write(b"hello")
+    incoming_path = staged_file.name
+
+    job = enqueue_transfer(db, virtual_file=virtual_file, staged_file=staged_file, checksum="abc")
+    staged_file.close()
+
+    assert not os.path.exists(incoming_path)
+    assert job.kind == "store_file"
+    assert job.checksum == "abc"
+    with open(job.staged_path, "rb") as staged:
+        assert staged.read() == b"hello"
+
+    remove_staged_file(job.staged_path)
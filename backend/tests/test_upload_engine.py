@@ -0,0 +1,69 @@
+import io
+import threading
+
+from app.services import upload_engine
+from app.services.upload_engine import ChunkUploadTask, FileRangeReader, collect_chunk_uploads
+
+
+def _tasks(count: int):
+    return [
+        ChunkUploadTask(
+            chunk_id=f"chunk-{i}",
+            owner_user_id=f"owner-{i}",
+            account_id=f"account-{i}",
+            drive=None,
+            folder_id="folder",
+            chunk_name=f"chunk_{i}.bin",
+            offset_bytes=i * 4,
+            size_bytes=4,
+        )
+        for i in range(count)
+    ]
+
+
+def test_fail_fast_keeps_uploads_that_were_in_flight(monkeypatch):
+    failed = threading.Event()
+
+    def fake_upload(drive, *, folder_id, chunk_name, stream, part_size):
+        if chunk_name == "chunk_0.bin":
+            failed.set()
+            raise RuntimeError("quota exceeded")
+        # Still running when the first failure is reported
+        failed.wait(5)
+        return f"drive-{chunk_name}"
+
+    monkeypatch.setattr(upload_engine, "upload_chunk_to_drive", fake_upload)
+    reader = FileRangeReader(io.BytesIO(b"x" * 12))
+
+    results, errors = collect_chunk_uploads(
+        _tasks(3),
+        lambda task: reader.open_range(task.offset_bytes, task.size_bytes),
+        max_workers=3,
+        max_workers_per_owner=1,
+        part_size=4,
+    )
+
+    assert list(errors) == ["chunk-0"]
+    assert results == {"chunk-1": "drive-chunk_1.bin", "chunk-2": "drive-chunk_2.bin"}
+
+
+def test_fail_fast_cancels_chunks_not_started(monkeypatch):
+    started = []
+
+    def fake_upload(drive, *, folder_id, chunk_name, stream, part_size):
+        started.append(chunk_name)
+        raise RuntimeError("drive down")
+
+    monkeypatch.setattr(upload_engine, "upload_chunk_to_drive", fake_upload)
+    reader = FileRangeReader(io.BytesIO(b"x" * 40))
+
+    results, errors = collect_chunk_uploads(
+        _tasks(10),
+        lambda task: reader.open_range(task.offset_bytes, task.size_bytes),
+        max_workers=1,
+        max_workers_per_owner=1,
+        part_size=4,
+    )
+
+    assert results == {}
+    assert len(errors) == len(started) < 10